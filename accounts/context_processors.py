@@ -1,6 +1,14 @@
-from accounts.permissions import user_has_gym_permission
+from django.utils.functional import SimpleLazyObject
+from accounts.permissions import get_gym_permissions
+from accounts.services import current_gym, switchable_gyms
+
+DEFAULT_BRAND_COLOR = "#0f172a"
 
 def gym_permissions(request):
+    """
+    Se ejecuta en cada render (también en parciales HTMX), así que todos los
+    valores son perezosos: solo tocan caché/BD si la plantilla los lee.
+    """
     if not request.user.is_authenticated:
         return {}
 
@@ -8,23 +16,20 @@ def gym_permissions(request):
     if not gym_id:
         return {}
 
-    
-    # Obtener el gym para sacar su color
-    from organizations.models import Gym
-    from accounts.services import user_gym_ids
-    
-    gym = Gym.objects.filter(id=gym_id).first()
-    brand_color = gym.brand_color if gym else "#0f172a"
-    
-    # Gyms available for switching
-    my_gym_ids = user_gym_ids(request.user)
-    my_gyms = Gym.objects.filter(id__in=my_gym_ids)
+    perms = SimpleLazyObject(lambda: get_gym_permissions(request.user, gym_id, request=request))
+    gym = SimpleLazyObject(lambda: current_gym(request))
+
+    def brand_color():
+        # Obtener el gym para sacar su color
+        resolved = current_gym(request)
+        return resolved.brand_color if resolved else DEFAULT_BRAND_COLOR
 
     return {
-        "can_view_clients": user_has_gym_permission(request.user, gym_id, "clients.view"),
-        "can_view_staff": user_has_gym_permission(request.user, gym_id, "staff.view"),
-        "can_view_marketing": user_has_gym_permission(request.user, gym_id, "marketing.view"),
-        "brand_color": brand_color,
+        "can_view_clients": SimpleLazyObject(lambda: perms.has("clients.view")),
+        "can_view_staff": SimpleLazyObject(lambda: perms.has("staff.view")),
+        "can_view_marketing": SimpleLazyObject(lambda: perms.has("marketing.view")),
+        "brand_color": SimpleLazyObject(brand_color),
         "current_gym": gym,
-        "my_gyms": my_gyms,
+        # Gyms available for switching
+        "my_gyms": SimpleLazyObject(lambda: switchable_gyms(request)),
     }
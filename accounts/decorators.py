@@ -1,18 +1,33 @@
 from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
 from django.shortcuts import redirect
 from accounts.permissions import user_has_gym_permission
 
 def require_gym_permission(permission_code):
     def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            # Vistas async (sales/api_async.py): la sesión y los permisos se leen en un hilo
+            @wraps(view_func)
+            async def _async_wrapped(request, *args, **kwargs):
+                request.user = await request.auser()
+                allowed = await sync_to_async(_check)(request, permission_code)
+                if not allowed:
+                    return redirect("home")
+                return await view_func(request, *args, **kwargs)
+            return _async_wrapped
+
         @wraps(view_func)
         def _wrapped(request, *args, **kwargs):
-            gym_id = request.session.get("current_gym_id")
-            if not gym_id:
-                return redirect("home")
-
-            if not user_has_gym_permission(request.user, gym_id, permission_code):
+            if not _check(request, permission_code):
                 return redirect("home")
 
             return view_func(request, *args, **kwargs)
         return _wrapped
     return decorator
+
+
+def _check(request, permission_code):
+    gym_id = request.session.get("current_gym_id")
+    if not gym_id:
+        return False
+    return user_has_gym_permission(request.user, gym_id, permission_code, request=request)
@@ -1,6 +1,8 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.shortcuts import redirect
 from django.urls import reverse
-from accounts.services import user_gym_ids, default_gym_id
+from django.utils.functional import SimpleLazyObject
+from accounts.services import allowed_gym_ids, current_gym
 
 EXEMPT_PATH_PREFIXES = (
     "/admin/",
@@ -11,35 +13,46 @@ EXEMPT_PATH_PREFIXES = (
 class CurrentGymMiddleware:
     """
     Asegura que, si el usuario tiene gyms, exista un current_gym_id válido en sesión.
+    request.gym es perezoso: solo toca la BD (o la LRU) si la vista lo usa.
     """
 
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.select_gym(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        # Bajo ASGI: la sesión y los gyms permitidos se consultan en un hilo
+        await sync_to_async(self.select_gym)(request)
+        return await self.get_response(request)
+
+    def select_gym(self, request):
         path = request.path or ""
 
         if path.startswith(EXEMPT_PATH_PREFIXES):
-            return self.get_response(request)
+            return
 
         user = request.user
         if not user.is_authenticated:
-            return self.get_response(request)
+            return
 
-        gym_ids = user_gym_ids(user)
+        gym_ids = allowed_gym_ids(request)
         if not gym_ids:
-            return self.get_response(request)
+            return
 
         current_gym_id = request.session.get("current_gym_id")
         if current_gym_id not in gym_ids:
-            current_gym_id = default_gym_id(user)
+            current_gym_id = gym_ids[0]
             request.session["current_gym_id"] = current_gym_id
-            
-        # Attach the actual Gym object to the request
-        from organizations.models import Gym
-        try:
-            request.gym = Gym.objects.get(pk=current_gym_id)
-        except Gym.DoesNotExist:
-            request.gym = None
 
-        return self.get_response(request)
+        # Attach the Gym lazily to the request
+        request.gym = SimpleLazyObject(lambda: current_gym(request))
@@ -1,41 +1,130 @@
+import time
+
 from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+
+# Los permisos resueltos se guardan en la caché de Django bajo una clave que
+# incluye la "versión" del usuario. Las señales (accounts/signals.py) cambian
+# esa versión cuando cambian sus membresías, así que no hace falta borrar nada:
+# las claves antiguas simplemente dejan de leerse y caducan solas.
+# Solo se usa con una caché compartida (settings.PERMISSIONS_SHARED_CACHE): con
+# locmem cada worker tendría su copia y la versión cambiada en uno no llegaría al resto.
+PERMISSIONS_CACHE_TIMEOUT = 60 * 15
+
+_VERSION_KEY = "accounts:perms:version:{user_id}"
+_PERMS_KEY = "accounts:perms:{user_id}:{gym_id}:{version}"
 
-def user_has_gym_permission(user, gym_id: int, perm_code: str) -> bool:
+
+class GymPermissionSet:
     """
-    Comprueba si el usuario tiene permiso sobre un gym.
-    - ADMIN: siempre True
-    - STAFF: permiso explícito
+    Permisos efectivos de un usuario sobre un gym.
+    - is_admin: superuser, owner de la franquicia o ADMIN del gym (todo permitido)
+    - codes: permisos explícitos del STAFF
     """
-    if user.is_superuser:
-        return True
+    __slots__ = ("gym_id", "codes", "is_admin")
+
+    def __init__(self, gym_id, codes=frozenset(), is_admin=False):
+        self.gym_id = gym_id
+        self.codes = frozenset(codes)
+        self.is_admin = is_admin
+
+    def has(self, perm_code: str) -> bool:
+        return self.is_admin or perm_code in self.codes
 
+    __contains__ = has
+
+    def __repr__(self):
+        return f"<GymPermissionSet gym={self.gym_id} admin={self.is_admin} codes={sorted(self.codes)}>"
+
+
+def permissions_version(user_id) -> int:
+    """
+    Versión actual de los permisos del usuario.
+    Si la caché la ha perdido se genera una nueva, de modo que nunca se reutiliza
+    un conjunto de permisos calculado con una versión anterior.
+    """
+    key = _VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_permissions_version(user_id):
+    """Invalida todos los permisos cacheados del usuario (en todos sus gyms)."""
+    cache.set(_VERSION_KEY.format(user_id=user_id), time.time_ns(), None)
+
+
+def _load_permissions(user, gym_id: int):
+    """Consulta la BD y devuelve (codes, is_admin)."""
     GymMembership = apps.get_model("accounts", "GymMembership")
     FranchiseMembership = apps.get_model("accounts", "FranchiseMembership")
-    Gym = apps.get_model("organizations", "Gym")
-
-    # 1. Comprobar si es Owner de la Franquicia a la que pertenece el Gym
-    # Optimización: Podríamos pasar el objeto gym para ahorrar consulta, pero por id:
-    gym = Gym.objects.filter(id=gym_id).values("franchise_id").first()
-    if gym:
-        is_franchise_owner = FranchiseMembership.objects.filter(
-            user=user,
-            franchise_id=gym["franchise_id"],
-            role="OWNER" # Usar la constante de modelo idealmente
-        ).exists()
-        if is_franchise_owner:
-            return True
-
-    # 2. Comprobar membresía directa al Gym
+
+    # 1. Owner de la franquicia a la que pertenece el gym
+    is_franchise_owner = FranchiseMembership.objects.filter(
+        user=user,
+        franchise__gyms__id=gym_id,
+        role=FranchiseMembership.Role.OWNER,
+    ).exists()
+    if is_franchise_owner:
+        return frozenset(), True
+
+    # 2. Membresía directa al gym
     membership = GymMembership.objects.filter(
         user=user,
         gym_id=gym_id,
         is_active=True
-    ).first()
+    ).only("id", "role").first()
 
     if not membership:
-        return False
+        return frozenset(), False
+
+    if membership.role == GymMembership.Role.ADMIN:
+        return frozenset(), True
+
+    return frozenset(membership.permissions.values_list("code", flat=True)), False
+
 
-    if membership.role == "ADMIN":
-        return True
+def get_gym_permissions(user, gym_id, request=None) -> GymPermissionSet:
+    """
+    Devuelve los permisos efectivos del usuario sobre el gym.
+    Se memorizan en la request (si se pasa) y, con caché compartida, entre requests.
+    """
+    if not gym_id or not getattr(user, "is_authenticated", False):
+        return GymPermissionSet(gym_id)
+
+    gym_id = int(gym_id)
+
+    if user.is_superuser:
+        return GymPermissionSet(gym_id, is_admin=True)
 
-    return membership.permissions.filter(code=perm_code).exists()
+    memo = None
+    if request is not None:
+        memo = request.__dict__.setdefault("_gym_permissions", {})
+        if gym_id in memo:
+            return memo[gym_id]
+
+    if settings.PERMISSIONS_SHARED_CACHE:
+        key = _PERMS_KEY.format(user_id=user.pk, gym_id=gym_id, version=permissions_version(user.pk))
+        cached = cache.get(key)
+        if cached is None:
+            cached = _load_permissions(user, gym_id)
+            cache.set(key, cached, PERMISSIONS_CACHE_TIMEOUT)
+    else:
+        cached = _load_permissions(user, gym_id)
+
+    perms = GymPermissionSet(gym_id, *cached)
+    if memo is not None:
+        memo[gym_id] = perms
+    return perms
+
+
+def user_has_gym_permission(user, gym_id: int, perm_code: str, request=None) -> bool:
+    """
+    Comprueba si el usuario tiene permiso sobre un gym.
+    - ADMIN: siempre True
+    - STAFF: permiso explícito
+    """
+    return get_gym_permissions(user, gym_id, request=request).has(perm_code)
@@ -1,9 +1,27 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
 from typing import Optional
 from django.apps import apps
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from accounts.permissions import permissions_version
 
 User = get_user_model()
 
+# Filas de Gym cacheadas por proceso (LRU). Se invalidan al guardar/borrar el Gym
+# (accounts/signals.py); el TTL acota lo que puede tardar otro proceso en verlo.
+GYM_CACHE_SIZE = 256
+GYM_CACHE_TTL = 60
+
+# Versión global del listado de gyms (cambia al crear, editar o borrar gyms)
+_GYMS_VERSION_KEY = "accounts:gyms:version"
+
+SESSION_GYM_IDS_KEY = "allowed_gym_ids"
+
+
 def _GymMembership():
     return apps.get_model("accounts", "GymMembership")
 
@@ -19,7 +37,7 @@ def user_gym_ids(user: User):
 
     # 1. Gyms via Membership (Clients/Admins)
     ids = set(GymMembership.objects.filter(user=user, is_active=True).values_list("gym_id", flat=True))
-    
+
     # 2. Gyms via StaffProfile (Employees)
     if hasattr(user, "staff_profile"):
         # StaffProfile has a single 'gym' field, so we add its ID
@@ -30,3 +48,142 @@ def user_gym_ids(user: User):
 def default_gym_id(user: User) -> Optional[int]:
     ids = user_gym_ids(user)
     return ids[0] if ids else None
+
+
+# --------------------------------------------------
+# Gyms permitidos (cacheados en sesión)
+# --------------------------------------------------
+
+def bump_gyms_version():
+    cache.set(_GYMS_VERSION_KEY, time.time_ns(), None)
+
+def _gyms_version() -> int:
+    version = cache.get(_GYMS_VERSION_KEY)
+    if version is None:
+        cache.add(_GYMS_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(_GYMS_VERSION_KEY)
+    return version
+
+def _access_stamp(user) -> str:
+    return f"{_gyms_version()}:{permissions_version(user.pk)}"
+
+def allowed_gym_ids(request) -> list:
+    """
+    Igual que user_gym_ids(request.user) pero guardado en sesión junto a un sello
+    de versión. Solo se recalcula cuando cambian las membresías del usuario
+    (o el listado de gyms, para superusers).
+    """
+    user = request.user
+    if not getattr(user, "is_authenticated", False):
+        return []
+
+    stamp = _access_stamp(user)
+    stored = request.session.get(SESSION_GYM_IDS_KEY)
+    if stored and stored.get("version") == stamp:
+        return stored["ids"]
+
+    ids = user_gym_ids(user)
+    request.session[SESSION_GYM_IDS_KEY] = {"version": stamp, "ids": ids}
+    return ids
+
+
+SWITCHER_CACHE_TIMEOUT = 60 * 60
+_SWITCHER_KEY = "accounts:my_gyms:{user_id}:{stamp}"
+
+def switchable_gyms(request) -> list:
+    """
+    Gyms del selector de sede (id, name, commercial_name, brand_color).
+    Cacheado por usuario; la clave cambia cuando cambian sus membresías o los gyms.
+    """
+    user = request.user
+    if not getattr(user, "is_authenticated", False):
+        return []
+
+    key = _SWITCHER_KEY.format(user_id=user.pk, stamp=_access_stamp(user))
+    gyms = cache.get(key)
+    if gyms is None:
+        Gym = apps.get_model("organizations", "Gym")
+        gyms = list(
+            Gym.objects.filter(id__in=allowed_gym_ids(request))
+            .order_by("name")
+            .values("id", "name", "commercial_name", "brand_color")
+        )
+        cache.set(key, gyms, SWITCHER_CACHE_TIMEOUT)
+    return gyms
+
+
+# --------------------------------------------------
+# Gym activo
+# --------------------------------------------------
+
+class _GymLRU:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, gym_id):
+        with self._lock:
+            entry = self._data.get(gym_id)
+            if entry is None:
+                return None
+            expires_at, gym = entry
+            if expires_at < time.monotonic():
+                del self._data[gym_id]
+                return None
+            self._data.move_to_end(gym_id)
+            return gym
+
+    def set(self, gym_id, gym):
+        with self._lock:
+            self._data[gym_id] = (time.monotonic() + self.ttl, gym)
+            self._data.move_to_end(gym_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, gym_id):
+        with self._lock:
+            self._data.pop(gym_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_gym_cache = _GymLRU(GYM_CACHE_SIZE, GYM_CACHE_TTL)
+
+def invalidate_gym(gym_id):
+    _gym_cache.discard(gym_id)
+
+def get_gym(gym_id):
+    """
+    Devuelve el Gym (o None) desde la LRU del proceso.
+    Se entrega una copia: las vistas pueden modificar request.gym sin ensuciar la caché.
+    """
+    if not gym_id:
+        return None
+    gym_id = int(gym_id)
+
+    gym = _gym_cache.get(gym_id)
+    if gym is None:
+        Gym = apps.get_model("organizations", "Gym")
+        gym = Gym.objects.filter(pk=gym_id).first()
+        if gym is None:
+            return None
+        _gym_cache.set(gym_id, gym)
+    return copy.copy(gym)
+
+def current_gym(request):
+    """
+    Accessor único del gym activo (session["current_gym_id"]).
+    Se resuelve una sola vez por request; request.gym delega aquí.
+    """
+    gym_id = request.session.get("current_gym_id")
+    if not gym_id:
+        return None
+
+    memo = request.__dict__.get("_current_gym")
+    if memo is None or memo[0] != gym_id:
+        memo = request._current_gym = (gym_id, get_gym(gym_id))
+    return memo[1]
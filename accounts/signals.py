@@ -0,0 +1,63 @@
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models_memberships import Permission, FranchiseMembership, GymMembership
+from .permissions import bump_permissions_version
+from .services import bump_gyms_version, invalidate_gym
+
+
+@receiver([post_save, post_delete], sender=GymMembership)
+@receiver([post_save, post_delete], sender=FranchiseMembership)
+def invalidate_membership_permissions(sender, instance, **kwargs):
+    bump_permissions_version(instance.user_id)
+
+
+@receiver(m2m_changed, sender=GymMembership.permissions.through)
+def invalidate_membership_permission_codes(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Cambios en los permisos clickables de una membresía.
+    - directo: instance es la GymMembership
+    - inverso: instance es el Permission y pk_set son membresías
+    """
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            bump_permissions_version(instance.user_id)
+        return
+
+    if action in ("post_add", "post_remove"):
+        memberships = GymMembership.objects.filter(pk__in=pk_set)
+    elif action == "pre_clear":
+        # En post_clear ya no sabemos qué membresías lo tenían
+        memberships = GymMembership.objects.filter(permissions=instance)
+    else:
+        return
+
+    for user_id in set(memberships.values_list("user_id", flat=True)):
+        bump_permissions_version(user_id)
+
+
+@receiver(pre_delete, sender=Permission)
+def invalidate_deleted_permission(sender, instance, **kwargs):
+    # El borrado en cascada de la tabla intermedia no dispara m2m_changed
+    user_ids = GymMembership.objects.filter(permissions=instance).values_list("user_id", flat=True)
+    for user_id in set(user_ids):
+        bump_permissions_version(user_id)
+
+
+@receiver(post_save, sender="organizations.Gym")
+def invalidate_saved_gym(sender, instance, **kwargs):
+    invalidate_gym(instance.pk)
+    # El selector de sede muestra el nombre, así que cualquier cambio cuenta
+    bump_gyms_version()
+
+
+@receiver(post_delete, sender="organizations.Gym")
+def invalidate_deleted_gym(sender, instance, **kwargs):
+    invalidate_gym(instance.pk)
+    bump_gyms_version()
+
+
+@receiver([post_save, post_delete], sender="staff.StaffProfile")
+def invalidate_staff_gyms(sender, instance, **kwargs):
+    # StaffProfile.gym también da acceso al gym (ver user_gym_ids)
+    bump_permissions_version(instance.user_id)
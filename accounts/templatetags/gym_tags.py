@@ -18,4 +18,4 @@ def has_gym_perm(context, perm_code):
     if not gym_id:
         return False
 
-    return user_has_gym_permission(request.user, gym_id, perm_code)
+    return user_has_gym_permission(request.user, gym_id, perm_code, request=request)
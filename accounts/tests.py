@@ -1,3 +1,155 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from accounts.models import User
+from accounts.models_memberships import Permission, FranchiseMembership, GymMembership
+from accounts.permissions import get_gym_permissions, user_has_gym_permission
+from accounts.services import allowed_gym_ids, current_gym, get_gym, invalidate_gym
+from organizations.models import Franchise, Gym
+
+
+@override_settings(PERMISSIONS_SHARED_CACHE=True)
+class GymPermissionResolverTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.franchise = Franchise.objects.create(name="Franquicia")
+        self.gym = Gym.objects.create(name="Centro", franchise=self.franchise)
+        self.user = User.objects.create_user(email="staff@test.com", password="password")
+        self.membership = GymMembership.objects.create(user=self.user, gym=self.gym, role=GymMembership.Role.STAFF)
+        self.perm_view = Permission.objects.create(code="clients.view", label="Ver clientes")
+        self.perm_create = Permission.objects.create(code="clients.create", label="Crear clientes")
+        self.membership.permissions.add(self.perm_view)
+
+    def test_steady_state_hits_no_queries(self):
+        self.assertTrue(user_has_gym_permission(self.user, self.gym.id, "clients.view"))
+        with self.assertNumQueries(0):
+            self.assertTrue(user_has_gym_permission(self.user, self.gym.id, "clients.view"))
+            self.assertFalse(user_has_gym_permission(self.user, self.gym.id, "clients.create"))
+
+    def test_permissions_m2m_invalidates(self):
+        self.assertFalse(user_has_gym_permission(self.user, self.gym.id, "clients.create"))
+        self.membership.permissions.add(self.perm_create)
+        self.assertTrue(user_has_gym_permission(self.user, self.gym.id, "clients.create"))
+        self.perm_create.gymmembership_set.clear()
+        self.assertFalse(user_has_gym_permission(self.user, self.gym.id, "clients.create"))
+
+    def test_role_and_franchise_owner_invalidate(self):
+        self.assertFalse(get_gym_permissions(self.user, self.gym.id).is_admin)
+        self.membership.role = GymMembership.Role.ADMIN
+        self.membership.save()
+        self.assertTrue(get_gym_permissions(self.user, self.gym.id).is_admin)
+
+        self.membership.delete()
+        self.assertFalse(user_has_gym_permission(self.user, self.gym.id, "clients.view"))
+        FranchiseMembership.objects.create(user=self.user, franchise=self.franchise)
+        self.assertTrue(user_has_gym_permission(self.user, self.gym.id, "staff.manage"))
+
+    @override_settings(PERMISSIONS_SHARED_CACHE=False)
+    def test_per_process_cache_reads_database(self):
+        self.assertTrue(user_has_gym_permission(self.user, self.gym.id, "clients.view"))
+        with self.assertNumQueries(3):
+            self.assertTrue(user_has_gym_permission(self.user, self.gym.id, "clients.view"))
+
+    def test_request_memo(self):
+        class FakeRequest:
+            pass
+
+        request = FakeRequest()
+        get_gym_permissions(self.user, self.gym.id, request=request)
+        cache.clear()
+        with self.assertNumQueries(0):
+            self.assertTrue(user_has_gym_permission(self.user, self.gym.id, "clients.view", request=request))
+
+
+class TenantResolutionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.gym = Gym.objects.create(name="Centro")
+        self.other_gym = Gym.objects.create(name="Otro")
+        self.user = User.objects.create_user(email="staff@test.com", password="password")
+        GymMembership.objects.create(user=self.user, gym=self.gym, role=GymMembership.Role.ADMIN)
+        self.client.force_login(self.user)
+
+    def _request(self):
+        class FakeRequest:
+            pass
+
+        request = FakeRequest()
+        request.user = self.user
+        request.session = {}
+        return request
+
+    def test_allowed_gym_ids_cached_in_session(self):
+        request = self._request()
+        self.assertEqual(allowed_gym_ids(request), [self.gym.id])
+        with self.assertNumQueries(0):
+            self.assertEqual(allowed_gym_ids(request), [self.gym.id])
+
+        GymMembership.objects.create(user=self.user, gym=self.other_gym, role=GymMembership.Role.STAFF)
+        self.assertEqual(set(allowed_gym_ids(request)), {self.gym.id, self.other_gym.id})
+
+    def test_gym_lru_invalidates_on_save(self):
+        invalidate_gym(self.gym.id)
+        get_gym(self.gym.id)
+        with self.assertNumQueries(0):
+            gym = get_gym(self.gym.id)
+        # Las copias no comparten estado con la caché
+        gym.name = "Sucio"
+        self.assertEqual(get_gym(self.gym.id).name, "Centro")
+
+        self.gym.brand_color = "#ff0000"
+        self.gym.save()
+        self.assertEqual(get_gym(self.gym.id).brand_color, "#ff0000")
+
+    def test_current_gym_resolved_once_per_request(self):
+        request = self._request()
+        request.session["current_gym_id"] = self.gym.id
+        invalidate_gym(self.gym.id)
+        self.assertEqual(current_gym(request), self.gym)
+        invalidate_gym(self.gym.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(current_gym(request), self.gym)
+
+    def test_middleware_picks_allowed_gym(self):
+        session = self.client.session
+        session["current_gym_id"] = self.other_gym.id
+        session.save()
+        self.client.get("/sales/pos/")
+        self.assertEqual(self.client.session["current_gym_id"], self.gym.id)
+
+
+@override_settings(PERMISSIONS_SHARED_CACHE=True)
+class GymContextProcessorTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.gym = Gym.objects.create(name="Centro", brand_color="#123456")
+        self.user = User.objects.create_user(email="staff@test.com", password="password")
+        GymMembership.objects.create(user=self.user, gym=self.gym, role=GymMembership.Role.ADMIN)
+
+    def _request(self):
+        from django.test import RequestFactory
+
+        request = RequestFactory().get("/")
+        request.user = self.user
+        request.session = {"current_gym_id": self.gym.id}
+        return request
+
+    def _render(self, source, request):
+        from django.template import engines
+
+        return engines["django"].from_string(source).render({}, request)
+
+    def test_unused_keys_do_not_query(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self._render("ok", self._request()), "ok")
+
+    def test_switcher_served_from_cache(self):
+        source = "{% for g in my_gyms %}{{ g.name }}{% endfor %}|{{ brand_color }}|{% if can_view_clients %}y{% endif %}"
+        self.assertEqual(self._render(source, self._request()), "Centro|#123456|y")
+        invalidate_gym(self.gym.id)
+        with self.assertNumQueries(1):  # solo la fila del Gym (brand_color)
+            self.assertEqual(self._render(source, self._request()), "Centro|#123456|y")
+
+        other = Gym.objects.create(name="Anexo")
+        GymMembership.objects.create(user=self.user, gym=other, role=GymMembership.Role.STAFF)
+        self.assertEqual(self._render("{% for g in my_gyms %}{{ g.name }},{% endfor %}", self._request()), "Anexo,Centro,")
@@ -20,8 +20,8 @@ def logout_view(request):
 @login_required
 def switch_gym(request, gym_id):
     """Switch the current gym in session"""
-    from accounts.services import user_gym_ids
-    available_ids = user_gym_ids(request.user)
+    from accounts.services import allowed_gym_ids
+    available_ids = allowed_gym_ids(request)
     
     if int(gym_id) in available_ids:
         request.session["current_gym_id"] = int(gym_id)
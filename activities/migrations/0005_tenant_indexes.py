@@ -0,0 +1,20 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0004_activity_color'),
+        ('clients', '0006_client_stripe_customer_id'),
+        ('organizations', '0004_gym_facebook_gym_instagram_gym_tiktok_gym_youtube'),
+        ('staff', '0005_alter_workshift_method'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activitysession',
+            index=models.Index(fields=['gym', 'start_datetime'], name='session_gym_start_idx'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from organizations.models import Gym
+from organizations.managers import TenantManager
 from staff.models import StaffProfile
 
 class Room(models.Model):
@@ -85,6 +86,8 @@ class ScheduleRule(models.Model):
     
     is_active = models.BooleanField(default=True)
 
+    objects = TenantManager()
+
     def __str__(self):
         day_label = dict(self.DAYS_OF_WEEK).get(self.day_of_week, 'N/A')
         return f"{self.activity.name} - {day_label} {self.start_time}"
@@ -121,8 +124,13 @@ class ActivitySession(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TenantManager()
+
     class Meta:
         ordering = ['start_datetime']
+        indexes = [
+            models.Index(fields=['gym', 'start_datetime'], name='session_gym_start_idx'),
+        ]
 
     def __str__(self):
         return f"{self.activity.name} - {self.start_datetime.strftime('%d/%m %H:%M')}"
@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 from django.http import JsonResponse
 from django.utils import timezone
+from django.db.models import Count
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_GET
 from .models import ActivitySession
@@ -24,11 +25,10 @@ def get_calendar_events(request):
             return JsonResponse([], safe=False)
             
         # 1. Activity Sessions
-        sessions = ActivitySession.objects.filter(
-            gym=gym, 
+        sessions = ActivitySession.objects.for_gym(gym).filter(
             start_datetime__gte=start_str,
             start_datetime__lte=end_str
-        ).select_related('activity', 'room', 'staff')
+        ).select_related('activity', 'room', 'staff__user').annotate(attendee_total=Count('attendees'))
         
         for sess in sessions:
             # Use Activity Color
@@ -46,18 +46,17 @@ def get_calendar_events(request):
                     'type': 'session',
                     'staff': f"{sess.staff.user.first_name} {sess.staff.user.last_name}".strip() if sess.staff else 'Sin Asignar',
                     'room': sess.room.name if sess.room else 'Sin Sala',
-                    'attendees': sess.attendees.count(),
+                    'attendees': sess.attendee_total,
                     'max_capacity': sess.max_capacity,
                     'db_id': sess.id
                 }
             })
             
         # 2. Service Appointments
-        appointments = ServiceAppointment.objects.filter(
-            gym=gym,
+        appointments = ServiceAppointment.objects.for_gym(gym).filter(
             start_datetime__gte=start_str,
             start_datetime__lte=end_str
-        ).select_related('service', 'client', 'staff', 'room')
+        ).select_related('service', 'client', 'staff__user', 'room')
         
         for apt in appointments:
             color = apt.service.color
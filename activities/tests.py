@@ -1,3 +1,59 @@
+from datetime import timedelta
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import User
+from accounts.models_memberships import GymMembership
+from activities.models import Activity, ActivitySession, Room
+from backoffice.query_budget import QueryBudgetTestMixin, assert_query_budget
+from clients.models import Client
+from organizations.models import Gym
+
+
+class CalendarEventsBudgetTest(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.gym = Gym.objects.create(name="Centro")
+        self.user = User.objects.create_user(email="staff@test.com", password="password")
+        GymMembership.objects.create(user=self.user, gym=self.gym, role=GymMembership.Role.ADMIN)
+        self.client.force_login(self.user)
+
+        room = Room.objects.create(gym=self.gym, name="Sala 1", capacity=20)
+        activity = Activity.objects.create(gym=self.gym, name="Yoga", base_capacity=20)
+        clients = [Client.objects.create(gym=self.gym, first_name=f"C{i}") for i in range(3)]
+        self.start = timezone.now().replace(hour=8, minute=0, second=0, microsecond=0)
+        for i in range(6):
+            session = ActivitySession.objects.create(
+                gym=self.gym, activity=activity, room=room,
+                start_datetime=self.start + timedelta(hours=i),
+                end_datetime=self.start + timedelta(hours=i, minutes=50),
+                max_capacity=20,
+            )
+            session.attendees.set(clients[:i % 4])
+
+    def test_calendar_events_within_budget(self):
+        response = self.client.get("/activities/api/events/", {
+            "start": (self.start - timedelta(days=1)).isoformat(),
+            "end": (self.start + timedelta(days=1)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        events = response.json()
+        self.assertEqual(len(events), 6)
+        self.assertEqual(sorted(e["extendedProps"]["attendees"] for e in events), [0, 0, 1, 1, 2, 3])
+        self.assertWithinQueryBudget(response)
+        self.assertEqual(response.sql_report["duplicates"], [])
+
+    def test_over_budget_fails(self):
+        response = self.client.get("/activities/api/events/", {
+            "start": (self.start - timedelta(days=1)).isoformat(),
+            "end": (self.start + timedelta(days=1)).isoformat(),
+        })
+        with self.assertRaisesMessage(AssertionError, "presupuesto 1"):
+            self.assertWithinQueryBudget(response, budget=1)
 
-# Create your tests here.
+        with self.assertRaisesMessage(AssertionError, "salas: 2 queries (presupuesto 1)"):
+            with assert_query_budget(1, label="salas"):
+                list(Room.objects.all())
+                list(Room.objects.all())
@@ -0,0 +1,280 @@
+"""
+Benchmarks repetibles de los caminos calientes (POS, agenda, facturación, dashboard).
+
+Se ejecutan contra la BD configurada (normalmente un dataset generado con
+`manage.py seed_scale_data`) usando el test client de Django. Los escenarios
+que escriben (WRITE_SCENARIOS) van dentro de una transacción que se revierte,
+así no alteran el dataset entre ejecuciones. Los de lectura no: dentro de
+transaction.atomic() PrimaryReplicaRouter nunca usa la réplica.
+
+Uso: `manage.py benchmark_endpoints` (ver la ayuda del comando).
+"""
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.test import Client as HttpClient
+from django.urls import reverse
+from django.utils import timezone
+
+from backoffice.query_budget import QueryRecorder
+
+DEFAULT_ITERATIONS = 30
+DEFAULT_WARMUP = 3
+DEFAULT_THRESHOLD = 0.20
+
+
+@dataclass
+class BenchmarkContext:
+    gym: object
+    user: object
+    http: HttpClient
+    client_id: int = None
+    client_query: str = ""
+    product_id: int = None
+    product_query: str = ""
+    product_price: float = 0
+    order_id: int = None
+    method_id: int = None
+
+
+def build_context(gym, user):
+    from clients.models import Client
+    from finance.models import PaymentMethod
+    from products.models import Product
+    from sales.models import Order
+
+    # Un 500 se registra como status, no aborta la suite
+    http = HttpClient(raise_request_exception=False)
+    http.force_login(user)
+    session = http.session
+    session["current_gym_id"] = gym.pk
+    session.save()
+
+    ctx = BenchmarkContext(gym=gym, user=user, http=http)
+    client = Client.objects.for_gym(gym).order_by("pk").first()
+    if client:
+        ctx.client_id = client.pk
+        ctx.client_query = client.last_name[:4]
+    product = Product.objects.filter(gym=gym, is_active=True).order_by("pk").first()
+    if product:
+        ctx.product_id = product.pk
+        ctx.product_query = product.name.split()[0][:4]
+        ctx.product_price = float(product.final_price)
+    ctx.order_id = Order.objects.for_gym(gym).order_by("-pk").values_list("pk", flat=True).first()
+    ctx.method_id = PaymentMethod.objects.for_gym(gym).filter(is_active=True).values_list("pk", flat=True).first()
+    return ctx
+
+
+# --------------------------------------------------
+# Escenarios
+# --------------------------------------------------
+
+def _get(ctx, url, **params):
+    return lambda: ctx.http.get(url, params)
+
+
+def _process_sale(ctx):
+    payload = json.dumps({
+        "client_id": ctx.client_id,
+        "items": [{"id": ctx.product_id, "type": "product", "qty": 1, "discount": {"value": 0}}],
+        "payments": [{"method_id": ctx.method_id, "amount": ctx.product_price}],
+        "action": "NONE",
+    })
+    url = reverse("api_pos_process_sale")
+    return lambda: ctx.http.post(url, payload, content_type="application/json")
+
+
+def _calendar_events(ctx):
+    today = timezone.localdate()
+    start = today - timedelta(days=today.weekday())
+    end = start + timedelta(days=7)
+    return _get(ctx, reverse("api_calendar_events"), start=start.isoformat(), end=end.isoformat())
+
+
+def _dashboard_service(ctx):
+    from backoffice.dashboard_service import DashboardService
+
+    def run():
+        dashboard = DashboardService(ctx.gym)
+        dashboard.get_kpi_stats()
+        dashboard.get_risk_clients()
+        dashboard.get_top_clients()
+
+    return run
+
+
+# nombre -> constructor del callable a medir
+SCENARIOS = {
+    "sales.api.process_sale": _process_sale,
+    "sales.api.search_products": lambda ctx: _get(ctx, reverse("api_pos_products_search"), q=ctx.product_query),
+    "sales.api.search_clients": lambda ctx: _get(ctx, reverse("api_pos_clients_search"), q=ctx.client_query),
+    "sales.api.order_detail_json": lambda ctx: _get(ctx, reverse("api_order_detail", args=[ctx.order_id or 0])),
+    "activities.scheduler_api.get_calendar_events": _calendar_events,
+    "finance.views.billing_dashboard": lambda ctx: _get(ctx, reverse("finance_billing_dashboard"), range="month"),
+    "backoffice.dashboard_service.DashboardService": _dashboard_service,
+    "reporting.views.client_explorer": lambda ctx: _get(ctx, reverse("client_explorer")),
+}
+# Escenarios que escriben: cada llamada se revierte
+WRITE_SCENARIOS = {"sales.api.process_sale"}
+
+
+# --------------------------------------------------
+# Medición
+# --------------------------------------------------
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def _call(fn, rollback):
+    if not rollback:
+        return fn()
+    with transaction.atomic():
+        result = fn()
+        transaction.set_rollback(True)
+    return result
+
+
+def measure(fn, iterations=DEFAULT_ITERATIONS, warmup=DEFAULT_WARMUP, rollback=False):
+    """
+    Latencias (ms), queries por llamada y pico de memoria Python (KiB).
+    Con rollback=True cada llamada va en una transacción que se revierte.
+    """
+    for _ in range(warmup):
+        _call(fn, rollback)
+
+    timings, queries, statuses = [], [], set()
+    for _ in range(iterations):
+        recorder = QueryRecorder()
+        with recorder.record():
+            start = time.perf_counter()
+            result = _call(fn, rollback)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(recorder.count)
+        if hasattr(result, "status_code"):
+            statuses.add(result.status_code)
+
+    # Memoria en una pasada aparte: tracemalloc distorsiona los tiempos
+    tracemalloc.start()
+    try:
+        _call(fn, rollback)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "p50_ms": round(_percentile(timings, 50), 3),
+        "p95_ms": round(_percentile(timings, 95), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "max_ms": round(max(timings), 3),
+        "queries": max(queries),
+        "peak_kib": round(peak / 1024, 1),
+        "status": sorted(statuses),
+        "ok": all(200 <= s < 400 for s in statuses),
+    }
+
+
+def run_benchmarks(ctx, names=None, iterations=DEFAULT_ITERATIONS, warmup=DEFAULT_WARMUP, on_result=None):
+    results = {}
+    for name, factory in SCENARIOS.items():
+        if names and name not in names:
+            continue
+        results[name] = measure(factory(ctx), iterations=iterations, warmup=warmup, rollback=name in WRITE_SCENARIOS)
+        if on_result:
+            on_result(name, results[name])
+    return {
+        "meta": {
+            "created_at": timezone.now().isoformat(),
+            "gym_id": ctx.gym.pk,
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "iterations": iterations,
+        },
+        "results": results,
+    }
+
+
+# --------------------------------------------------
+# Planes de ejecución
+# --------------------------------------------------
+
+def _plan_querysets(ctx):
+    from activities.models import ActivitySession
+    from clients.models import Client, ClientMembership
+    from sales.models import Order
+    from services.models import ServiceAppointment
+
+    since = timezone.now() - timedelta(days=30)
+    until = timezone.now() + timedelta(days=7)
+    return {
+        "orders_by_date": (
+            Order.objects.for_gym(ctx.gym).filter(created_at__gte=since),
+            ("order_gym_created_idx", "order_gym_status_created_idx"),
+        ),
+        "paid_orders_by_date": (
+            Order.objects.for_gym(ctx.gym).filter(status="PAID", created_at__gte=since),
+            ("order_gym_status_created_idx",),
+        ),
+        "calendar_sessions": (
+            ActivitySession.objects.for_gym(ctx.gym).filter(start_datetime__gte=since, start_datetime__lte=until),
+            ("session_gym_start_idx",),
+        ),
+        "calendar_appointments": (
+            ServiceAppointment.objects.for_gym(ctx.gym).filter(start_datetime__gte=since, start_datetime__lte=until),
+            ("appointment_gym_start_idx",),
+        ),
+        "clients_by_status": (
+            Client.objects.for_gym(ctx.gym).filter(status=Client.Status.ACTIVE),
+            ("client_gym_status_idx",),
+        ),
+        "client_active_memberships": (
+            ClientMembership.objects.filter(client_id=ctx.client_id, status=ClientMembership.Status.ACTIVE),
+            ("membership_client_status_idx",),
+        ),
+    }
+
+
+def check_query_plans(ctx):
+    """
+    EXPLAIN de las consultas por tenant: ¿usa el planner los índices compuestos?
+    Con pocos datos PostgreSQL puede preferir un seq scan; medir sobre seed_scale_data.
+    """
+    checks = {}
+    for name, (queryset, indexes) in _plan_querysets(ctx).items():
+        plan = queryset.explain()
+        used = next((index for index in indexes if index in plan), None)
+        checks[name] = {"expected": list(indexes), "used": used, "ok": used is not None, "plan": plan}
+    return checks
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Regresiones de `current` respecto a `baseline` (ambos salida de run_benchmarks).
+    Latencia y memoria toleran `threshold` (0.20 = +20%); las queries no toleran ninguna.
+    """
+    regressions = []
+    for name, now in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+        for metric in ("p50_ms", "p95_ms", "peak_kib"):
+            if before[metric] and now[metric] > before[metric] * (1 + threshold):
+                regressions.append({"scenario": name, "metric": metric, "baseline": before[metric], "current": now[metric]})
+        if now["queries"] > before["queries"]:
+            regressions.append({"scenario": name, "metric": "queries", "baseline": before["queries"], "current": now["queries"]})
+        if before.get("ok") and not now["ok"]:
+            regressions.append({"scenario": name, "metric": "status", "baseline": before["status"], "current": now["status"]})
+    for name, now in current.get("plans", {}).items():
+        before = baseline.get("plans", {}).get(name)
+        if before and before["ok"] and not now["ok"]:
+            regressions.append({"scenario": name, "metric": "index", "baseline": before["used"], "current": None})
+    return regressions
@@ -4,6 +4,7 @@ from datetime import timedelta
 from sales.models import Order
 from clients.models import Client
 from memberships.models import MembershipPlan
+from products.alerts import reorder_list
 
 class DashboardService:
     def __init__(self, gym):
@@ -18,14 +19,12 @@ class DashboardService:
         Calculates main KPIs: Revenue, Members, Churn.
         """
         # 1. Revenue (This Month vs Last Month)
-        revenue_this_month = Order.objects.filter(
-            gym=self.gym, 
+        revenue_this_month = Order.objects.for_gym(self.gym).filter(
             status='PAID', 
             created_at__gte=self.first_day_this_month
         ).aggregate(t=Sum('total_amount'))['t'] or 0
 
-        revenue_last_month = Order.objects.filter(
-            gym=self.gym, 
+        revenue_last_month = Order.objects.for_gym(self.gym).filter(
             status='PAID', 
             created_at__gte=self.first_day_last_month,
             created_at__lte=self.last_month
@@ -38,8 +37,7 @@ class DashboardService:
             growth_revenue = 100 if revenue_this_month > 0 else 0
 
         # TAXES (Simplified: assuming 21% avg for dashboard estimate or sum from OrderItems if complex)
-        taxes_this_month = Order.objects.filter(
-            gym=self.gym, 
+        taxes_this_month = Order.objects.for_gym(self.gym).filter(
             status='PAID', 
             created_at__gte=self.first_day_this_month
         ).aggregate(t=Sum('total_tax'))['t'] or 0
@@ -51,11 +49,10 @@ class DashboardService:
         # 2. Active Members
         # Definition: Clients with active MembershipPlan
         # Simple count for now: Clients status='ACTIVE'
-        active_members = Client.objects.filter(gym=self.gym, status='ACTIVE').count()
+        active_members = Client.objects.for_gym(self.gym).filter(status='ACTIVE').count()
         
         # New Members (This Month)
-        new_members = Client.objects.filter(
-            gym=self.gym, 
+        new_members = Client.objects.for_gym(self.gym).filter(
             created_at__gte=self.first_day_this_month
         ).count()
 
@@ -84,8 +81,7 @@ class DashboardService:
         risk_list = []
         
         # 1. Billing Risk (High Priority)
-        debtors = Client.objects.filter(
-            gym=self.gym,
+        debtors = Client.objects.for_gym(self.gym).filter(
             orders__status__in=['PENDING', 'PARTIAL', 'FAILED'] # Assuming FAILED exists
         ).distinct()
         
@@ -111,7 +107,7 @@ class DashboardService:
         """
         Returns top clients by LTV (Total Spent).
         """
-        clients = Client.objects.filter(gym=self.gym).annotate(
+        clients = Client.objects.for_gym(self.gym).annotate(
             total_spent=Sum('orders__total_amount', filter=Q(orders__status='PAID'))
         ).order_by('-total_spent')[:5]
         
@@ -128,3 +124,10 @@ class DashboardService:
                 'total_spent_fmt': "{:.2f}".format(c.total_spent)
             })
         return formatted_clients
+
+    def get_reorder_list(self):
+        """
+        Low-stock products grouped by supplier. Reads the gym's alert set
+        (products/alerts.py), not the whole catalog.
+        """
+        return reorder_list(self.gym)
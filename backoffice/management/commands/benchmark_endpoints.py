@@ -0,0 +1,122 @@
+import json
+import logging
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from accounts.models_memberships import GymMembership
+from backoffice import benchmarks
+from organizations.models import Gym
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide p50/p95, queries y memoria de los endpoints calientes contra la BD actual "
+        "(p.ej. un dataset de seed_scale_data). Las escrituras se revierten. "
+        "Termina con error si algún escenario falla (p.ej. un 500) o hay regresiones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--gym", type=int, help="ID del gym. Por defecto, el gym con más clientes.")
+        parser.add_argument("--user", help="Email del usuario. Por defecto, el primer ADMIN del gym.")
+        parser.add_argument("--iterations", type=int, default=benchmarks.DEFAULT_ITERATIONS)
+        parser.add_argument("--warmup", type=int, default=benchmarks.DEFAULT_WARMUP)
+        parser.add_argument("--only", action="append", choices=sorted(benchmarks.SCENARIOS), help="Repetible")
+        parser.add_argument("--output", default="benchmarks.json", help="Fichero JSON de resultados")
+        parser.add_argument("--compare", help="JSON de referencia (baseline) con el que comparar")
+        parser.add_argument("--threshold", type=float, default=benchmarks.DEFAULT_THRESHOLD,
+                            help="Tolerancia de latencia/memoria frente al baseline (0.2 = +20%%)")
+        parser.add_argument("--skip-explain", action="store_true", help="No comprobar los planes de ejecución")
+
+    def handle(self, *args, **options):
+        gym = self._gym(options["gym"])
+        user = self._user(gym, options["user"])
+
+        baseline = None
+        if options["compare"]:
+            try:
+                baseline = json.loads(Path(options["compare"]).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f"No se pudo leer el baseline: {e}")
+
+        self.stdout.write(f"Gym {gym.pk} ({gym.name}) como {user.email}")
+        # Igual que en los tests: 'testserver' permitido y emails a locmem
+        setup_test_environment()
+        # Los 500 ya salen en el resumen; sin trazas de django.request por iteración
+        request_logger = logging.getLogger("django.request")
+        previous_level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            ctx = benchmarks.build_context(gym, user)
+            report = benchmarks.run_benchmarks(
+                ctx,
+                names=options["only"],
+                iterations=options["iterations"],
+                warmup=options["warmup"],
+                on_result=self._print_result,
+            )
+            if not options["skip_explain"]:
+                report["plans"] = benchmarks.check_query_plans(ctx)
+                self._print_plans(report["plans"])
+        finally:
+            request_logger.setLevel(previous_level)
+            teardown_test_environment()
+
+        Path(options["output"]).write_text(json.dumps(report, indent=2))
+        self.stdout.write(f"Resultados en {options['output']}")
+
+        errors = []
+        failed = [name for name, result in report["results"].items() if not result["ok"]]
+        if failed:
+            errors.append(f"{len(failed)} escenarios con error ({', '.join(failed)})")
+
+        if baseline is not None:
+            regressions = benchmarks.compare(report, baseline, options["threshold"])
+            for r in regressions:
+                self.stdout.write(self.style.ERROR(
+                    f"  REGRESIÓN {r['scenario']} {r['metric']}: {r['baseline']} -> {r['current']}"
+                ))
+            if regressions:
+                errors.append(f"{len(regressions)} regresiones frente a {options['compare']}")
+            else:
+                self.stdout.write(self.style.SUCCESS("Sin regresiones frente al baseline"))
+
+        if errors:
+            raise CommandError("; ".join(errors))
+
+    def _print_result(self, name, result):
+        line = (
+            f"  {name:<48} p50 {result['p50_ms']:>8.2f}ms  p95 {result['p95_ms']:>8.2f}ms  "
+            f"{result['queries']:>4} q  {result['peak_kib']:>9.1f} KiB"
+        )
+        self.stdout.write(line if result["ok"] else self.style.WARNING(f"{line}  status {result['status']}"))
+
+    def _print_plans(self, plans):
+        self.stdout.write("Planes de ejecución:")
+        for name, check in plans.items():
+            if check["ok"]:
+                self.stdout.write(f"  {name:<48} {check['used']}")
+            else:
+                self.stdout.write(self.style.WARNING(f"  {name:<48} sin índice (esperado {', '.join(check['expected'])})"))
+
+    def _gym(self, gym_id):
+        if gym_id:
+            gym = Gym.objects.filter(pk=gym_id).first()
+        else:
+            from django.db.models import Count
+            gym = Gym.objects.annotate(n=Count("clients")).order_by("-n", "pk").first()
+        if gym is None:
+            raise CommandError("No hay gym. Genera datos con seed_scale_data o usa --gym.")
+        return gym
+
+    def _user(self, gym, email):
+        memberships = GymMembership.objects.filter(gym=gym, is_active=True).select_related("user")
+        if email:
+            memberships = memberships.filter(user__email=email)
+        else:
+            memberships = memberships.filter(role=GymMembership.Role.ADMIN)
+        membership = memberships.order_by("pk").first()
+        if membership is None:
+            raise CommandError("No hay usuario ADMIN activo en ese gym (usa --user).")
+        return membership.user
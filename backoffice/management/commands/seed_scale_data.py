@@ -0,0 +1,352 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, time as dtime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import User
+from accounts.models_memberships import GymMembership
+from activities.models import Activity, ActivityCategory, ActivitySession, Room, ScheduleRule
+from clients.models import Client, ClientMembership, ClientVisit
+from finance.models import PaymentMethod, TaxRate
+from marketing.models import Campaign, EmailTemplate
+from memberships.models import MembershipPlan
+from organizations.models import Franchise, Gym
+from products.models import Product, ProductCategory
+from sales.models import Order, OrderItem, OrderPayment
+from services.models import Service, ServiceCategory
+from staff.models import IncentiveRule, StaffCommission, StaffProfile
+
+PRESETS = {
+    # Lo justo para probar en local
+    "small": dict(
+        franchises=2, gyms=4, clients_per_gym=500, orders_per_client=3, visits_per_client=5,
+        staff_per_gym=5, products_per_gym=40, services_per_gym=10, plans_per_gym=6,
+        weeks=4, campaigns_per_gym=3,
+    ),
+    # Volumen tipo producción (~10M clientes, ~10M tickets)
+    "production": dict(
+        franchises=20, gyms=200, clients_per_gym=50000, orders_per_client=1, visits_per_client=2,
+        staff_per_gym=15, products_per_gym=300, services_per_gym=40, plans_per_gym=12,
+        weeks=12, campaigns_per_gym=20,
+    ),
+}
+
+FIRST_NAMES = ["Lucía", "Hugo", "Martina", "Mateo", "Sofía", "Leo", "Julia", "Daniel", "Paula", "Álvaro",
+               "Valeria", "Pablo", "Emma", "Manuel", "Carla", "Adrián", "Sara", "Javier", "Noa", "Iñigo"]
+LAST_NAMES = ["García", "Rodríguez", "González", "Fernández", "López", "Martínez", "Sánchez", "Pérez",
+              "Gómez", "Martín", "Jiménez", "Ruiz", "Hernández", "Díaz", "Moreno", "Muñoz", "Álvarez", "Romero"]
+PRODUCT_WORDS = ["Proteína", "Barrita", "Bebida", "Camiseta", "Toalla", "Guantes", "Creatina", "Shaker",
+                 "Candado", "Cinturón", "Isotónico", "Agua", "Mallas", "Sudadera", "Gorra", "Cuerda"]
+ACTIVITY_NAMES = ["Yoga", "Pilates", "Spinning", "Crossfit", "Zumba", "Body Pump", "HIIT", "Boxeo",
+                  "Funcional", "Estiramientos", "Aquagym", "TRX"]
+
+CENT = Decimal("0.01")
+PASSWORD = "scale1234"
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """Desactiva auto_now/auto_now_add para poder repartir fechas en el pasado."""
+    saved = []
+    for model, name in fields:
+        field = model._meta.get_field(name)
+        saved.append((field, field.auto_now, field.auto_now_add))
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = "Genera un dataset determinista (semilla) a escala producción para benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--preset", choices=sorted(PRESETS), default="small")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--prefix", default="Scale", help="Prefijo de franquicias/gyms/emails generados")
+        parser.add_argument("--anchor", help="Fecha 'hoy' del dataset (YYYY-MM-DD). Por defecto, hoy.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--months", type=int, default=12, help="Antigüedad máxima de altas y ventas")
+        for name in PRESETS["small"]:
+            parser.add_argument(f"--{name.replace('_', '-')}", type=int, dest=name)
+
+    def handle(self, *args, **options):
+        self.opts = dict(PRESETS[options["preset"]])
+        for name in PRESETS["small"]:
+            if options.get(name) is not None:
+                self.opts[name] = options[name]
+        if self.opts["gyms"] < self.opts["franchises"]:
+            raise CommandError("--gyms debe ser >= --franchises")
+
+        self.seed = options["seed"]
+        self.prefix = options["prefix"]
+        self.batch_size = options["batch_size"]
+        self.months = options["months"]
+        self.anchor = date.fromisoformat(options["anchor"]) if options["anchor"] else timezone.localdate()
+        self.tz = timezone.get_current_timezone()
+        self.password = make_password(PASSWORD)
+        self.counts = {}
+
+        if Franchise.objects.filter(name__startswith=f"{self.prefix} ").exists():
+            raise CommandError(f"Ya existen datos con el prefijo '{self.prefix}'. Usa otro --prefix.")
+
+        self.content_types = ContentType.objects.get_for_models(Product, Service, MembershipPlan)
+
+        started = time.monotonic()
+        gyms = self._create_organizations()
+        for index, gym in enumerate(gyms):
+            gym_started = time.monotonic()
+            rng = random.Random(f"{self.seed}:{index}")
+            with transaction.atomic():
+                self._populate_gym(gym, rng)
+            self.stdout.write(f"  [{index + 1}/{len(gyms)}] {gym.name} ({time.monotonic() - gym_started:.1f}s)")
+
+        total = sum(self.counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} filas en {time.monotonic() - started:.1f}s (password staff: {PASSWORD})"
+        ))
+        for label, count in sorted(self.counts.items()):
+            self.stdout.write(f"  {label}: {count}")
+
+    # --------------------------------------------------
+    # Helpers
+    # --------------------------------------------------
+
+    def _bulk(self, model, objs):
+        objs = model.objects.bulk_create(objs, batch_size=self.batch_size)
+        label = model._meta.label
+        self.counts[label] = self.counts.get(label, 0) + len(objs)
+        return objs
+
+    def _random_dt(self, rng, days_back, not_before=None):
+        day = self.anchor - timedelta(days=rng.randrange(days_back + 1))
+        if not_before and day < not_before:
+            day = not_before
+        moment = dtime(hour=rng.randrange(7, 22), minute=rng.randrange(60))
+        return timezone.make_aware(datetime.combine(day, moment), self.tz)
+
+    def _price(self, rng, low, high):
+        return Decimal(rng.randrange(low * 100, high * 100)) / 100
+
+    # --------------------------------------------------
+    # Generación
+    # --------------------------------------------------
+
+    def _create_organizations(self):
+        franchises = self._bulk(Franchise, [
+            Franchise(name=f"{self.prefix} Franquicia {i:03d}") for i in range(self.opts["franchises"])
+        ])
+        gyms = [
+            Gym(name=f"{self.prefix} Centro {i:04d}", commercial_name=f"{self.prefix} Fit {i:04d}",
+                franchise=franchises[i % len(franchises)], city="Madrid")
+            for i in range(self.opts["gyms"])
+        ]
+        return self._bulk(Gym, gyms)
+
+    def _populate_gym(self, gym, rng):
+        days_back = self.months * 30
+
+        # Finanzas
+        taxes = self._bulk(TaxRate, [
+            TaxRate(gym=gym, name="IVA 21%", rate_percent=Decimal("21.00")),
+            TaxRate(gym=gym, name="IVA 10%", rate_percent=Decimal("10.00")),
+        ])
+        methods = self._bulk(PaymentMethod, [
+            PaymentMethod(gym=gym, name="Efectivo", is_cash=True),
+            PaymentMethod(gym=gym, name="Tarjeta"),
+            PaymentMethod(gym=gym, name="Stripe", provider_code="stripe"),
+        ])
+
+        # Staff
+        users = self._bulk(User, [
+            User(email=f"{self.prefix.lower()}-{gym.pk}-{i}@example.com", first_name=rng.choice(FIRST_NAMES),
+                 last_name=rng.choice(LAST_NAMES), password=self.password)
+            for i in range(self.opts["staff_per_gym"])
+        ])
+        self._bulk(GymMembership, [
+            GymMembership(user=u, gym=gym, role=GymMembership.Role.ADMIN if i == 0 else GymMembership.Role.STAFF)
+            for i, u in enumerate(users)
+        ])
+        staff = self._bulk(StaffProfile, [
+            StaffProfile(user=u, gym=gym, role=rng.choice(StaffProfile.Role.values)) for u in users
+        ])
+        rule = self._bulk(IncentiveRule, [
+            IncentiveRule(gym=gym, name="Comisión 5%", type=IncentiveRule.Type.SALE_PCT, value=Decimal("5.00"))
+        ])[0]
+
+        # Catálogo
+        p_categories = self._bulk(ProductCategory, [ProductCategory(gym=gym, name=n) for n in ("Nutrición", "Textil", "Accesorios", "Bebidas")])
+        products = self._bulk(Product, [
+            Product(
+                gym=gym, name=f"{rng.choice(PRODUCT_WORDS)} {i:04d}", category=rng.choice(p_categories),
+                sku=f"{gym.pk:04d}{i:08d}", base_price=self._price(rng, 1, 80), cost_price=self._price(rng, 1, 30),
+                tax_rate=rng.choice(taxes), stock_quantity=rng.randrange(0, 200),
+                supplier_name=f"Proveedor {rng.randrange(10)}",
+            )
+            for i in range(self.opts["products_per_gym"])
+        ])
+        s_categories = self._bulk(ServiceCategory, [ServiceCategory(gym=gym, name=n) for n in ("Entrenamiento", "Fisioterapia")])
+        services = self._bulk(Service, [
+            Service(gym=gym, name=f"Servicio {i:03d}", category=rng.choice(s_categories),
+                    base_price=self._price(rng, 15, 90), tax_rate=taxes[0], duration=rng.choice((30, 45, 60)))
+            for i in range(self.opts["services_per_gym"])
+        ])
+        plans = self._bulk(MembershipPlan, [
+            MembershipPlan(gym=gym, name=f"Plan {i:02d}", base_price=self._price(rng, 20, 120), tax_rate=taxes[0],
+                           frequency_unit=rng.choice(("MONTH", "YEAR")))
+            for i in range(self.opts["plans_per_gym"])
+        ])
+
+        # Actividades y horarios
+        rooms = self._bulk(Room, [Room(gym=gym, name=f"Sala {i + 1}", capacity=rng.choice((15, 20, 30))) for i in range(3)])
+        a_category = self._bulk(ActivityCategory, [ActivityCategory(gym=gym, name="Colectivas")])[0]
+        activities = self._bulk(Activity, [
+            Activity(gym=gym, category=a_category, name=name, base_capacity=20, duration=60)
+            for name in ACTIVITY_NAMES
+        ])
+        horizon_start = self.anchor - timedelta(weeks=self.opts["weeks"])
+        with explicit_timestamps((ScheduleRule, "start_date")):
+            rules = self._bulk(ScheduleRule, [
+                ScheduleRule(gym=gym, activity=activity, room=rng.choice(rooms), staff=rng.choice(staff),
+                             day_of_week=day, start_time=dtime(hour=hour), end_time=dtime(hour=hour, minute=55),
+                             start_date=horizon_start)
+                for activity in activities
+                for day, hour in {(rng.randrange(7), rng.randrange(8, 21)) for _ in range(3)}
+            ])
+        sessions = []
+        for offset in range(self.opts["weeks"] * 7):
+            day = horizon_start + timedelta(days=offset)
+            for r in rules:
+                if r.day_of_week == day.weekday():
+                    start = timezone.make_aware(datetime.combine(day, r.start_time), self.tz)
+                    sessions.append(ActivitySession(
+                        gym=gym, activity=r.activity, rule=r, room=r.room, staff=r.staff,
+                        start_datetime=start, end_datetime=start + timedelta(minutes=55),
+                        max_capacity=r.room.capacity,
+                        status="COMPLETED" if day < self.anchor else "SCHEDULED",
+                    ))
+        sessions = self._bulk(ActivitySession, sessions)
+
+        # Marketing
+        templates = self._bulk(EmailTemplate, [EmailTemplate(gym=gym, name="Newsletter", content_html="<p>Hola</p>")])
+        self._bulk(Campaign, [
+            Campaign(gym=gym, name=f"Campaña {i:03d}", subject="Novedades", template=templates[0],
+                     status=Campaign.Status.SENT, sent_count=rng.randrange(100, 5000),
+                     scheduled_at=self._random_dt(rng, days_back))
+            for i in range(self.opts["campaigns_per_gym"])
+        ])
+
+        # Clientes y actividad (por lotes para acotar memoria)
+        catalog = (
+            [(p, self.content_types[Product]) for p in products]
+            + [(s, self.content_types[Service]) for s in services]
+            + [(p, self.content_types[MembershipPlan]) for p in plans]
+        )
+        tax_by_id = {t.pk: t.rate_percent for t in taxes}
+        context = dict(gym=gym, users=users, staff=staff, rule=rule, methods=methods, plans=plans,
+                       catalog=catalog, tax_by_id=tax_by_id, sessions=sessions, days_back=days_back)
+        remaining = self.opts["clients_per_gym"]
+        offset = 0
+        while remaining > 0:
+            size = min(self.batch_size, remaining)
+            self._populate_clients(rng, offset, size, **context)
+            offset += size
+            remaining -= size
+
+    def _populate_clients(self, rng, offset, size, gym, users, staff, rule, methods, plans, catalog,
+                          tax_by_id, sessions, days_back):
+        statuses = [Client.Status.ACTIVE] * 6 + [Client.Status.INACTIVE] * 2 + [Client.Status.LEAD, Client.Status.PAUSED]
+        with explicit_timestamps((Client, "created_at"), (Client, "updated_at")):
+            clients = []
+            for i in range(offset, offset + size):
+                joined = self._random_dt(rng, days_back)
+                first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+                clients.append(Client(
+                    gym=gym, status=rng.choice(statuses), first_name=first, last_name=last,
+                    email=f"cliente{i}.g{gym.pk}@example.com", phone_number=f"6{rng.randrange(10**8):08d}",
+                    dni=f"{rng.randrange(10**8):08d}{rng.choice('TRWAGMYFPDXBNJZSQVHLCKE')}",
+                    access_code=f"{gym.pk:04d}{i:07d}", created_at=joined, updated_at=joined,
+                ))
+            clients = self._bulk(Client, clients)
+
+        memberships, visits = [], []
+        for client in clients:
+            if client.status in (Client.Status.ACTIVE, Client.Status.PAUSED):
+                plan = rng.choice(plans)
+                start = client.created_at.date()
+                memberships.append(ClientMembership(
+                    client=client, name=plan.name, start_date=start, end_date=self.anchor + timedelta(days=rng.randrange(1, 30)),
+                    price=plan.base_price,
+                ))
+            for _ in range(rng.randrange(self.opts["visits_per_client"] * 2 + 1)):
+                when = self._random_dt(rng, days_back, not_before=client.created_at.date())
+                visits.append(ClientVisit(client=client, staff=rng.choice(staff), date=when.date(),
+                                          check_in_time=when.time(), concept="Acceso Libre"))
+        self._bulk(ClientMembership, memberships)
+        self._bulk(ClientVisit, visits)
+
+        # Asistentes a clases pasadas
+        Attendee = ActivitySession.attendees.through
+        active = [c for c in clients if c.status == Client.Status.ACTIVE]
+        attendees = []
+        if active:
+            for session in rng.sample(sessions, min(len(sessions), len(active))):
+                for client in rng.sample(active, min(len(active), rng.randrange(session.max_capacity + 1))):
+                    attendees.append(Attendee(activitysession_id=session.pk, client_id=client.pk))
+        self._bulk(Attendee, attendees)
+
+        # Ventas
+        orders, order_lines = [], []
+        for client in clients:
+            for _ in range(rng.randrange(self.opts["orders_per_client"] * 2 + 1)):
+                lines = []
+                total = base = tax = Decimal(0)
+                for _ in range(rng.choice((1, 1, 1, 2, 3))):
+                    obj, ct = rng.choice(catalog)
+                    qty = rng.choice((1, 1, 1, 2))
+                    rate = tax_by_id.get(obj.tax_rate_id, Decimal(0))
+                    unit = obj.base_price
+                    if obj.price_strategy == "TAX_EXCLUDED":
+                        unit = (unit * (1 + rate / 100)).quantize(CENT, ROUND_HALF_UP)
+                    subtotal = unit * qty
+                    line_base = (subtotal / (1 + rate / 100)).quantize(CENT, ROUND_HALF_UP)
+                    lines.append(OrderItem(content_type=ct, object_id=obj.pk, description=obj.name, quantity=qty,
+                                           unit_price=unit, tax_rate=rate, subtotal=subtotal))
+                    total += subtotal
+                    base += line_base
+                    tax += subtotal - line_base
+                created = self._random_dt(rng, days_back, not_before=client.created_at.date())
+                status = rng.choices(("PAID", "PENDING", "CANCELLED"), weights=(92, 5, 3))[0]
+                orders.append(Order(gym=gym, client=client, status=status, created_by=rng.choice(users),
+                                    total_amount=total, total_base=base, total_tax=tax,
+                                    created_at=created, updated_at=created))
+                order_lines.append(lines)
+
+        with explicit_timestamps((Order, "created_at"), (Order, "updated_at")):
+            orders = self._bulk(Order, orders)
+
+        items, payments, commissions = [], [], []
+        staff_by_user = {s.user_id: s for s in staff}
+        for order, lines in zip(orders, order_lines):
+            for line in lines:
+                line.order = order
+                items.append(line)
+            if order.status == "PAID":
+                payments.append(OrderPayment(order=order, payment_method=rng.choice(methods), amount=order.total_amount))
+                commission = (order.total_amount * rule.value / 100).quantize(CENT, ROUND_HALF_UP)
+                commissions.append(StaffCommission(staff=staff_by_user[order.created_by_id], rule=rule,
+                                                   concept=f"Comisión por venta: Ticket #{order.pk}",
+                                                   amount=commission, date=order.created_at))
+        self._bulk(OrderItem, items)
+        self._bulk(OrderPayment, payments)
+        with explicit_timestamps((StaffCommission, "date")):
+            self._bulk(StaffCommission, commissions)
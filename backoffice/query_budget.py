@@ -0,0 +1,233 @@
+"""
+Instrumentación SQL por vista (opt-in).
+
+- QueryBudgetMiddleware: cuenta queries, tiempo de BD y SQL repetido (N+1) de
+  cada request, escribe una línea de log estructurada y alimenta un resumen
+  en memoria (ver backoffice.views.sql_stats).
+- Presupuestos por vista en settings.SQL_QUERY_BUDGETS, p.ej.
+  {"sales.api.search_products": 4}.
+- Para tests: QueryBudgetTestMixin.assertWithinQueryBudget(response) y
+  el context manager assert_query_budget(n).
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+MIDDLEWARE_PATH = "backoffice.query_budget.QueryBudgetMiddleware"
+
+DEFAULT_DUPLICATE_THRESHOLD = 3
+ROLLING_WINDOW = 200
+
+_STRING_RE = re.compile(r"'(?:''|[^'])*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\bIN\s*\([^()]*\)", re.IGNORECASE)
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_sql(sql):
+    """Quita literales y listas IN para que las queries 'iguales' compartan huella."""
+    sql = _STRING_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("IN (...)", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    return _WS_RE.sub(" ", sql).strip()
+
+
+def fingerprint(sql):
+    return hashlib.md5(normalize_sql(sql).encode("utf-8")).hexdigest()[:12]
+
+
+def duplicate_threshold():
+    return getattr(settings, "SQL_DUPLICATE_THRESHOLD", DEFAULT_DUPLICATE_THRESHOLD)
+
+
+def budget_for(view_name):
+    return getattr(settings, "SQL_QUERY_BUDGETS", {}).get(view_name)
+
+
+class QueryRecorder:
+    """execute_wrapper que acumula número de queries, tiempo y huellas."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.samples = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            fp = fingerprint(sql)
+            self.fingerprints[fp] += 1
+            self.samples.setdefault(fp, sql)
+
+    @contextmanager
+    def record(self, using=None):
+        aliases = [using] if using else list(connections)
+        with ExitStack() as stack:
+            for alias in aliases:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield self
+
+    def duplicates(self, threshold=None):
+        threshold = threshold or duplicate_threshold()
+        return [
+            {"fingerprint": fp, "count": n, "sql": normalize_sql(self.samples[fp])}
+            for fp, n in self.fingerprints.most_common()
+            if n >= threshold
+        ]
+
+    def report(self, view_name=None, budget=None):
+        return {
+            "view": view_name,
+            "queries": self.count,
+            "db_ms": round(self.duration * 1000, 2),
+            "budget": budget,
+            "over_budget": budget is not None and self.count > budget,
+            "duplicates": self.duplicates(),
+        }
+
+
+# --------------------------------------------------
+# Resumen en memoria (por proceso)
+# --------------------------------------------------
+
+_summary_lock = threading.Lock()
+_summary = defaultdict(lambda: deque(maxlen=ROLLING_WINDOW))
+
+
+def record_report(report):
+    with _summary_lock:
+        _summary[report["view"]].append(report)
+
+
+def reset_summary():
+    with _summary_lock:
+        _summary.clear()
+
+
+def get_summary():
+    """Agregado de las últimas ROLLING_WINDOW requests de cada vista."""
+    with _summary_lock:
+        snapshot = {view: list(reports) for view, reports in _summary.items()}
+
+    summary = {}
+    for view, reports in snapshot.items():
+        queries = sorted(r["queries"] for r in reports)
+        duplicates = Counter()
+        for r in reports:
+            for d in r["duplicates"]:
+                duplicates[d["sql"]] += 1
+        summary[view] = {
+            "requests": len(reports),
+            "budget": budget_for(view),
+            "over_budget": sum(1 for r in reports if r["over_budget"]),
+            "queries_avg": round(sum(queries) / len(queries), 2),
+            "queries_p95": queries[min(len(queries) - 1, int(len(queries) * 0.95))],
+            "queries_max": queries[-1],
+            "db_ms_avg": round(sum(r["db_ms"] for r in reports) / len(reports), 2),
+            "n_plus_one": [{"sql": sql, "requests": n} for sql, n in duplicates.most_common(5)],
+        }
+    return summary
+
+
+# --------------------------------------------------
+# Middleware
+# --------------------------------------------------
+
+class QueryBudgetMiddleware:
+    """
+    Debe ir al final de MIDDLEWARE: así solo mide la vista (no sesión/auth).
+    Se activa con DJANGO_SQL_INSTRUMENTATION=True (ver config/settings.py).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+
+        match = getattr(request, "resolver_match", None)
+        view_name = match._func_path if match else request.path
+        report = recorder.report(view_name, budget_for(view_name))
+        report["path"] = request.path
+        report["status"] = response.status_code
+
+        record_report(report)
+        level = logging.WARNING if report["over_budget"] or report["duplicates"] else logging.INFO
+        logger.log(level, "sql_budget %s", json.dumps(report, default=str))
+
+        response.sql_report = report
+        return response
+
+
+# --------------------------------------------------
+# Helpers de test
+# --------------------------------------------------
+
+class QueryBudgetTestMixin:
+    """
+    Activa el middleware en el TestCase y ofrece assertWithinQueryBudget:
+
+        response = self.client.get(url)
+        self.assertWithinQueryBudget(response)  # usa SQL_QUERY_BUDGETS
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        from django.test.utils import modify_settings
+
+        super().setUpClass()
+        cls._query_budget_override = modify_settings(MIDDLEWARE={"append": MIDDLEWARE_PATH})
+        cls._query_budget_override.enable()
+        # Sin una línea sql_budget por request en la salida de los tests
+        cls._query_budget_log_level = logger.level
+        logger.setLevel(logging.ERROR)
+
+    @classmethod
+    def tearDownClass(cls):
+        logger.setLevel(cls._query_budget_log_level)
+        cls._query_budget_override.disable()
+        super().tearDownClass()
+
+    def assertWithinQueryBudget(self, response, budget=None):
+        report = getattr(response, "sql_report", None)
+        if report is None:
+            self.fail("La respuesta no pasó por QueryBudgetMiddleware")
+        budget = budget if budget is not None else report["budget"]
+        if budget is None:
+            self.fail(f"No hay presupuesto SQL declarado para {report['view']}")
+        if report["queries"] > budget:
+            self.fail(_budget_message(report["view"], report["queries"], budget, report["duplicates"]))
+
+
+@contextmanager
+def assert_query_budget(budget, label="bloque", using=None):
+    """Falla si el bloque ejecuta más de `budget` queries (útil fuera de vistas)."""
+    recorder = QueryRecorder()
+    with recorder.record(using=using):
+        yield recorder
+    if recorder.count > budget:
+        raise AssertionError(_budget_message(label, recorder.count, budget, recorder.duplicates()))
+
+
+def _budget_message(label, count, budget, duplicates):
+    lines = [f"{label}: {count} queries (presupuesto {budget})"]
+    for d in duplicates:
+        lines.append(f"  x{d['count']} {d['sql']}")
+    return "\n".join(lines)
@@ -1,3 +1,159 @@
-from django.test import TestCase
+import time
+from contextlib import ExitStack
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.sessions.models import Session
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+
+from backoffice.benchmarks import compare, measure
+from config.db_routers import (
+    REPLICA_ALIAS,
+    SESSION_PRIMARY_UNTIL_KEY,
+    PrimaryReplicaRouter,
+    ReplicaStickinessMiddleware,
+    pinned_to_primary,
+    reads_from_replica,
+    replica_reads,
+    use_replica,
+)
+from organizations.models import Franchise
+from sales.models import Order
+
+
+class BenchmarkCompareTest(SimpleTestCase):
+    def _report(self, **metrics):
+        result = {"p50_ms": 10.0, "p95_ms": 20.0, "peak_kib": 100.0, "queries": 4, "status": [200], "ok": True}
+        result.update(metrics)
+        return {"results": {"sales.api.search_products": result}}
+
+    def test_within_threshold(self):
+        self.assertEqual(compare(self._report(p95_ms=23.0), self._report(), threshold=0.2), [])
+
+    def test_flags_latency_and_queries(self):
+        regressions = compare(self._report(p95_ms=30.0, queries=5), self._report(), threshold=0.2)
+        self.assertEqual({r["metric"] for r in regressions}, {"p95_ms", "queries"})
+
+
+class BenchmarkMeasureTest(TestCase):
+    def test_only_write_scenarios_roll_back(self):
+        names = (f"Bench {i}" for i in range(10))
+        create = lambda: Franchise.objects.create(name=next(names))
+        measure(create, iterations=2, warmup=1, rollback=True)
+        self.assertFalse(Franchise.objects.filter(name__startswith="Bench").exists())
+
+        # Las lecturas no van en atomic(): si no, el router nunca las manda a la réplica
+        result = measure(create, iterations=2, warmup=1)
+        self.assertEqual(Franchise.objects.filter(name__startswith="Bench").count(), 4)
+        self.assertEqual(result["queries"], 1)
+
+
+class ReplicaRoutingTest(TestCase):
+    def _request(self):
+        request = RequestFactory().post("/")
+        request.session = {}
+        return request
+
+    def test_use_replica_unless_pinned(self):
+        seen = []
+        view = use_replica(lambda request: seen.append(reads_from_replica()))
+
+        request = self._request()
+        view(request)
+        request.session[SESSION_PRIMARY_UNTIL_KEY] = time.time() + 60
+        view(request)
+        self.assertEqual(seen, [True, False])
+        self.assertFalse(reads_from_replica())
+
+    def test_router_keeps_writes_and_sessions_on_primary(self):
+        router = PrimaryReplicaRouter()
+        with mock.patch("config.db_routers.replica_configured", return_value=True), replica_reads():
+            self.assertEqual(router.db_for_write(Order), "default")
+            self.assertIsNone(router.db_for_read(Session))
+            # TestCase envuelve cada test en una transacción: se lee de primario
+            self.assertIsNone(router.db_for_read(Order))
+
+    def test_write_pins_session_to_primary(self):
+        def get_response(request):
+            Franchise.objects.create(name="Nueva")
+            return HttpResponse()
+
+        request = self._request()
+        with mock.patch("config.db_routers.replica_configured", return_value=True):
+            ReplicaStickinessMiddleware(get_response)(request)
+        self.assertTrue(pinned_to_primary(request))
+
+
+@use_replica
+def _orders_report(request):
+    return list(Order.objects.all())
+
+
+class MirroredReplicaTest(TransactionTestCase):
+    # TransactionTestCase: dentro de la transacción de TestCase todo se lee de primario.
+    # "__all__" se resuelve en setUpClass, después de añadir la réplica si falta
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls):
+        # Sin réplica en DATABASES, un alias espejo de la BD de test de `default`
+        if REPLICA_ALIAS not in connections.settings:
+            connections.settings[REPLICA_ALIAS] = {
+                **connections[DEFAULT_DB_ALIAS].settings_dict, "TEST": {"MIRROR": DEFAULT_DB_ALIAS},
+            }
+            cls.addClassCleanup(cls._drop_replica)
+        super().setUpClass()
+
+    @classmethod
+    def _drop_replica(cls):
+        connections[REPLICA_ALIAS].close()
+        del connections[REPLICA_ALIAS]
+        del connections.settings[REPLICA_ALIAS]
+
+    def setUp(self):
+        patcher = mock.patch("config.db_routers.replica_configured", return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _request(self):
+        request = RequestFactory().get("/")
+        request.session = {}
+        return request
+
+    def _aliases(self, fn, request):
+        """Aliases contra los que fn(request) ejecuta SQL."""
+        used = []
+
+        def recorder(alias):
+            def record(execute, sql, params, many, context):
+                used.append(alias)
+                return execute(sql, params, many, context)
+            return record
+
+        with ExitStack() as stack:
+            for alias in (DEFAULT_DB_ALIAS, REPLICA_ALIAS):
+                stack.enter_context(connections[alias].execute_wrapper(recorder(alias)))
+            fn(request)
+        return used
+
+    def test_use_replica_reads_from_replica(self):
+        self.assertEqual(self._aliases(_orders_report, self._request()), ["replica"])
+
+    def test_reads_stick_to_primary_after_write(self):
+        def write(request):
+            Franchise.objects.create(name="Nueva")
+            return HttpResponse()
+
+        request = self._request()
+        ReplicaStickinessMiddleware(write)(request)
+        self.assertEqual(self._aliases(_orders_report, request), ["default"])
+
+    def test_reads_inside_atomic_stay_on_primary(self):
+        @use_replica
+        def view(request):
+            with transaction.atomic():
+                Franchise.objects.create(name="Nueva")
+                return Order.objects.count()
+
+        self.assertEqual(set(self._aliases(view, self._request())), {"default"})
@@ -31,4 +31,8 @@ urlpatterns = [
     path("clients/<int:client_id>/stripe-setup/", client_get_stripe_setup, name="client_get_stripe_setup"),
     
     path("staff/", views.staff_page, name="staff"),
+
+    # Diagnóstico (admin)
+    path("internal/sql-stats/", views.sql_stats, name="sql_stats"),
+    path("internal/cache-stats/", views.cache_stats, name="cache_stats"),
 ]
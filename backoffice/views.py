@@ -1,11 +1,12 @@
 from django.contrib.auth import authenticate, login, logout
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.shortcuts import redirect, render
 from django.views.decorators.http import require_POST
 
-from organizations.models import Gym
-from accounts.services import user_gym_ids
+from accounts.services import allowed_gym_ids, current_gym
+from config.db_routers import use_replica
 
 
 def login_view(request):
@@ -32,9 +33,9 @@ def logout_view(request):
 
 
 @login_required
+@use_replica
 def home(request):
-    gym_id = request.session.get("current_gym_id")
-    gym = Gym.objects.filter(id=gym_id).first()
+    gym = current_gym(request)
     
     # Dashboard Stats
     from .dashboard_service import DashboardService
@@ -42,12 +43,14 @@ def home(request):
     stats = dashboard.get_kpi_stats()
     risk_clients = dashboard.get_risk_clients()
     top_clients = dashboard.get_top_clients()
+    reorder = dashboard.get_reorder_list()
     
     context = {
         "gym": gym,
         "stats": stats,
         "risk_clients": risk_clients,
         "top_clients": top_clients,
+        "reorder": reorder,
     }
     return render(request, "backoffice/dashboard.html", context)
 
@@ -55,7 +58,7 @@ def home(request):
 @login_required
 def whoami(request):
     gym_id = request.session.get("current_gym_id")
-    gym = Gym.objects.filter(id=gym_id).first()
+    gym = current_gym(request)
     return JsonResponse({
         "user": request.user.email,
         "current_gym_id": gym_id,
@@ -72,7 +75,7 @@ def select_gym(request):
     except (TypeError, ValueError):
         return redirect("home")
 
-    allowed_ids = set(user_gym_ids(request.user))
+    allowed_ids = set(allowed_gym_ids(request))
     if gym_id_int in allowed_ids:
         request.session["current_gym_id"] = gym_id_int
 
@@ -94,3 +97,17 @@ def staff_page(request):
 @require_gym_permission("marketing.view")
 def marketing_page(request):
     return render(request, "backoffice/marketing/list.html")
+
+
+@staff_member_required
+def sql_stats(request):
+    """Resumen de la instrumentación SQL por vista (solo admins)."""
+    from .query_budget import get_summary
+    return JsonResponse(get_summary())
+
+
+@staff_member_required
+def cache_stats(request):
+    """Aciertos/fallos de la caché por gym (organizations.tenant_cache) de este proceso."""
+    from organizations.tenant_cache import stats
+    return JsonResponse(stats())
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0006_client_stripe_customer_id'),
+        ('organizations', '0004_gym_facebook_gym_instagram_gym_tiktok_gym_youtube'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['gym', 'status'], name='client_gym_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['gym', 'created_at'], name='client_gym_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clientmembership',
+            index=models.Index(fields=['client', 'status'], name='membership_client_status_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+from django.db import migrations
+
+# Tiene que coincidir con clients.search.document_sql() para que se use el índice trigram
+DOCUMENT_SQL = (
+    "immutable_unaccent(lower("
+    "coalesce(first_name, '') || ' ' || coalesce(last_name, '') || ' ' || coalesce(email, '') || ' ' || "
+    "coalesce(phone_number, '') || ' ' || coalesce(dni, '') || ' ' || coalesce(access_code, '')"
+    "))"
+)
+
+# Solo PostgreSQL: en otros motores clients/search.py usa icontains.
+# unaccent() no es IMMUTABLE y no se puede usar en índices/columnas generadas;
+# immutable_unaccent la envuelve fijando el diccionario.
+FORWARD_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    """
+    CREATE OR REPLACE FUNCTION immutable_unaccent(text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+    """,
+    f"""
+    ALTER TABLE clients_client ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', {DOCUMENT_SQL})) STORED
+    """,
+    "CREATE INDEX client_search_vector_idx ON clients_client USING gin (search_vector)",
+    f"CREATE INDEX client_search_trgm_idx ON clients_client USING gin (({DOCUMENT_SQL}) gin_trgm_ops)",
+]
+
+BACKWARD_SQL = [
+    "DROP INDEX IF EXISTS client_search_trgm_idx",
+    "DROP INDEX IF EXISTS client_search_vector_idx",
+    "ALTER TABLE clients_client DROP COLUMN IF EXISTS search_vector",
+    "DROP FUNCTION IF EXISTS immutable_unaccent(text)",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "postgresql":
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0007_tenant_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run(FORWARD_SQL), _run(BACKWARD_SQL)),
+    ]
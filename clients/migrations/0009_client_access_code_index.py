@@ -0,0 +1,20 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0008_client_search'),
+        ('organizations', '0004_gym_facebook_gym_instagram_gym_tiktok_gym_youtube'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['gym', 'access_code'], name='client_gym_access_code_idx'),
+        ),
+    ]
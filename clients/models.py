@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from organizations.managers import TenantManager
 
 class ClientGroup(models.Model):
     """Grupos de clientes (ej: 'Mañanas', 'Empresas') con jerarquía"""
@@ -87,6 +88,15 @@ class Client(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TenantManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['gym', 'status'], name='client_gym_status_idx'),
+            models.Index(fields=['gym', 'created_at'], name='client_gym_created_idx'),
+            models.Index(fields=['gym', 'access_code'], name='client_gym_access_code_idx'),
+        ]
+
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.status})".strip()
 
@@ -146,6 +156,11 @@ class ClientMembership(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['client', 'status'], name='membership_client_status_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} - {self.client}"
 
@@ -0,0 +1,87 @@
+"""
+Búsqueda de clientes por texto (TPV, recepción, explorador de clientes).
+
+En PostgreSQL usa la columna `search_vector` (tsvector generado con nombre,
+apellidos, email, teléfono, DNI y código de acceso, sin acentos) y un índice
+trigram sobre el mismo texto; ambos con GIN (migración 0008_client_search).
+Se ordena por relevancia: rango full-text + similitud trigram.
+
+En otros motores (SQLite en tests) se mantiene el icontains de siempre.
+
+Uso:
+    clients = search_clients(Client.objects.for_gym(gym), "ana garc")
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_FIELDS = ("first_name", "last_name", "email", "phone_number", "dni", "access_code")
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+
+def uses_full_text(queryset):
+    return connections[queryset.db].vendor == "postgresql"
+
+
+def prefix_tsquery(query):
+    """'Ana Garc' -> "ana:* & garc:*" (solo palabras, sin operadores de tsquery)."""
+    return " & ".join(f"{token}:*" for token in _TOKEN_RE.findall(query.lower()))
+
+
+def document_sql(table, quote_name):
+    """
+    Mismo texto que indexa client_search_trgm_idx (tiene que coincidir para usar el índice),
+    con las columnas de `table`.
+    """
+    return "immutable_unaccent(lower({}))".format(
+        " || ' ' || ".join(f"coalesce({table}.{quote_name(f)}, '')" for f in SEARCH_FIELDS)
+    )
+
+
+def _escape_like(value):
+    return re.sub(r"([%_\\])", r"\\\1", value)
+
+
+def search_clients(queryset, query):
+    """Filtra el queryset de clientes por `query` y lo ordena por relevancia."""
+    query = (query or "").strip()
+    if not query:
+        return queryset
+
+    if not uses_full_text(queryset):
+        return _search_icontains(queryset, query)
+
+    tsquery = prefix_tsquery(query)
+    if not tsquery:
+        return _search_icontains(queryset, query)
+
+    quote_name = connections[queryset.db].ops.quote_name
+    table = quote_name(queryset.model._meta.db_table)
+    vector = f"{table}.{quote_name('search_vector')}"
+    document = document_sql(table, quote_name)
+    ts = "to_tsquery('simple', immutable_unaccent(%s))"
+    text = "immutable_unaccent(lower(%s))"
+    match = RawSQL(
+        f"({vector} @@ {ts} OR {document} LIKE '%%' || {text} || '%%')",
+        [tsquery, _escape_like(query)],
+        output_field=BooleanField(),
+    )
+    relevance = RawSQL(
+        f"ts_rank_cd({vector}, {ts}) + word_similarity({text}, {document})",
+        [tsquery, query],
+        output_field=FloatField(),
+    )
+    return queryset.filter(match).annotate(search_rank=relevance).order_by("-search_rank", "pk")
+
+
+def _search_icontains(queryset, query):
+    # Cada palabra tiene que aparecer en algún campo ("ana garc" -> nombre Ana, apellido García)
+    for token in query.split():
+        condition = Q()
+        for field in SEARCH_FIELDS:
+            condition |= Q(**{f"{field}__icontains": token})
+        queryset = queryset.filter(condition)
+    return queryset
@@ -1,3 +1,42 @@
-from django.test import TestCase
+from unittest import skipUnless
 
-# Create your tests here.
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from clients.models import Client
+from clients.search import prefix_tsquery, search_clients
+from organizations.models import Gym
+
+
+class ClientSearchTest(TestCase):
+    def setUp(self):
+        self.gym = Gym.objects.create(name="Centro")
+        self.ana = Client.objects.create(gym=self.gym, first_name="Ana", last_name="García", email="ana@example.com")
+        self.luis = Client.objects.create(gym=self.gym, first_name="Luis", last_name="Pérez",
+                                          phone_number="612345678", access_code="4455")
+
+    def test_every_word_must_match_some_field(self):
+        clients = Client.objects.for_gym(self.gym)
+        self.assertEqual(list(search_clients(clients, "ana garc")), [self.ana])
+        self.assertEqual(list(search_clients(clients, "612345")), [self.luis])
+        self.assertEqual(list(search_clients(clients, "4455")), [self.luis])
+        self.assertEqual(search_clients(clients, "ana luis").count(), 0)
+        self.assertEqual(search_clients(clients, "  ").count(), 2)
+
+
+    @skipUnless(connection.vendor == "postgresql", "search_vector y trigram solo existen en PostgreSQL")
+    def test_full_text_and_trigram(self):
+        clients = Client.objects.for_gym(self.gym)
+        # Sin acentos, por prefijo y por trozo de palabra (trigram)
+        self.assertEqual(list(search_clients(clients, "garcia")), [self.ana])
+        self.assertEqual(list(search_clients(clients, "ana garc")), [self.ana])
+        self.assertEqual(list(search_clients(clients, "2345")), [self.luis])
+        self.assertEqual(search_clients(clients, "ana luis").count(), 0)
+
+        self.assertGreater(search_clients(clients, "ana").get().search_rank, 0)
+
+
+class PrefixTsqueryTest(SimpleTestCase):
+    def test_strips_tsquery_operators(self):
+        self.assertEqual(prefix_tsquery("Ana  García"), "ana:* & garcía:*")
+        self.assertEqual(prefix_tsquery("a&b | !c:*"), "a:* & b:* & c:*")
@@ -1,20 +1,17 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from accounts.decorators import require_gym_permission
-from organizations.models import Gym
+from accounts.services import current_gym
 
 @login_required
 @require_gym_permission("clients.view")
 def clients_list(request):
-    gym_id = request.session.get("current_gym_id")
-    
     # Obtener clientes del gym actual
     # Usamos prefetch_related para tags y groups para evitar N+1 queries
     clients = []
-    if gym_id:
-        gym = Gym.objects.filter(id=gym_id).first()
-        if gym:
-            clients = gym.clients.all().prefetch_related("tags")
+    gym = current_gym(request)
+    if gym:
+        clients = gym.clients.all().prefetch_related("tags")
 
     context = {
         "clients": clients,
@@ -202,11 +199,7 @@ def client_add_document(request, client_id):
 @login_required
 @require_gym_permission("clients.create")
 def client_create(request):
-    gym_id = request.session.get("current_gym_id")
-    if not gym_id:
-        return redirect("home")
-    
-    gym = Gym.objects.filter(id=gym_id).first()
+    gym = current_gym(request)
     if not gym:
         return redirect("home")
 
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Under ASGI the Stripe/Redsys endpoints use the async views (sales/api_async.py)
+os.environ.setdefault('DJANGO_ASYNC_GATEWAY_VIEWS', 'True')
 
 application = get_asgi_application()
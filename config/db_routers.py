@@ -0,0 +1,138 @@
+"""
+Lecturas pesadas (informes, dashboard) contra la réplica `replica`.
+
+- @use_replica en una vista de solo lectura (o `with replica_reads():`) manda sus
+  SELECT a la réplica, si está configurada en DATABASES.
+- Las escrituras siempre van a `default`.
+- Tras una escritura, la sesión se queda en primario REPLICA_STICKY_SECONDS para
+  que el usuario vea sus propios cambios aunque la réplica vaya con retraso
+  (ReplicaStickinessMiddleware).
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = "replica"
+SESSION_PRIMARY_UNTIL_KEY = "db_primary_until"
+DEFAULT_STICKY_SECONDS = 5
+
+# Siempre en primario: la sesión recién escrita, y lo que alimenta cachés versionadas
+# (permisos, gyms) para no guardar datos con retraso bajo una versión nueva
+PRIMARY_ONLY_APPS = {"sessions", "accounts", "organizations"}
+
+_WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE")
+_SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+_replica_reads = ContextVar("replica_reads", default=False)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def reads_from_replica():
+    return _replica_reads.get()
+
+
+def sticky_seconds():
+    return getattr(settings, "REPLICA_STICKY_SECONDS", DEFAULT_STICKY_SECONDS)
+
+
+def pinned_to_primary(request):
+    session = getattr(request, "session", None)
+    if session is None:
+        return False
+    return session.get(SESSION_PRIMARY_UNTIL_KEY, 0) > time.time()
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def use_replica(view_func):
+    """Las lecturas de la vista van a la réplica, salvo que la sesión acabe de escribir."""
+    @wraps(view_func)
+    def _wrapped(request, *args, **kwargs):
+        with replica_reads(not pinned_to_primary(request)):
+            return view_func(request, *args, **kwargs)
+
+    return _wrapped
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not reads_from_replica() or not replica_configured():
+            return None
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return None
+        # Dentro de una transacción se lee lo que se está escribiendo
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Misma base de datos lógica
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Marca la sesión para leer de primario durante REPLICA_STICKY_SECONDS cuando la
+    request ha escrito en la base de datos. Debe ir después de SessionMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not replica_configured():
+            return self.get_response(request)
+
+        wrote = []
+
+        def detect_writes(execute, sql, params, many, context):
+            if not wrote and sql.lstrip().upper().startswith(_WRITE_PREFIXES):
+                wrote.append(True)
+            return execute(sql, params, many, context)
+
+        with connections[DEFAULT_DB_ALIAS].execute_wrapper(detect_writes):
+            response = self.get_response(request)
+
+        if wrote:
+            self.pin(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        # Las queries de las vistas async corren en otro hilo (sync_to_async) y el
+        # execute_wrapper no las ve: cualquier POST/PUT/DELETE correcto cuenta como escritura
+        if replica_configured() and request.method not in _SAFE_METHODS and response.status_code < 400:
+            await sync_to_async(self.pin)(request)
+        return response
+
+    def pin(self, request):
+        if hasattr(request, "session"):
+            request.session[SESSION_PRIMARY_UNTIL_KEY] = time.time() + sticky_seconds()
@@ -55,6 +55,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "config.db_routers.ReplicaStickinessMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 
@@ -62,11 +63,32 @@ MIDDLEWARE = [
     "accounts.middleware.CurrentGymMiddleware",
 ]
 
+# Instrumentación SQL por vista (opt-in, ver backoffice/query_budget.py).
+# Va al final para medir solo la vista.
+SQL_INSTRUMENTATION = os.getenv("DJANGO_SQL_INSTRUMENTATION", "False") == "True"
+if SQL_INSTRUMENTATION:
+    MIDDLEWARE.append("backoffice.query_budget.QueryBudgetMiddleware")
+
+# Máximo de queries por vista (nombre completo de la función)
+SQL_QUERY_BUDGETS = {
+    "sales.api.search_products": 4,
+    "sales.api.search_clients": 3,
+    "sales.api.process_sale": 12,
+    "activities.scheduler_api.get_calendar_events": 5,
+}
+# Repeticiones de la misma SQL a partir de las cuales se marca como N+1
+SQL_DUPLICATE_THRESHOLD = int(os.getenv("DJANGO_SQL_DUPLICATE_THRESHOLD", "3"))
+
 # --------------------------------------------------
-# URLS / WSGI
+# URLS / WSGI / ASGI
 # --------------------------------------------------
 ROOT_URLCONF = "config.urls"
 WSGI_APPLICATION = "config.wsgi.application"
+ASGI_APPLICATION = "config.asgi.application"
+
+# Vistas async para los endpoints que esperan a Stripe/Redsys (sales/api_async.py).
+# config/asgi.py lo activa por defecto; bajo WSGI se siguen usando las síncronas.
+ASYNC_GATEWAY_VIEWS = os.getenv("DJANGO_ASYNC_GATEWAY_VIEWS", "False") == "True"
 
 # --------------------------------------------------
 # TEMPLATES
@@ -103,6 +125,83 @@ DATABASES = {
     }
 }
 
+# Réplica de lectura opcional para informes/dashboard (ver config/db_routers.py).
+# En local vale otra base de datos cualquiera; en tests replica a `default`.
+if os.getenv("POSTGRES_REPLICA_HOST") or os.getenv("POSTGRES_REPLICA_DB"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": os.getenv("POSTGRES_REPLICA_DB", DATABASES["default"]["NAME"]),
+        "HOST": os.getenv("POSTGRES_REPLICA_HOST", DATABASES["default"]["HOST"]),
+        "PORT": os.getenv("POSTGRES_REPLICA_PORT", DATABASES["default"]["PORT"]),
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["config.db_routers.PrimaryReplicaRouter"]
+# Segundos que una sesión lee de primario después de escribir
+REPLICA_STICKY_SECONDS = int(os.getenv("DJANGO_REPLICA_STICKY_SECONDS", "5"))
+
+# --------------------------------------------------
+# CACHE
+# --------------------------------------------------
+# locmem (por proceso, por defecto), file o redis (cualquier servidor compatible)
+_CACHE_BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+    "redis": "django.core.cache.backends.redis.RedisCache",
+}
+_cache_backend = os.getenv("DJANGO_CACHE_BACKEND", "locmem")
+_cache_locations = {
+    "locmem": "webynd",
+    "file": str(BASE_DIR / ".cache"),
+    "redis": "redis://127.0.0.1:6379/1",
+}
+CACHES = {
+    "default": {
+        "BACKEND": _CACHE_BACKENDS[_cache_backend],
+        "LOCATION": os.getenv("DJANGO_CACHE_LOCATION", _cache_locations[_cache_backend]),
+        "KEY_PREFIX": os.getenv("DJANGO_CACHE_KEY_PREFIX", "webynd"),
+        "TIMEOUT": 60 * 15,
+    }
+}
+# Los permisos (accounts/permissions.py) solo se cachean entre requests si la caché
+# la comparten todos los workers: con locmem un permiso retirado seguiría valiendo
+# en los demás procesos hasta que caducase
+PERMISSIONS_SHARED_CACHE = _cache_backend != "locmem"
+
+# --------------------------------------------------
+# PAYMENT GATEWAYS
+# --------------------------------------------------
+# URLs sobreescribibles para apuntar a un servidor falso en tests/local
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "https://api.stripe.com")
+REDSYS_REST_URL = os.getenv("REDSYS_REST_URL") or None
+# Segundos que se fían un cliente de Stripe ya verificado y su lista de tarjetas
+# (finance/stripe_utils.py); los webhooks de Stripe los invalidan antes. Las
+# tarjetas solo se cachean en los gyms con secreto de webhook configurado
+STRIPE_CACHE_TTL = int(os.getenv("STRIPE_CACHE_TTL", "300"))
+# Timeout (s) y conexiones simultáneas del cliente HTTP async (finance/gateways.py)
+GATEWAY_TIMEOUT = int(os.getenv("GATEWAY_TIMEOUT", "30"))
+GATEWAY_MAX_CONNECTIONS = int(os.getenv("GATEWAY_MAX_CONNECTIONS", "200"))
+# Reembolsos al cancelar una venta (sales/refunds.py): segundos que la petición espera
+# a cada pasarela antes de responder (el reembolso sigue en segundo plano) e hilos del pool
+REFUND_DEADLINES = {
+    "stripe": float(os.getenv("REFUND_DEADLINE_STRIPE", "8")),
+    "redsys": float(os.getenv("REFUND_DEADLINE_REDSYS", "12")),
+}
+REFUND_MAX_WORKERS = int(os.getenv("REFUND_MAX_WORKERS", "8"))
+
+# --------------------------------------------------
+# INVOICING
+# --------------------------------------------------
+# Serie y formato con los que se crea el contador de cada gym/año (sales/invoicing.py)
+INVOICE_DEFAULT_SERIES = os.getenv("INVOICE_DEFAULT_SERIES", "F")
+INVOICE_NUMBER_FORMAT = os.getenv("INVOICE_NUMBER_FORMAT", "{series}-{year}-{number:06d}")
+
+# --------------------------------------------------
+# STOCK
+# --------------------------------------------------
+# True: el TPV rechaza (409) una venta que dejaría algún producto en negativo (products/stock.py)
+STOCK_PREVENT_OVERSELL = os.getenv("DJANGO_STOCK_PREVENT_OVERSELL", "False") == "True"
+
 # --------------------------------------------------
 # AUTH
 # --------------------------------------------------
@@ -136,6 +235,24 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# --------------------------------------------------
+# LOGGING
+# --------------------------------------------------
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "backoffice.query_budget": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
+    },
+}
+
 # --------------------------------------------------
 # DEFAULTS
 # --------------------------------------------------
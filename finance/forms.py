@@ -23,10 +23,11 @@ class PaymentMethodForm(forms.ModelForm):
 class FinanceSettingsForm(forms.ModelForm):
     class Meta:
         model = FinanceSettings
-        fields = ['stripe_public_key', 'stripe_secret_key', 'redsys_merchant_code', 'redsys_merchant_terminal', 'redsys_secret_key', 'redsys_environment', 'currency']
+        fields = ['stripe_public_key', 'stripe_secret_key', 'stripe_webhook_secret', 'redsys_merchant_code', 'redsys_merchant_terminal', 'redsys_secret_key', 'redsys_environment', 'currency']
         widgets = {
             'stripe_public_key': forms.TextInput(attrs={'class': 'w-full rounded-xl border-slate-200 text-sm', 'placeholder': 'pk_test_...'}),
             'stripe_secret_key': forms.PasswordInput(attrs={'class': 'w-full rounded-xl border-slate-200 text-sm', 'placeholder': 'sk_test_...', 'render_value': True}),
+            'stripe_webhook_secret': forms.PasswordInput(attrs={'class': 'w-full rounded-xl border-slate-200 text-sm', 'placeholder': 'whsec_...', 'render_value': True}),
             'redsys_merchant_code': forms.TextInput(attrs={'class': 'w-full rounded-xl border-slate-200 text-sm', 'placeholder': 'Ej: 999000888'}),
             'redsys_merchant_terminal': forms.TextInput(attrs={'class': 'w-full rounded-xl border-slate-200 text-sm', 'placeholder': '001'}),
             'redsys_secret_key': forms.PasswordInput(attrs={'class': 'w-full rounded-xl border-slate-200 text-sm', 'placeholder': 'sq7H...', 'render_value': True}),
@@ -0,0 +1,245 @@
+"""
+Async payment gateway calls (Stripe / Redsys) for the ASGI views in sales/api_async.py.
+
+HTTP goes through a pooled httpx.AsyncClient (one per event loop), so a worker can
+keep many gateway calls in flight. DB work is done with the ORM async API or
+sync_to_async. Gateway URLs come from settings (STRIPE_API_BASE, REDSYS_REST_URL),
+so tests can point them at a local fake server.
+
+All functions return (success, result) like stripe_utils / RedsysClient.
+"""
+import asyncio
+import logging
+import weakref
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import ClientRedsysToken
+from . import stripe_utils
+from .money import to_cents
+from .redsys_utils import get_redsys_client
+from .stripe_utils import get_keys
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STRIPE_API_BASE = "https://api.stripe.com"
+DEFAULT_TIMEOUT = 30  # Redsys allows up to 30s
+DEFAULT_MAX_CONNECTIONS = 200
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def _http():
+    """AsyncClient shared by every request running on this event loop."""
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        max_connections = getattr(settings, "GATEWAY_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS)
+        client = _clients[loop] = httpx.AsyncClient(
+            timeout=getattr(settings, "GATEWAY_TIMEOUT", DEFAULT_TIMEOUT),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+    return client
+
+
+async def aclose():
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+# --------------------------------------------------
+# Stripe (REST API, form-encoded)
+# --------------------------------------------------
+
+class StripeError(Exception):
+    pass
+
+
+def _form(data, prefix=None):
+    items = []
+    for key, value in (data or {}).items():
+        name = f"{prefix}[{key}]" if prefix else key
+        if isinstance(value, dict):
+            items.extend(_form(value, name))
+        elif isinstance(value, bool):
+            items.append((name, "true" if value else "false"))
+        elif value is not None:
+            items.append((name, str(value)))
+    return items
+
+
+async def _stripe(secret_key, method, path, data=None):
+    base = getattr(settings, "STRIPE_API_BASE", DEFAULT_STRIPE_API_BASE)
+    headers = {"Authorization": f"Bearer {secret_key}"}
+    if method == "GET":
+        kwargs = {"params": _form(data)}
+    else:
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+        kwargs = {"content": urlencode(_form(data))}
+    response = await _http().request(method, f"{base}/v1/{path}", headers=headers, **kwargs)
+    payload = response.json()
+    if response.status_code >= 400:
+        error = payload.get("error", {})
+        raise StripeError(error.get("message") or f"Stripe HTTP {response.status_code}")
+    return payload
+
+
+async def _stripe_secret(gym):
+    _, secret_key = await sync_to_async(get_keys)(gym)
+    return secret_key
+
+
+async def stripe_customer(client, secret_key):
+    """Async get_stripe_customer: reuses the stored customer or creates a new one."""
+    gym = await sync_to_async(lambda: client.gym)()
+    if client.stripe_customer_id:
+        # Same verified-customer cache as stripe_utils.get_stripe_customer
+        if await sync_to_async(stripe_utils.customer_verified)(gym, client.stripe_customer_id):
+            return client.stripe_customer_id
+        try:
+            customer = await _stripe(secret_key, "GET", f"customers/{client.stripe_customer_id}")
+            if not customer.get("deleted"):
+                await sync_to_async(stripe_utils.remember_customer)(gym, client.stripe_customer_id)
+                return client.stripe_customer_id
+        except StripeError:
+            pass  # Invalid ID, recreate
+
+    customer = await _stripe(secret_key, "POST", "customers", {
+        "email": client.email,
+        "name": f"{client.first_name} {client.last_name}",
+        "metadata": {"client_id": client.id, "gym_id": gym.id, "gym_name": gym.name},
+    })
+    client.stripe_customer_id = customer["id"]
+    await client.asave(update_fields=["stripe_customer_id"])
+    await sync_to_async(stripe_utils.remember_customer)(gym, customer["id"])
+    return customer["id"]
+
+
+async def list_payment_methods(client, gym):
+    secret_key = await _stripe_secret(gym)
+    if not secret_key or not client.stripe_customer_id:
+        return []
+    cached = await sync_to_async(stripe_utils.cached_cards)(gym, client.stripe_customer_id)
+    if cached is not None:
+        return cached
+    try:
+        result = await _stripe(secret_key, "GET", "payment_methods", {"customer": client.stripe_customer_id, "type": "card"})
+        await sync_to_async(stripe_utils.remember_cards)(gym, client.stripe_customer_id, result["data"])
+        return result["data"]
+    except Exception:
+        logger.exception("Error listing Stripe payment methods (gym %s)", gym.id)
+        return []
+
+
+async def stripe_charge(client, gym, amount_eur, payment_method_id, description="Venta"):
+    secret_key = await _stripe_secret(gym)
+    if not secret_key:
+        return False, "Stripe no configurado"
+
+    try:
+        customer_id = await stripe_customer(client, secret_key)
+        intent = await _stripe(secret_key, "POST", "payment_intents", {
+            "amount": to_cents(amount_eur),
+            "currency": "eur",
+            "customer": customer_id,
+            "payment_method": payment_method_id,
+            "off_session": True,
+            "confirm": True,
+            "description": description,
+            "return_url": "https://example.com/return",
+        })
+        return True, intent["id"]
+    except Exception as e:
+        return False, str(e)
+
+
+async def stripe_refund(gym, payment_intent_id, amount_eur=None):
+    if not payment_intent_id:
+        return False, "No ID de transacción"
+    secret_key = await _stripe_secret(gym)
+    if not secret_key:
+        return False, "Stripe no configurado"
+    try:
+        data = {"payment_intent": payment_intent_id}
+        if amount_eur:
+            data["amount"] = to_cents(amount_eur)
+        refund = await _stripe(secret_key, "POST", "refunds", data)
+        return True, refund["id"]
+    except Exception as e:
+        return False, str(e)
+
+
+# --------------------------------------------------
+# Redsys (REST)
+# --------------------------------------------------
+
+async def _redsys_post(redsys, payload):
+    response = await _http().post(redsys.url, json=payload)
+    response.raise_for_status()
+    return redsys.parse_operation_response(response.json())
+
+
+async def redsys_charge(client, gym, token_id, amount_eur, description=""):
+    """Charges a stored ClientRedsysToken. On success result is the Redsys order id."""
+    from .views_redsys import generate_order_id
+
+    try:
+        token = await ClientRedsysToken.objects.aget(id=token_id, client=client)
+        redsys = await sync_to_async(get_redsys_client)(gym)
+        if not redsys:
+            return False, "Redsys not configured"
+        order_id = generate_order_id()
+        success, result = await _redsys_post(redsys, redsys.charge_payload(order_id, float(amount_eur), token.token, description))
+        return (True, order_id) if success else (False, result)
+    except Exception as e:
+        return False, str(e)
+
+
+async def redsys_refund(gym, amount_eur, original_order_id):
+    from .views_redsys import generate_order_id
+
+    try:
+        redsys = await sync_to_async(get_redsys_client)(gym)
+        if not redsys:
+            return False, "Redsys not configured"
+        # A refund is a new transaction with its own order id
+        return await _redsys_post(redsys, redsys.refund_payload(generate_order_id(), float(amount_eur)))
+    except Exception as e:
+        return False, str(e)
+
+
+# --------------------------------------------------
+# Common
+# --------------------------------------------------
+
+async def charge(client, gym, provider, token, amount_eur, description="Venta"):
+    if provider == "stripe":
+        return await stripe_charge(client, gym, amount_eur, token, description)
+    if provider == "redsys":
+        return await redsys_charge(client, gym, token, amount_eur, description)
+    return False, f"Proveedor desconocido: {provider}"
+
+
+def provider_for_transaction(transaction_id):
+    """Same heuristic as order_cancel: Stripe ids start with pi_/ch_, Redsys ones are numeric."""
+    if not transaction_id:
+        return None
+    if transaction_id.startswith(("pi_", "ch_")):
+        return "stripe"
+    if transaction_id.isdigit():
+        return "redsys"
+    return None
+
+
+async def refund(gym, transaction_id, amount_eur):
+    provider = provider_for_transaction(transaction_id)
+    if provider == "stripe":
+        return await stripe_refund(gym, transaction_id, amount_eur)
+    if provider == "redsys":
+        return await redsys_refund(gym, amount_eur, transaction_id)
+    return False, "Proveedor desconocido"
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0005_alter_financesettings_options_clientredsystoken'),
+        ('organizations', '0004_gym_facebook_gym_instagram_gym_tiktok_gym_youtube'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cashsession',
+            index=models.Index(fields=['gym', 'opened_at'], name='cashsession_gym_opened_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0006_tenant_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='financesettings',
+            name='stripe_webhook_secret',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Stripe Webhook Secret'),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from organizations.models import Gym
+from organizations.managers import TenantManager
 
 class TaxRate(models.Model):
     """
@@ -15,6 +16,8 @@ class TaxRate(models.Model):
     def __str__(self):
         return f"{self.name} ({self.rate_percent}%)"
 
+    objects = TenantManager()
+
     class Meta:
         verbose_name = _("Impuesto")
         verbose_name_plural = _("Impuestos")
@@ -36,6 +39,8 @@ class PaymentMethod(models.Model):
     def __str__(self):
         return self.name
 
+    objects = TenantManager()
+
     class Meta:
         verbose_name = _("Método de Pago")
         verbose_name_plural = _("Métodos de Pago")
@@ -65,10 +70,15 @@ class CashSession(models.Model):
     notes = models.TextField(_("Notas de Cierre"), blank=True)
     is_closed = models.BooleanField(_("Cerrada"), default=False)
 
+    objects = TenantManager()
+
     class Meta:
         verbose_name = _("Sesión de Caja")
         verbose_name_plural = _("Sesiones de Caja")
         ordering = ['-opened_at']
+        indexes = [
+            models.Index(fields=['gym', 'opened_at'], name='cashsession_gym_opened_idx'),
+        ]
 
     def calculate_expected(self):
         """Helper to update expected balance"""
@@ -89,6 +99,8 @@ class FinanceSettings(models.Model):
     # Stripe Configuration
     stripe_public_key = models.CharField(_("Stripe Public Key"), max_length=255, blank=True)
     stripe_secret_key = models.CharField(_("Stripe Secret Key"), max_length=255, blank=True)
+    # Firma del endpoint de webhooks (finance/views_stripe.py)
+    stripe_webhook_secret = models.CharField(_("Stripe Webhook Secret"), max_length=255, blank=True)
     
     # Redsys
     redsys_merchant_code = models.CharField(_("FUC (Código de Comercio)"), max_length=255, blank=True)
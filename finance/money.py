@@ -0,0 +1,9 @@
+"""Importes para las pasarelas: euros (Decimal, float o str) a céntimos enteros."""
+from decimal import ROUND_HALF_UP, Decimal
+
+
+def to_cents(amount_eur):
+    """
+    19.99 -> 1999. Pasa por str: int(19.99 * 100) da 1998, el float se queda por debajo.
+    """
+    return int((Decimal(str(amount_eur)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
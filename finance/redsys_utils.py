@@ -2,8 +2,41 @@ import base64
 import json
 import hashlib
 import hmac
+import threading
+from functools import cached_property
+
+import requests
 from Crypto.Cipher import DES3
+from django.conf import settings as django_settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from organizations import tenant_cache
 from .models import FinanceSettings
+from .money import to_cents
+
+# Keep-alive connections per client (per gym). More concurrent calls than this
+# open extra connections that are not kept.
+POOL_MAXSIZE = 10
+# Only retry failures where the request never reached Redsys (connection
+# refused, DNS, TLS handshake): a charge or refund POST is not idempotent.
+CONNECT_RETRIES = 2
+RETRY_BACKOFF = 0.2
+REQUEST_TIMEOUT = 30  # Redsys allows up to 30s
+
+
+def _session():
+    session = requests.Session()
+    retry = Retry(
+        total=CONNECT_RETRIES, connect=CONNECT_RETRIES, read=0, status=0, other=0,
+        backoff_factor=RETRY_BACKOFF, allowed_methods=None, raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Content-Type'] = 'application/json'
+    return session
+
 
 class RedsysClient:
     def __init__(self, merchant_code, terminal, secret_key, environment='TEST'):
@@ -11,6 +44,8 @@ class RedsysClient:
         self.terminal = terminal
         self.secret_key = secret_key
         self.environment = environment
+        self._session = None
+        self._session_lock = threading.Lock()
         
         if environment == 'REAL':
             self.url = 'https://sis.redsys.es/sis/real/TrataPeticionREST'
@@ -20,13 +55,39 @@ class RedsysClient:
             self.url = 'https://sis-t.redsys.es:25443/sis/rest/trataPeticionREST'
             self.web_url = 'https://sis-t.redsys.es:25443/sis/real/VierualTPV/payment.jsp' # Check exact URL later
 
+        # Override (e.g. a local fake gateway in tests)
+        self.url = getattr(django_settings, 'REDSYS_REST_URL', None) or self.url
+
+    @cached_property
+    def key_bytes(self):
+        # Redsys secret key is Base64 encoded; decoded once per client
+        return base64.b64decode(self.secret_key)
+
+    @property
+    def session(self):
+        """requests.Session with keep-alive, shared by every call made through this client."""
+        with self._session_lock:
+            if self._session is None:
+                self._session = _session()
+            return self._session
+
+    def close(self):
+        with self._session_lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
+    def _post(self, payload, timeout=REQUEST_TIMEOUT):
+        response = self.session.post(self.url, json=payload, timeout=timeout)
+        response.raise_for_status()
+        return self.parse_operation_response(response.json())
+
     def _encrypt_3des(self, message, key):
         """
         Encrypts the message using 3DES (Triple DES)
         """
         # Ensure key is 24 bytes (Redsys keys are usually base64 encoded strings that decode to bytes)
-        # But Redsys secret key is Base64 encoded.
-        key_bytes = base64.b64decode(self.secret_key)
+        key_bytes = self.key_bytes
         
         # IV is zero-filled
         iv = b'\0\0\0\0\0\0\0\0'
@@ -66,7 +127,7 @@ class RedsysClient:
         """
         Creates the parameters for the Redsys request.
         """
-        amount_cents = int(amount_eur * 100)
+        amount_cents = to_cents(amount_eur)
         
         params = {
             "DS_MERCHANT_AMOUNT": str(amount_cents),
@@ -143,12 +204,56 @@ class RedsysClient:
                  
         return params
 
+    def parse_operation_response(self, resp_data):
+        """
+        Validates a REST operation response (charge/refund).
+        Returns (True, decoded_params) or (False, error_message).
+        """
+        # Decode response (it's encrypted/signed)
+        ds_params_b64 = resp_data.get('Ds_MerchantParameters')
+        ds_signature = resp_data.get('Ds_Signature')
+        
+        if not ds_params_b64:
+             return False, f"Invalid Response: {resp_data}"
+             
+        decoded = self.decode_response(ds_params_b64, ds_signature)
+        
+        # Check Response Code (OK codes are 0000-0099)
+        code = int(decoded.get('Ds_Response', 9999))
+        if 0 <= code <= 99:
+             return True, decoded
+        return False, f"Redsys Error {code}"
+
+    def charge_payload(self, order_id, amount_eur, token, description=''):
+        """Signed payload for a token charge (see charge_request)."""
+        params_dict = {
+            "DS_MERCHANT_IDENTIFIER": token,
+            "DS_MERCHANT_DIRECTPAYMENT": "true", # Important for background charge
+            "DS_MERCHANT_COF_INI": "N", # Not initial
+            "DS_MERCHANT_COF_TYPE": "C", # Customer Initiated (or R for Recurring)
+        }
+        return self.create_request_parameters(
+            order_id=order_id,
+            amount_eur=amount_eur,
+            transaction_type='0',
+            description=description,
+            other_params=params_dict
+        )
+
+    def refund_payload(self, order_id, amount_eur, description='Devolución'):
+        """Signed payload for a refund (Transaction Type '3')."""
+        return self.create_request_parameters(
+            order_id=order_id,
+            amount_eur=amount_eur,
+            transaction_type='3',
+            description=description
+        )
+
     def charge_request(self, order_id, amount_eur, token, description=''):
         """
         Performs a REST API call to charge a token (Pago por Referencia).
         Type L (Pago por Referencia).
         """
-        import requests
         
         # Params for Token Charge
         # DS_MERCHANT_TRANSACTIONTYPE = 'L' (Pago por Referencia / Recurring) Or '0' with Identifier?
@@ -167,55 +272,20 @@ class RedsysClient:
         # DS_MERCHANT_DIRECTPAYMENT = 'true' (This is important for REST to not redirect, but perform charge)
         # Note: 'true' string.
         
-        params_dict = {
-            "DS_MERCHANT_IDENTIFIER": token,
-            "DS_MERCHANT_DIRECTPAYMENT": "true", # Important for background charge
-            "DS_MERCHANT_COF_INI": "N", # Not initial
-            "DS_MERCHANT_COF_TYPE": "C", # Customer Initiated (or R for Recurring)
-        }
-        
-        payload = self.create_request_parameters(
-            order_id=order_id,
-            amount_eur=amount_eur,
-            transaction_type='0',
-            description=description,
-            other_params=params_dict
-        )
+        payload = self.charge_payload(order_id, amount_eur, token, description)
         
         try:
-            response = requests.post(self.url, json=payload, headers={'Content-Type': 'application/json'}, timeout=30)
-            response.raise_for_status()
-            
-            resp_data = response.json()
-            
-            # Decode response (it's encrypted/signed)
-            ds_params_b64 = resp_data.get('Ds_MerchantParameters')
-            ds_signature = resp_data.get('Ds_Signature')
-            
-            if not ds_params_b64:
-                 return False, f"Invalid Response: {resp_data}"
-                 
-            decoded = self.decode_response(ds_params_b64, ds_signature)
-            
-            # Check Response Code
-            code = int(decoded.get('Ds_Response', 9999))
-            if 0 <= code <= 99:
-                 return True, decoded
-            else:
-                 error_msg = f"Redsys Error {code}"
-                 # Add specific error mapping if needed
-                 return False, error_msg
+            return self._post(payload)
                  
         except Exception as e:
             return False, str(e)
 
-    def refund_request(self, order_id, amount_eur, original_order_id, description='Devolución'):
+    def refund_request(self, order_id, amount_eur, original_order_id, description='Devolución', timeout=REQUEST_TIMEOUT):
         """
         Performs a REFUND (Devolución) request.
         Transaction Type '3'.
         DS_MERCHANT_ORDER: New Order ID for the refund transaction itself.
         """
-        import requests
         
         # Original Order ID is needed? 
         # For Redsys Refund, you usually need the Original Order ID?
@@ -237,12 +307,8 @@ class RedsysClient:
         # Programmatic Refund:
         # DS_MERCHANT_TRANSACTIONTYPE = '3'
         
-        payload = self.create_request_parameters(
-            order_id=order_id, # Must be UNIQUE for this refund op
-            amount_eur=amount_eur,
-            transaction_type='3',
-            description=description
-        )
+        # order_id must be UNIQUE for this refund op
+        payload = self.refund_payload(order_id, amount_eur, description)
         
         # We might need to send original order ID in some field if not using Token?
         # If we have a Token (COF), we can refund to that Token.
@@ -250,31 +316,18 @@ class RedsysClient:
         # For now, let's assume we use the Token approach if available, or just try generic Refund if enabled.
         
         try:
-             response = requests.post(self.url, json=payload, headers={'Content-Type': 'application/json'}, timeout=30)
-             response.raise_for_status()
-             
-             resp_data = response.json()
-             
-             ds_params_b64 = resp_data.get('Ds_MerchantParameters')
-             ds_signature = resp_data.get('Ds_Signature')
-             
-             if not ds_params_b64:
-                  return False, f"Invalid Response: {resp_data}"
-                  
-             decoded = self.decode_response(ds_params_b64, ds_signature)
-             
-             code = int(decoded.get('Ds_Response', 9999))
-             # Refund OK codes usually 0000-0099
-             if 0 <= code <= 99:
-                  return True, decoded
-             else:
-                  return False, f"Redsys Error {code}"
+             return self._post(payload, timeout=timeout)
                   
         except Exception as e:
             return False, str(e)
 
 
-def get_redsys_client(gym):
+# Clients per gym, reused across requests: (version of the gym's payment settings, client or None)
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _build_client(gym):
     settings = FinanceSettings.objects.get(gym=gym)
     if not settings.redsys_merchant_code or not settings.redsys_secret_key:
         return None
@@ -285,3 +338,35 @@ def get_redsys_client(gym):
         secret_key=settings.redsys_secret_key,
         environment=settings.redsys_environment
     )
+
+
+def get_redsys_client(gym):
+    """
+    The gym's RedsysClient (None if Redsys is not configured), built once per process.
+    Saving FinanceSettings bumps the gym's "payments" namespace (organizations/signals.py),
+    which replaces the client on the next call.
+    """
+    gym_id = getattr(gym, 'pk', gym)
+    version = tenant_cache.namespace_version(gym_id, tenant_cache.PAYMENTS)
+    with _clients_lock:
+        entry = _clients.get(gym_id)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    client = _build_client(gym)
+    with _clients_lock:
+        old = _clients.get(gym_id)
+        _clients[gym_id] = (version, client)
+    if old is not None and old[1] is not None and old[1] is not client:
+        old[1].close()
+    return client
+
+
+def clear_clients():
+    """Closes and forgets every cached client (tests, or after a fork)."""
+    with _clients_lock:
+        entries = list(_clients.values())
+        _clients.clear()
+    for _, client in entries:
+        if client is not None:
+            client.close()
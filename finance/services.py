@@ -0,0 +1,11 @@
+from organizations import tenant_cache
+
+from .models import PaymentMethod
+
+
+def active_payment_methods(gym):
+    """Métodos de pago activos del gym (cacheados; se invalidan al guardar un PaymentMethod)."""
+    return tenant_cache.get_or_set(
+        gym, tenant_cache.PAYMENTS, "active",
+        lambda: list(PaymentMethod.objects.for_gym(gym).filter(is_active=True).order_by("pk")),
+    )
@@ -1,6 +1,23 @@
+import threading
+
 import stripe
 from django.conf import settings
+from organizations import tenant_cache
 from .models import FinanceSettings
+from .money import to_cents
+
+DEFAULT_STRIPE_API_BASE = "https://api.stripe.com"
+# Stripe retries only when it is safe to (it sends an Idempotency-Key on POSTs)
+MAX_NETWORK_RETRIES = 2
+DEFAULT_CACHE_TTL = 300  # seconds a verified customer / card list is trusted without a webhook
+
+# One HTTP client for every gym: a keep-alive requests.Session per thread
+_http_client = None
+_http_client_lock = threading.Lock()
+
+# StripeClient per gym, reused across requests: (version of the gym's payment settings, client or None)
+_clients = {}
+_clients_lock = threading.Lock()
 
 def get_keys(gym):
     """Retrieve Stripe keys for a Gym."""
@@ -10,39 +27,122 @@ def get_keys(gym):
     except FinanceSettings.DoesNotExist:
         return None, None
 
+def http_client():
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = stripe.RequestsClient()
+        return _http_client
+
+def _build_client(secret_key):
+    return stripe.StripeClient(
+        secret_key,
+        base_addresses={"api": getattr(settings, "STRIPE_API_BASE", DEFAULT_STRIPE_API_BASE)},
+        http_client=http_client(),
+        max_network_retries=MAX_NETWORK_RETRIES,
+    )
+
+def get_client(gym):
+    """
+    The gym's StripeClient (None if Stripe is not configured), built once per process.
+    The API key travels with each request instead of the global stripe.api_key, so
+    threads serving different gyms never see each other's key. Saving FinanceSettings
+    bumps the gym's "payments" namespace (organizations/signals.py), which replaces it.
+    """
+    version = tenant_cache.namespace_version(gym, tenant_cache.PAYMENTS)
+    with _clients_lock:
+        entry = _clients.get(gym.pk)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    _, secret_key = get_keys(gym)
+    client = _build_client(secret_key) if secret_key else None
+    with _clients_lock:
+        _clients[gym.pk] = (version, client)
+    return client
+
+def clear_clients():
+    with _clients_lock:
+        _clients.clear()
+
+# --------------------------------------------------
+# Cached lookups (tenant_cache "payments" namespace)
+# --------------------------------------------------
+# Customers and card lists change in Stripe, not here: webhooks
+# (finance/views_stripe.py) forget them as soon as Stripe reports a change. Card
+# lists are only cached for gyms with a webhook secret; without it a newly linked
+# card would stay hidden until the TTL expires.
+
+def cache_ttl():
+    return getattr(settings, "STRIPE_CACHE_TTL", DEFAULT_CACHE_TTL)
+
+def _customer_key(customer_id):
+    return f"stripe_customer:{customer_id}"
+
+def _cards_key(customer_id):
+    return f"stripe_cards:{customer_id}"
+
+def customer_verified(gym, customer_id):
+    return tenant_cache.get(gym, tenant_cache.PAYMENTS, _customer_key(customer_id), False)
+
+def remember_customer(gym, customer_id):
+    tenant_cache.set_value(gym, tenant_cache.PAYMENTS, _customer_key(customer_id), True, cache_ttl())
+
+def has_webhook(gym):
+    try:
+        return bool(gym.finance_settings.stripe_webhook_secret)
+    except FinanceSettings.DoesNotExist:
+        return False
+
+def cached_cards(gym, customer_id):
+    """Card list of a customer as plain dicts (API JSON), or None if not cached."""
+    if not has_webhook(gym):
+        return None
+    return tenant_cache.get(gym, tenant_cache.PAYMENTS, _cards_key(customer_id))
+
+def remember_cards(gym, customer_id, cards):
+    if has_webhook(gym):
+        tenant_cache.set_value(gym, tenant_cache.PAYMENTS, _cards_key(customer_id), cards, cache_ttl())
+
+def forget_customer(gym, customer_id, cards_only=False):
+    names = [_cards_key(customer_id)] if cards_only else [_cards_key(customer_id), _customer_key(customer_id)]
+    tenant_cache.delete(gym, tenant_cache.PAYMENTS, *names)
+
 def get_stripe_customer(client):
     """
     Get or create a Stripe Customer for the given Client.
     Returns the Stripe Customer ID.
     """
-    pub_key, secret_key = get_keys(client.gym)
-    if not secret_key:
+    stripe_client = get_client(client.gym)
+    if not stripe_client:
         raise ValueError("Stripe not configured for this gym.")
     
-    stripe.api_key = secret_key
-    
     if client.stripe_customer_id:
+        if customer_verified(client.gym, client.stripe_customer_id):
+            return client.stripe_customer_id
         try:
             # Verify it exists
-            customer = stripe.Customer.retrieve(client.stripe_customer_id)
-            if not customer.get('deleted'):
+            customer = stripe_client.v1.customers.retrieve(client.stripe_customer_id)
+            if not getattr(customer, 'deleted', False):
+                remember_customer(client.gym, client.stripe_customer_id)
                 return client.stripe_customer_id
         except stripe.error.InvalidRequestError:
             pass # Invalid ID, recreate
 
     # Create new customer
-    customer = stripe.Customer.create(
-        email=client.email,
-        name=f"{client.first_name} {client.last_name}",
-        metadata={
+    customer = stripe_client.v1.customers.create(params={
+        'email': client.email,
+        'name': f"{client.first_name} {client.last_name}",
+        'metadata': {
             'client_id': client.id,
             'gym_id': client.gym.id,
             'gym_name': client.gym.name
         }
-    )
+    })
     
     client.stripe_customer_id = customer.id
     client.save(update_fields=['stripe_customer_id'])
+    remember_customer(client.gym, customer.id)
     return customer.id
 
 def create_setup_intent(client):
@@ -50,39 +150,42 @@ def create_setup_intent(client):
     Create a SetupIntent for saving a card.
     Returns the client_secret.
     """
-    pub_key, secret_key = get_keys(client.gym)
-    if not secret_key:
+    stripe_client = get_client(client.gym)
+    if not stripe_client:
         raise ValueError("Stripe not configured.")
         
-    stripe.api_key = secret_key
     customer_id = get_stripe_customer(client)
     
-    intent = stripe.SetupIntent.create(
-        customer=customer_id,
-        payment_method_types=['card'],
-        usage='off_session', # Optimized for future payments
-    )
+    intent = stripe_client.v1.setup_intents.create(params={
+        'customer': customer_id,
+        'payment_method_types': ['card'],
+        'usage': 'off_session', # Optimized for future payments
+    })
+    # A card is about to be linked: don't keep showing the old list
+    forget_customer(client.gym, customer_id, cards_only=True)
     return intent.client_secret
 
 def list_payment_methods(client):
     """
     List saved cards for a client.
     """
-    pub_key, secret_key = get_keys(client.gym)
-    if not secret_key:
+    stripe_client = get_client(client.gym)
+    if not stripe_client:
         return []
 
-    stripe.api_key = secret_key
-    
     if not client.stripe_customer_id:
         return []
 
     try:
-        payment_methods = stripe.PaymentMethod.list(
-            customer=client.stripe_customer_id,
-            type="card"
-        )
-        return payment_methods.data
+        cards = cached_cards(client.gym, client.stripe_customer_id)
+        if cards is None:
+            payment_methods = stripe_client.v1.payment_methods.list(params={
+                'customer': client.stripe_customer_id,
+                'type': "card"
+            })
+            cards = [method.to_dict() for method in payment_methods.data]
+            remember_cards(client.gym, client.stripe_customer_id, cards)
+        return [stripe.PaymentMethod.construct_from(card, None) for card in cards]
     except Exception as e:
         print(f"Error listing methods: {e}")
         return []
@@ -91,31 +194,29 @@ def charge_client(client, amount_eur, payment_method_id, description="Venta"):
     """
     Charges a client's saved payment method.
     """
-    pub_key, secret_key = get_keys(client.gym)
-    if not secret_key:
+    stripe_client = get_client(client.gym)
+    if not stripe_client:
         raise Exception("Stripe no configurado")
 
     # MOCK / SIMULATION for Testing
     if payment_method_id == 'pm_card_test_success':
         return True, "pi_mock_success_12345"
         
-    stripe.api_key = secret_key
-    
     # 1. Get Customer ID
     customer_id = get_stripe_customer(client)
     
     # 2. Create PaymentIntent
     try:
-        intent = stripe.PaymentIntent.create(
-            amount=int(amount_eur * 100), # Centimos
-            currency='eur', # Default to eur
-            customer=customer_id,
-            payment_method=payment_method_id,
-            off_session=True,
-            confirm=True,
-            description=description,
-            return_url='https://example.com/return'
-        )
+        intent = stripe_client.v1.payment_intents.create(params={
+            'amount': to_cents(amount_eur), # Centimos
+            'currency': 'eur', # Default to eur
+            'customer': customer_id,
+            'payment_method': payment_method_id,
+            'off_session': True,
+            'confirm': True,
+            'description': description,
+            'return_url': 'https://example.com/return'
+        })
         return True, intent.id
     except stripe.error.CardError as e:
         return False, e.user_message
@@ -128,9 +229,8 @@ def validate_keys(public_key, secret_key):
     Returns True if valid, raises Exception if invalid.
     """
     try:
-        stripe.api_key = secret_key
         # Retrieve account details (lightweight)
-        stripe.Account.retrieve()
+        _build_client(secret_key).v1.accounts.retrieve_current()
         return True
     except stripe.error.AuthenticationError:
         raise Exception("La Clave Secreta no es válida.")
@@ -145,19 +245,17 @@ def refund_payment(payment_intent_id, amount_eur=None, gym=None):
     if not payment_intent_id:
         return False, "No ID de transacción"
     
-    # Need keys. If gym is not provided, we might have issue finding keys if we don't have client context.
-    # Usually we pass gym or client. 
-    # Provided code usually calls this with Gym context from View.
-    if gym:
-        keys = get_keys(gym)
-        stripe.api_key = keys['secret_key']
+    # The key comes from the gym's client: refunds run on several threads (sales/refunds.py)
+    stripe_client = get_client(gym) if gym else None
+    if not stripe_client:
+        return False, "Stripe no configurado"
+    args = {'payment_intent': payment_intent_id}
     
     try:
-        args = {'payment_intent': payment_intent_id}
         if amount_eur:
-            args['amount'] = int(amount_eur * 100)
+            args['amount'] = to_cents(amount_eur)
             
-        refund = stripe.Refund.create(**args)
+        refund = stripe_client.v1.refunds.create(params=args)
         return True, refund.id
     except Exception as e:
         return False, str(e)
@@ -1,3 +1,277 @@
-from django.test import TestCase
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from clients.models import Client
+from finance import gateways, stripe_utils
+from finance.money import to_cents
+from finance.models import FinanceSettings
+from finance.redsys_utils import RedsysClient, clear_clients, get_redsys_client
+from organizations.models import Gym
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.requests.append(("GET", url.path, parse_qs(url.query), self.headers["Authorization"]))
+        if url.path == "/v1/payment_methods":
+            self._reply(200, {"data": [{"id": "pm_1", "card": {"brand": "visa", "last4": "4242"}}]})
+        elif url.path == "/v1/customers/cus_1":
+            self._reply(200, {"id": "cus_1", "object": "customer"})
+        else:
+            self._reply(404, {"error": {"message": "No such resource"}})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        self.requests.append(("POST", url.path, form, self.headers["Authorization"]))
+        if url.path == "/v1/refunds" and form["payment_intent"] == ["pi_ok"]:
+            self._reply(200, {"id": "re_1"})
+        elif url.path == "/v1/payment_intents":
+            self._reply(200, {"id": "pi_new", "object": "payment_intent"})
+        elif url.path == "/v1/setup_intents":
+            self._reply(200, {"id": "seti_1", "object": "setup_intent", "client_secret": "seti_1_secret"})
+        else:
+            self._reply(402, {"error": {"message": "Refund declined"}})
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeStripeTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeStripeHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.settings_override = override_settings(STRIPE_API_BASE=f"http://127.0.0.1:{cls.server.server_port}")
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        stripe_utils.clear_clients()
+        FakeStripeHandler.requests = []
+        self.gym = Gym.objects.create(name="Centro")
+        self.finance_settings = FinanceSettings.objects.create(
+            gym=self.gym, stripe_secret_key="sk_test_fake", stripe_webhook_secret="whsec_test",
+        )
+        self.client_obj = Client.objects.create(gym=self.gym, first_name="Ana", stripe_customer_id="cus_1")
+
+    def requests_to(self, path):
+        return [r for r in FakeStripeHandler.requests if r[1] == path]
+
+
+class AsyncGatewayTest(FakeStripeTestCase):
+
+    async def test_refunds_run_against_fake_server(self):
+        ok, declined = await gateways.refund(self.gym, "pi_ok", 10), await gateways.refund(self.gym, "pi_ko", 5)
+        await gateways.aclose()
+
+        self.assertEqual(ok, (True, "re_1"))
+        self.assertEqual(declined, (False, "Refund declined"))
+        method, path, form, auth = FakeStripeHandler.requests[0]
+        self.assertEqual((method, path, form["amount"], auth), ("POST", "/v1/refunds", ["1000"], "Bearer sk_test_fake"))
+
+    async def test_amounts_in_exact_cents(self):
+        charged = await gateways.stripe_charge(self.client_obj, self.gym, 19.99, "pm_1")
+        await gateways.refund(self.gym, "pi_ok", 1.15)
+        await gateways.aclose()
+
+        self.assertEqual(charged, (True, "pi_new"))
+        self.assertEqual(self.requests_to("/v1/payment_intents")[0][2]["amount"], ["1999"])
+        self.assertEqual(self.requests_to("/v1/refunds")[0][2]["amount"], ["115"])
+        self.assertEqual([to_cents(a) for a in (19.99, 8.20, Decimal("0.005"), "10")], [1999, 820, 1, 1000])
+
+    async def test_list_payment_methods(self):
+        cards = await gateways.list_payment_methods(self.client_obj, self.gym)
+        await gateways.aclose()
+
+        self.assertEqual(cards[0]["card"]["last4"], "4242")
+        self.assertEqual(FakeStripeHandler.requests[0][2], {"customer": ["cus_1"], "type": ["card"]})
+
+    def test_provider_for_transaction(self):
+        self.assertEqual(gateways.provider_for_transaction("pi_123"), "stripe")
+        self.assertEqual(gateways.provider_for_transaction("2401011234"), "redsys")
+        self.assertIsNone(gateways.provider_for_transaction("MANUAL-1"))
+
+
+class StripeClientTest(FakeStripeTestCase):
+    def post_event(self, event_type, obj, secret="whsec_test"):
+        payload = json.dumps({"id": "evt_1", "object": "event", "type": event_type, "data": {"object": obj}})
+        timestamp = int(time.time())
+        signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+        return self.client.post(
+            reverse("stripe_webhook", args=[self.gym.pk]), payload, content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}",
+        )
+
+    def test_customer_verified_once(self):
+        self.assertEqual(stripe_utils.get_stripe_customer(self.client_obj), "cus_1")
+        self.assertEqual(stripe_utils.get_stripe_customer(self.client_obj), "cus_1")
+        self.assertEqual(len(self.requests_to("/v1/customers/cus_1")), 1)
+
+    def test_cards_cached_until_webhook(self):
+        cards = stripe_utils.list_payment_methods(self.client_obj)
+        self.assertEqual((cards[0].id, cards[0].card.last4), ("pm_1", "4242"))
+        stripe_utils.list_payment_methods(self.client_obj)
+        self.assertEqual(len(self.requests_to("/v1/payment_methods")), 1)
+
+        response = self.post_event("payment_method.attached", {"id": "pm_2", "object": "payment_method", "customer": "cus_1"})
+        self.assertEqual(response.status_code, 200)
+        stripe_utils.list_payment_methods(self.client_obj)
+        self.assertEqual(len(self.requests_to("/v1/payment_methods")), 2)
+
+    def test_setup_intent_forgets_cards(self):
+        stripe_utils.list_payment_methods(self.client_obj)
+        self.assertEqual(stripe_utils.create_setup_intent(self.client_obj), "seti_1_secret")
+        stripe_utils.list_payment_methods(self.client_obj)
+        self.assertEqual(len(self.requests_to("/v1/payment_methods")), 2)
+
+    def test_cards_not_cached_without_webhook(self):
+        self.finance_settings.stripe_webhook_secret = ""
+        self.finance_settings.save()
+        stripe_utils.list_payment_methods(self.client_obj)
+        stripe_utils.list_payment_methods(self.client_obj)
+        self.assertEqual(len(self.requests_to("/v1/payment_methods")), 2)
+
+    def test_webhook_rejects_bad_signature(self):
+        stripe_utils.list_payment_methods(self.client_obj)
+        response = self.post_event("payment_method.detached", {"id": "pm_1", "customer": None}, secret="whsec_other")
+        self.assertEqual(response.status_code, 400)
+        stripe_utils.list_payment_methods(self.client_obj)
+        self.assertEqual(len(self.requests_to("/v1/payment_methods")), 1)
+
+    def test_client_per_gym(self):
+        other = Gym.objects.create(name="Otro")
+        FinanceSettings.objects.create(gym=other, stripe_secret_key="sk_test_other")
+        client = stripe_utils.get_client(self.gym)
+        self.assertIs(stripe_utils.get_client(self.gym), client)
+
+        stripe_utils.refund_payment("pi_ok", 10, gym=self.gym)
+        stripe_utils.refund_payment("pi_ok", 10, gym=other)
+        self.assertEqual([r[3] for r in self.requests_to("/v1/refunds")], ["Bearer sk_test_fake", "Bearer sk_test_other"])
+
+        self.finance_settings.stripe_secret_key = "sk_test_rotated"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.finance_settings.save()
+        self.assertIsNot(stripe_utils.get_client(self.gym), client)
+
+
+REDSYS_TEST_KEY = "sq7HjrUOBfKmC576ILgskD5srU870gJ7"
+
+
+class FakeRedsysHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    connections = 0
+    orders = []
+    signer = RedsysClient("999008881", "001", REDSYS_TEST_KEY)
+
+    def setup(self):
+        super().setup()
+        type(self).connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length))
+        params = json.loads(base64.b64decode(payload["Ds_MerchantParameters"]))
+        self.orders.append((params["DS_MERCHANT_TRANSACTIONTYPE"], params["DS_MERCHANT_ORDER"]))
+
+        order = params["DS_MERCHANT_ORDER"]
+        reply = base64.b64encode(json.dumps({"Ds_Order": order, "Ds_Response": "0000"}).encode()).decode()
+        body = json.dumps({
+            "Ds_SignatureVersion": "HMAC_SHA256_V1",
+            "Ds_MerchantParameters": reply,
+            "Ds_Signature": self.signer.sign_parameters(reply, order),
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RedsysClientPoolTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeRedsysHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.settings_override = override_settings(REDSYS_REST_URL=f"http://127.0.0.1:{cls.server.server_port}/rest")
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        FakeRedsysHandler.connections = 0
+        FakeRedsysHandler.orders = []
+        self.addCleanup(clear_clients)
+        self.gym = Gym.objects.create(name="Centro")
+        self.settings = FinanceSettings.objects.create(
+            gym=self.gym, redsys_merchant_code="999008881", redsys_secret_key=REDSYS_TEST_KEY,
+        )
+
+    def test_requests_reuse_one_connection(self):
+        client = get_redsys_client(self.gym)
+        self.assertIs(get_redsys_client(self.gym), client)
+
+        ok, params = client.refund_request("000000000001", 10, original_order_id="2401011234")
+        self.assertTrue(ok)
+        self.assertEqual(params["Ds_Order"], "000000000001")
+        ok, _ = get_redsys_client(self.gym).charge_request("000000000002", 5, token="tok_1")
+        self.assertTrue(ok)
+
+        self.assertEqual(FakeRedsysHandler.orders, [("3", "000000000001"), ("0", "000000000002")])
+        self.assertEqual(FakeRedsysHandler.connections, 1)
+
+    def test_saving_settings_replaces_client(self):
+        client = get_redsys_client(self.gym)
+        client.refund_request("000000000001", 10, original_order_id="2401011234")
+        self.settings.redsys_merchant_terminal = "002"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.settings.save()
+
+        fresh = get_redsys_client(self.gym)
+        self.assertIsNot(fresh, client)
+        self.assertEqual(fresh.terminal, "002")
+        self.assertIsNone(client._session)
+
+    def test_unconfigured_gym(self):
+        self.settings.redsys_secret_key = ""
+        self.settings.save()
+        self.assertIsNone(get_redsys_client(self.gym))
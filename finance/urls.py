@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views, views_redsys
+from . import views, views_redsys, views_stripe
 
 urlpatterns = [
     # Settings
@@ -21,6 +21,9 @@ urlpatterns = [
     path('redsys/ok/', views_redsys.redsys_ok, name='redsys_ok'),
     path('redsys/ko/', views_redsys.redsys_ko, name='redsys_ko'),
     
+    # Stripe
+    path('stripe/webhook/<int:gym_id>/', views_stripe.stripe_webhook, name='stripe_webhook'),
+    
     # Reports
     path('report/billing/', views.billing_dashboard, name='finance_billing_dashboard'),
 ]
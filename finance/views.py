@@ -2,19 +2,21 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from accounts.decorators import require_gym_permission
+from config.db_routers import use_replica
 from .models import TaxRate, PaymentMethod, FinanceSettings
 from .forms import TaxRateForm, PaymentMethodForm, FinanceSettingsForm
 from datetime import datetime, timedelta, date
 from django.db.models import Sum, Count
 from django.db.models.functions import TruncDate
+from django.utils import timezone
 from sales.models import Order
 
 @login_required
 @require_gym_permission('finance.view_finance') 
 def settings_view(request):
     gym = request.gym
-    tax_rates = TaxRate.objects.filter(gym=gym)
-    payment_methods = PaymentMethod.objects.filter(gym=gym)
+    tax_rates = TaxRate.objects.for_gym(gym)
+    payment_methods = PaymentMethod.objects.for_gym(gym)
     
     # Get or create finance settings
     finance_settings, created = FinanceSettings.objects.get_or_create(gym=gym)
@@ -168,6 +170,7 @@ def method_delete(request, pk):
 
 @login_required
 @require_gym_permission('finance.view_finance')
+@use_replica
 def billing_dashboard(request):
     gym = request.gym
     
@@ -199,11 +202,14 @@ def billing_dashboard(request):
             
     # Queryset
     # Filter by created_at range (inclusive)
-    # created_at is DateTime, so we need (start 00:00, end 23:59)
-    orders_qs = Order.objects.filter(
-        gym=gym,
-        created_at__date__gte=start_date,
-        created_at__date__lte=end_date
+    # created_at is DateTime: compare against [start 00:00, end+1 00:00) instead of
+    # created_at__date so the (gym, created_at) index can be used
+    tz = timezone.get_current_timezone()
+    range_start = timezone.make_aware(datetime.combine(start_date, datetime.min.time()), tz)
+    range_end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), datetime.min.time()), tz)
+    orders_qs = Order.objects.for_gym(gym).filter(
+        created_at__gte=range_start,
+        created_at__lt=range_end
     ).exclude(status='CANCELLED').select_related('client', 'created_by').prefetch_related('payments__payment_method')
     
     # 2. Aggregates (KPIs)
@@ -228,7 +234,7 @@ def billing_dashboard(request):
         chart_values.append(float(entry['total']))
         
     # 4. Filters (for dropdowns)
-    payment_methods = PaymentMethod.objects.filter(gym=gym, is_active=True)
+    payment_methods = PaymentMethod.objects.for_gym(gym).filter(is_active=True)
     
     # 5. Scheduled Payments (Cobros Futuros / Recurrentes)
     from clients.models import ClientMembership
@@ -0,0 +1,48 @@
+import stripe
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from .models import FinanceSettings
+from .stripe_utils import forget_customer
+
+# Events that change what stripe_utils caches (verified customers / card lists)
+CARD_EVENTS = {
+    'payment_method.attached',
+    'payment_method.detached',
+    'payment_method.updated',
+    'payment_method.automatically_updated',
+}
+CUSTOMER_EVENTS = {'customer.deleted'}
+
+
+@csrf_exempt
+@require_POST
+def stripe_webhook(request, gym_id):
+    """
+    Stripe webhook endpoint, one URL per gym (each gym has its own Stripe account).
+    Drops the cached customer / card list an event refers to.
+    """
+    settings = get_object_or_404(FinanceSettings, gym_id=gym_id)
+    if not settings.stripe_webhook_secret:
+        return HttpResponse("Webhook not configured", status=404)
+
+    try:
+        event = stripe.Webhook.construct_event(
+            request.body, request.headers.get('Stripe-Signature'), settings.stripe_webhook_secret,
+        )
+    except (ValueError, stripe.error.SignatureVerificationError):
+        return HttpResponse("Invalid signature", status=400)
+
+    data = event.to_dict()['data']
+    obj = data['object']
+    if event.type in CARD_EVENTS:
+        # A detached card no longer has a customer: it is in previous_attributes
+        customer_id = obj.get('customer') or data.get('previous_attributes', {}).get('customer')
+        if customer_id:
+            forget_customer(settings.gym, customer_id, cards_only=True)
+    elif event.type in CUSTOMER_EVENTS:
+        forget_customer(settings.gym, obj['id'])
+
+    return HttpResponse("OK")
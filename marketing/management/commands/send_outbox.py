@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from marketing import outbox
+
+
+class Command(BaseCommand):
+    help = "Envía los emails encolados (tickets, facturas...) reutilizando una conexión SMTP por gym."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Termina cuando no quedan emails pendientes")
+        parser.add_argument("--batch-size", type=int, default=outbox.BATCH_SIZE)
+        parser.add_argument("--workers", type=int, default=4, help="Hilos de envío (uno por servidor SMTP)")
+        parser.add_argument("--poll-interval", type=float, default=2, help="Segundos de espera con la cola vacía")
+
+    def handle(self, *args, **options):
+        sent, failed = outbox.run(
+            once=options["once"], batch_size=options["batch_size"], workers=options["workers"],
+            poll_interval=options["poll_interval"], stdout=self.stdout,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Emails enviados: {sent}, con error: {failed}"))
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketing', '0002_remove_popup_target_group_and_more'),
+        ('organizations', '0004_gym_facebook_gym_instagram_gym_tiktok_gym_youtube'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='campaign',
+            index=models.Index(fields=['gym', 'status', 'scheduled_at'], name='campaign_gym_status_idx'),
+        ),
+    ]
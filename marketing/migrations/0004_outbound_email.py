@@ -0,0 +1,39 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:37
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketing', '0003_tenant_indexes'),
+        ('organizations', '0004_gym_facebook_gym_instagram_gym_tiktok_gym_youtube'),
+        ('sales', '0007_order_invoice_pdf'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('TICKET', 'Ticket de compra'), ('INVOICE', 'Factura'), ('MESSAGE', 'Mensaje')], default='MESSAGE', max_length=20)),
+                ('to_email', models.EmailField(max_length=254)),
+                ('subject', models.CharField(blank=True, max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('is_html', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('PENDING', 'Pendiente'), ('SENDING', 'Enviando'), ('SENT', 'Enviado'), ('FAILED', 'Fallido')], default='PENDING', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('gym', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='outbound_emails', to='organizations.gym')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='outbound_emails', to='sales.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='outbound_status_next_idx')],
+            },
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from organizations.models import Gym
+from organizations.managers import TenantManager
 from django.utils import timezone
 
 class MarketingSettings(models.Model):
@@ -47,6 +48,8 @@ class EmailTemplate(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TenantManager()
+
     def __str__(self):
         return self.name
 
@@ -82,6 +85,13 @@ class Campaign(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True) # Important for draft saving
 
+    objects = TenantManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['gym', 'status', 'scheduled_at'], name='campaign_gym_status_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.status})"
 
@@ -112,5 +122,53 @@ class Popup(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = TenantManager()
+
     def __str__(self):
         return self.title
+
+
+class OutboundEmail(models.Model):
+    """
+    Outbox of transactional emails (tickets, invoices...).
+    The request only creates the row; the send_outbox command builds and sends it
+    (marketing/outbox.py).
+    """
+    class Kind(models.TextChoices):
+        TICKET = 'TICKET', _('Ticket de compra')
+        INVOICE = 'INVOICE', _('Factura')
+        MESSAGE = 'MESSAGE', _('Mensaje')
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', _('Pendiente')
+        SENDING = 'SENDING', _('Enviando')
+        SENT = 'SENT', _('Enviado')
+        FAILED = 'FAILED', _('Fallido')
+
+    gym = models.ForeignKey(Gym, on_delete=models.CASCADE, related_name='outbound_emails', null=True, blank=True)
+    kind = models.CharField(max_length=20, choices=Kind.choices, default=Kind.MESSAGE)
+    # Tickets and invoices are rendered from the order when sent
+    order = models.ForeignKey('sales.Order', on_delete=models.CASCADE, related_name='outbound_emails', null=True, blank=True)
+
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+    is_html = models.BooleanField(default=False)
+
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    objects = TenantManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} -> {self.to_email} ({self.status})"
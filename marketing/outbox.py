@@ -0,0 +1,293 @@
+"""
+Envío de emails transaccionales (tickets, facturas) fuera de la petición.
+
+- Las vistas solo encolan (enqueue_ticket / enqueue_invoice / enqueue): un
+  INSERT en OutboundEmail, sin esperar al servidor de correo.
+- El comando send_outbox reclama lotes de pendientes (SELECT ... FOR UPDATE SKIP
+  LOCKED, así se pueden lanzar varios workers), construye los mensajes y los
+  envía en un pool de hilos: un hilo por servidor SMTP.
+- Cada gym usa el SMTP de su MarketingSettings (si lo tiene configurado) o el del
+  proyecto. La conexión se abre una vez y se reutiliza entre lotes; se cierra
+  tras IDLE_TIMEOUT segundos sin uso o si falla.
+- Un envío fallido se reintenta con espera exponencial (RETRY_BASE, 2x, 4x...,
+  hasta RETRY_MAX); tras MAX_ATTEMPTS queda como FAILED.
+
+Uso:
+    outbox.enqueue_ticket(order, "ana@example.com")
+    python manage.py send_outbox
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from email.utils import formataddr
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.validators import validate_email
+from django.db import close_old_connections, transaction
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+
+from sales import emails as sales_emails
+from sales.models import OrderPayment
+from .models import MarketingSettings, OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 6
+RETRY_BASE = timedelta(seconds=30)
+RETRY_MAX = timedelta(hours=2)
+# Un envío que lleva más que esto en SENDING es de un worker caído: se reintenta
+LOCK_TIMEOUT = timedelta(minutes=10)
+IDLE_TIMEOUT = 60  # segundos
+SMTP_TIMEOUT = 30
+MAX_ERROR_LENGTH = 1000
+
+
+# --------------------------------------------------
+# Encolar (desde las vistas)
+# --------------------------------------------------
+
+def enqueue(to_email, subject="", body="", gym=None, is_html=False):
+    validate_email(to_email)
+    return OutboundEmail.objects.create(
+        gym=gym, kind=OutboundEmail.Kind.MESSAGE, to_email=to_email, subject=subject, body=body, is_html=is_html,
+    )
+
+
+def enqueue_ticket(order, to_email):
+    validate_email(to_email)
+    return OutboundEmail.objects.create(
+        gym_id=order.gym_id, kind=OutboundEmail.Kind.TICKET, order=order, to_email=to_email,
+    )
+
+
+def enqueue_invoice(order, to_email):
+    validate_email(to_email)
+    return OutboundEmail.objects.create(
+        gym_id=order.gym_id, kind=OutboundEmail.Kind.INVOICE, order=order, to_email=to_email,
+    )
+
+
+# --------------------------------------------------
+# Conexiones SMTP
+# --------------------------------------------------
+
+@dataclass(frozen=True)
+class SMTPConfig:
+    host: str
+    port: int
+    username: str
+    password: str
+    use_tls: bool
+    from_email: str
+
+
+def smtp_config(marketing):
+    """SMTP propio del gym, o None para usar el del proyecto (settings.EMAIL_*)."""
+    if marketing is None or not marketing.smtp_host or not marketing.default_sender_email:
+        return None
+    from_email = marketing.default_sender_email
+    if marketing.default_sender_name:
+        from_email = formataddr((marketing.default_sender_name, from_email))
+    return SMTPConfig(
+        marketing.smtp_host, marketing.smtp_port, marketing.smtp_username, marketing.smtp_password,
+        marketing.smtp_use_tls, from_email,
+    )
+
+
+class ConnectionPool:
+    """Una conexión abierta por SMTPConfig (None = backend del proyecto), reutilizada entre lotes."""
+
+    def __init__(self):
+        self._connections = {}  # config -> (backend, último uso)
+        self._lock = threading.Lock()
+
+    def get(self, config):
+        with self._lock:
+            entry = self._connections.pop(config, None)
+        backend = entry[0] if entry else self._open(config)
+        with self._lock:
+            self._connections[config] = (backend, time.monotonic())
+        return backend
+
+    def _open(self, config):
+        if config is None:
+            backend = get_connection(fail_silently=False)
+        else:
+            backend = get_connection(
+                "django.core.mail.backends.smtp.EmailBackend",
+                host=config.host, port=config.port, username=config.username, password=config.password,
+                use_tls=config.use_tls, timeout=SMTP_TIMEOUT, fail_silently=False,
+            )
+        backend.open()
+        return backend
+
+    def discard(self, config):
+        with self._lock:
+            entry = self._connections.pop(config, None)
+        if entry:
+            _close(entry[0])
+
+    def close_idle(self, max_idle=IDLE_TIMEOUT):
+        now = time.monotonic()
+        with self._lock:
+            idle = [config for config, (_, used) in self._connections.items() if now - used > max_idle]
+            backends = [self._connections.pop(config)[0] for config in idle]
+        for backend in backends:
+            _close(backend)
+
+    def close_all(self):
+        with self._lock:
+            backends = [backend for backend, _ in self._connections.values()]
+            self._connections.clear()
+        for backend in backends:
+            _close(backend)
+
+
+def _close(backend):
+    try:
+        backend.close()
+    except Exception:
+        logger.warning("Error cerrando la conexión SMTP", exc_info=True)
+
+
+# --------------------------------------------------
+# Worker
+# --------------------------------------------------
+
+def backoff(attempts):
+    return min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+
+
+def claim_batch(limit=BATCH_SIZE):
+    """Marca como SENDING hasta `limit` emails pendientes y los devuelve con su venta cargada."""
+    now = timezone.now()
+    due = (
+        Q(status=OutboundEmail.Status.PENDING, next_attempt_at__lte=now)
+        | Q(status=OutboundEmail.Status.SENDING, next_attempt_at__lt=now - LOCK_TIMEOUT)
+    )
+    with transaction.atomic():
+        ids = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(due).order_by("next_attempt_at").values_list("pk", flat=True)[:limit]
+        )
+        # En SENDING, next_attempt_at es cuándo se reclamó
+        OutboundEmail.objects.filter(pk__in=ids).update(status=OutboundEmail.Status.SENDING, next_attempt_at=now)
+    if not ids:
+        return []
+    return list(
+        OutboundEmail.objects.filter(pk__in=ids)
+        .select_related("order__gym", "order__client")
+        .prefetch_related(
+            "order__items",
+            Prefetch("order__payments", queryset=OrderPayment.objects.select_related("payment_method")),
+        )
+        .order_by("pk")
+    )
+
+
+def build_message(email, config):
+    from_email = config.from_email if config else settings.DEFAULT_FROM_EMAIL
+    if email.kind == OutboundEmail.Kind.TICKET:
+        return sales_emails.ticket_message(email.order, email.to_email, from_email)
+    if email.kind == OutboundEmail.Kind.INVOICE:
+        return sales_emails.invoice_message(email.order, email.to_email, from_email)
+    message = EmailMessage(subject=email.subject, body=email.body, from_email=from_email, to=[email.to_email])
+    if email.is_html:
+        message.content_subtype = "html"
+    return message
+
+
+def _send_group(pool, config, messages):
+    """Envía por la conexión de `config` (en un hilo del pool, sin tocar la BD). {pk: error o None}."""
+    results = {}
+    for pk, message in messages:
+        for retry in range(2):
+            try:
+                pool.get(config).send_messages([message])
+                results[pk] = None
+                break
+            except Exception as e:
+                # Estado de la conexión desconocido: se cierra. Si el servidor había cortado
+                # la conexión reutilizada, el segundo intento va por una nueva
+                pool.discard(config)
+                results[pk] = str(e) or e.__class__.__name__
+    return results
+
+
+def _record(emails, results):
+    now = timezone.now()
+    sent, failed = [], []
+    for email in emails:
+        error = results.get(email.pk)
+        if error is None:
+            sent.append(email.pk)
+            continue
+        email.attempts += 1
+        email.last_error = error[:MAX_ERROR_LENGTH]
+        if email.attempts >= MAX_ATTEMPTS:
+            email.status = OutboundEmail.Status.FAILED
+        else:
+            email.status = OutboundEmail.Status.PENDING
+            email.next_attempt_at = now + backoff(email.attempts)
+        failed.append(email)
+
+    if sent:
+        OutboundEmail.objects.filter(pk__in=sent).update(status=OutboundEmail.Status.SENT, sent_at=now, last_error="")
+    if failed:
+        OutboundEmail.objects.bulk_update(failed, ["attempts", "last_error", "status", "next_attempt_at"])
+    return len(sent), len(failed)
+
+
+def process_batch(pool, executor, limit=BATCH_SIZE):
+    """Envía un lote. Devuelve (enviados, fallidos)."""
+    emails = claim_batch(limit)
+    if not emails:
+        return 0, 0
+
+    gym_ids = {email.gym_id for email in emails if email.gym_id}
+    marketing = {m.gym_id: m for m in MarketingSettings.objects.filter(gym_id__in=gym_ids)}
+
+    results = {}
+    groups = {}  # config -> [(pk, mensaje)]
+    for email in emails:
+        config = smtp_config(marketing.get(email.gym_id))
+        try:
+            message = build_message(email, config)
+        except Exception as e:
+            results[email.pk] = f"Error preparando el email: {e}"
+            continue
+        groups.setdefault(config, []).append((email.pk, message))
+
+    futures = [executor.submit(_send_group, pool, config, messages) for config, messages in groups.items()]
+    for future in futures:
+        results.update(future.result())
+    return _record(emails, results)
+
+
+def run(once=False, batch_size=BATCH_SIZE, workers=4, poll_interval=2, stdout=None):
+    """Bucle del worker. once=True: termina cuando no quedan emails pendientes."""
+    pool = ConnectionPool()
+    totals = [0, 0]
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="outbox") as executor:
+            while True:
+                close_old_connections()
+                sent, failed = process_batch(pool, executor, batch_size)
+                totals[0] += sent
+                totals[1] += failed
+                if stdout and (sent or failed):
+                    stdout.write(f"Enviados {sent}, fallidos {failed}")
+                pool.close_idle()
+                if not sent and not failed:
+                    if once:
+                        break
+                    time.sleep(poll_interval)
+    finally:
+        pool.close_all()
+    return tuple(totals)
@@ -1,3 +1,151 @@
+import socketserver
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.utils import timezone
+
+from marketing import outbox
+from marketing.models import MarketingSettings, OutboundEmail
+from organizations.models import Gym
+from sales.models import Order
+
+User = get_user_model()
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Lo justo de SMTP para smtplib: sin TLS ni AUTH."""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 stand-in ESMTP")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 stand-in")
+            elif verb == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                address = command.split(":", 1)[1].strip(" <>")
+                if address in server.refused:
+                    self.reply("550 No such user")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while (chunk := self.rfile.readline()) not in (b".\r\n", b""):
+                    data.append(chunk)
+                with server.lock:
+                    server.messages.append((recipients, b"".join(data)))
+                self.reply("250 OK")
+            elif verb == "RSET" or verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Not implemented")
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = []
+        self.refused = set()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+class OutboxTest(TestCase):
+    def setUp(self):
+        self.smtp = SMTPStandIn()
+        threading.Thread(target=self.smtp.serve_forever, daemon=True).start()
+        self.addCleanup(self.smtp.server_close)
+        self.addCleanup(self.smtp.shutdown)
+
+        self.gym = Gym.objects.create(name="Centro")
+        MarketingSettings.objects.create(
+            gym=self.gym, smtp_host="127.0.0.1", smtp_port=self.smtp.port, smtp_use_tls=False,
+            default_sender_email="hola@centro.example", default_sender_name="Centro",
+        )
+        self.user = User.objects.create_user(email="caja@example.com", password="password")
+        self.order = Order.objects.create(gym=self.gym, created_by=self.user, total_amount=Decimal("2.40"))
+
+        self.pool = outbox.ConnectionPool()
+        self.addCleanup(self.pool.close_all)
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(self.executor.shutdown)
+
+    def test_batches_reuse_the_gym_connection(self):
+        for i in range(3):
+            outbox.enqueue_ticket(self.order, f"cliente{i}@example.com")
+        self.assertEqual(outbox.process_batch(self.pool, self.executor), (3, 0))
+
+        outbox.enqueue("otro@example.com", subject="Hola", body="Texto", gym=self.gym)
+        self.assertEqual(outbox.process_batch(self.pool, self.executor), (1, 0))
+
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertEqual(len(self.smtp.messages), 4)
+        self.assertIn(b"From: Centro <hola@centro.example>", self.smtp.messages[0][1])
+        self.assertEqual(OutboundEmail.objects.filter(status=OutboundEmail.Status.SENT).count(), 4)
+
+    def test_failure_is_retried_with_backoff(self):
+        self.smtp.refused.add("nadie@example.com")
+        email = outbox.enqueue_ticket(self.order, "nadie@example.com")
+        outbox.enqueue_ticket(self.order, "ana@example.com")
+
+        self.assertEqual(outbox.process_batch(self.pool, self.executor), (1, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.Status.PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertIn("No such user", email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now() + outbox.RETRY_BASE - timedelta(seconds=5))
+
+        # Aún no toca reintentar
+        self.assertEqual(outbox.process_batch(self.pool, self.executor), (0, 0))
+
+        OutboundEmail.objects.filter(pk=email.pk).update(attempts=outbox.MAX_ATTEMPTS - 1, next_attempt_at=timezone.now())
+        outbox.process_batch(self.pool, self.executor)
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.Status.FAILED)
+
+    def test_gym_without_smtp_uses_project_backend(self):
+        from django.core import mail
+
+        other = Gym.objects.create(name="Otro")
+        order = Order.objects.create(gym=other, created_by=self.user, total_amount=Decimal("1.00"))
+        outbox.enqueue_ticket(order, "ana@example.com")
+
+        self.assertEqual(outbox.process_batch(self.pool, self.executor), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(self.smtp.connections, 0)
 
-# Create your tests here.
+    def test_stale_sending_is_reclaimed(self):
+        email = outbox.enqueue_ticket(self.order, "ana@example.com")
+        OutboundEmail.objects.filter(pk=email.pk).update(
+            status=OutboundEmail.Status.SENDING, next_attempt_at=timezone.now() - outbox.LOCK_TIMEOUT * 2,
+        )
+        self.assertEqual(outbox.process_batch(self.pool, self.executor), (1, 0))
@@ -10,12 +10,12 @@ def dashboard_view(request):
     gym = request.gym
     
     # Stats
-    campaigns_count = Campaign.objects.filter(gym=gym).count()
-    templates_count = EmailTemplate.objects.filter(gym=gym).count()
-    active_popups = Popup.objects.filter(gym=gym, is_active=True).count()
+    campaigns_count = Campaign.objects.for_gym(gym).count()
+    templates_count = EmailTemplate.objects.for_gym(gym).count()
+    active_popups = Popup.objects.for_gym(gym).filter(is_active=True).count()
     
     # Recent Campaigns
-    recent_campaigns = Campaign.objects.filter(gym=gym).order_by('-created_at')[:5]
+    recent_campaigns = Campaign.objects.for_gym(gym).order_by('-created_at')[:5]
 
     context = {
         'title': 'Marketing',
@@ -31,7 +31,7 @@ def dashboard_view(request):
 @login_required
 def template_list_view(request):
     gym = request.gym
-    templates = EmailTemplate.objects.filter(gym=gym).order_by('-updated_at')
+    templates = EmailTemplate.objects.for_gym(gym).order_by('-updated_at')
     return render(request, 'backoffice/marketing/templates/list.html', {'templates': templates})
 
 @login_required
@@ -81,7 +81,7 @@ def template_save_api(request, pk):
 @login_required
 def campaign_list_view(request):
     gym = request.gym
-    campaigns = Campaign.objects.filter(gym=gym).order_by('-created_at')
+    campaigns = Campaign.objects.for_gym(gym).order_by('-created_at')
     return render(request, 'backoffice/marketing/campaigns/list.html', {'campaigns': campaigns})
 
 @login_required
@@ -90,7 +90,7 @@ def campaign_create_view(request):
     Renders the Campaign Wizard.
     """
     gym = request.gym
-    templates = EmailTemplate.objects.filter(gym=gym)
+    templates = EmailTemplate.objects.for_gym(gym)
     
     # We pass templates to context for selection in the wizard
     context = {
@@ -174,7 +174,7 @@ def marketing_settings_view(request):
 @login_required
 def popup_list_view(request):
     gym = request.gym
-    popups = Popup.objects.filter(gym=gym).order_by('-created_at')
+    popups = Popup.objects.for_gym(gym).order_by('-created_at')
     return render(request, 'backoffice/marketing/popups/list.html', {'popups': popups})
 
 @login_required
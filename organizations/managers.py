@@ -0,0 +1,20 @@
+from django.db import models
+
+
+class TenantQuerySet(models.QuerySet):
+    """QuerySet de modelos con FK `gym`."""
+
+    def for_gym(self, gym):
+        """
+        Filtra por gym (instancia o id). Sin gym no devuelve nada, nunca datos de otros centros.
+        Va primero en la cadena para que el planner use los índices (gym, ...).
+        """
+        # request.gym es un SimpleLazyObject: el proxy nunca es None, pero bool() sí
+        # llega al valor envuelto (y los ids nunca son 0)
+        gym_id = getattr(gym, "pk", gym)
+        if not gym_id:
+            return self.none()
+        return self.filter(gym_id=gym_id)
+
+
+TenantManager = models.Manager.from_queryset(TenantQuerySet)
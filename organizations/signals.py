@@ -0,0 +1,30 @@
+from django.db.models.signals import post_save, post_delete
+
+from . import tenant_cache
+
+# Modelo -> espacios de nombres de tenant_cache que invalida.
+# El precio final del catálogo depende del impuesto, por eso TaxRate lo invalida.
+# Solo los espacios que alguien lee: un bump es un viaje a la caché en cada escritura.
+INVALIDATES = {
+    "products.Product": (tenant_cache.CATALOG, tenant_cache.STOCK),
+    "products.ProductCategory": (tenant_cache.CATALOG,),
+    "services.Service": (tenant_cache.CATALOG,),
+    "services.ServiceCategory": (tenant_cache.CATALOG,),
+    "memberships.MembershipPlan": (tenant_cache.CATALOG,),
+    "finance.TaxRate": (tenant_cache.CATALOG,),
+    "finance.PaymentMethod": (tenant_cache.PAYMENTS,),
+    # Claves de pasarela: clientes Redsys por gym (finance/redsys_utils.py)
+    "finance.FinanceSettings": (tenant_cache.PAYMENTS,),
+    "clients.Client": (tenant_cache.CLIENTS,),
+}
+
+
+def _invalidate(sender, instance, using=None, **kwargs):
+    namespaces = INVALIDATES.get(sender._meta.label)
+    if namespaces:
+        tenant_cache.bump_on_commit(instance.gym_id, *namespaces, using=using)
+
+
+for _label in INVALIDATES:
+    post_save.connect(_invalidate, sender=_label, dispatch_uid=f"tenant_cache:save:{_label}")
+    post_delete.connect(_invalidate, sender=_label, dispatch_uid=f"tenant_cache:delete:{_label}")
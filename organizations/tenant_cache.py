@@ -0,0 +1,206 @@
+"""
+Caché de aplicación por gym (tenant) sobre el framework de caché de Django.
+
+Cada gym tiene sus propios espacios de nombres ("catalog", "payments",
+"clients"...). Las claves incluyen la versión del espacio de nombres, así que
+invalidar es cambiar la versión (bump_namespace): las entradas viejas dejan de
+leerse y caducan solas. Los signals de organizations/signals.py hacen el bump al
+guardar/borrar los modelos correspondientes, cuando la transacción se confirma
+(bump_on_commit): si se hiciera antes, otro proceso podría leer la versión nueva
+con las filas de antes del commit y cachearlas con esa versión.
+
+Ojo: QuerySet.update()/bulk_create() no disparan signals; quien los use sobre
+estos modelos debe llamar a bump_namespace() a mano.
+
+Uso:
+    methods = tenant_cache.get_or_set(gym.pk, "payments", "active", compute)
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import transaction
+
+DEFAULT_TIMEOUT = 60 * 15
+
+# Single-flight: mientras un proceso recalcula, el resto espera al resultado
+LOCK_TIMEOUT = 10
+LOCK_POLL_INTERVAL = 0.05
+
+CATALOG = "catalog"
+PAYMENTS = "payments"
+CLIENTS = "clients"
+# Solo cantidades de stock (products/stock.py): cambia en cada venta, así que no
+# debe tirar las cachés de "catalog"
+STOCK = "stock"
+
+_VERSION_KEY = "tenant:{gym_id}:{namespace}:version"
+_MISSING = object()
+
+
+def _gym_id(gym):
+    return getattr(gym, "pk", gym)
+
+
+# --------------------------------------------------
+# Versiones
+# --------------------------------------------------
+
+def namespace_version(gym, namespace):
+    key = _VERSION_KEY.format(gym_id=_gym_id(gym), namespace=namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_namespace(gym, *namespaces):
+    """
+    Sube en 1 la versión de cada espacio (incr, atómico en la caché) y devuelve
+    {namespace: versión nueva}: quien tenga la versión nueva - 1 sabe que entre
+    medias no ha habido más cambios (ver sales/catalog_index.py).
+    """
+    gym_id = _gym_id(gym)
+    if gym_id is None:
+        return {}
+    versions = {}
+    for ns in namespaces:
+        key = _VERSION_KEY.format(gym_id=gym_id, namespace=ns)
+        # Sin versión (caché vacía o expulsada): se empieza en un valor nuevo
+        cache.add(key, time.time_ns(), None)
+        try:
+            versions[ns] = cache.incr(key)
+        except ValueError:
+            # Expulsada entre el add y el incr
+            versions[ns] = time.time_ns()
+            cache.set(key, versions[ns], None)
+    return versions
+
+
+def bump_on_commit(gym, *namespaces, using=None):
+    """bump_namespace al confirmar la transacción en curso (al momento si no hay ninguna)."""
+    transaction.on_commit(lambda: bump_namespace(gym, *namespaces), using=using)
+
+
+def make_key(gym, namespace, name):
+    name = str(name)
+    if len(name) > 64 or not name.isprintable() or " " in name:
+        # memcached no admite espacios/controles ni claves de más de 250 caracteres
+        name = hashlib.md5(name.encode("utf-8")).hexdigest()
+    return f"tenant:{_gym_id(gym)}:{namespace}:{namespace_version(gym, namespace)}:{name}"
+
+
+# --------------------------------------------------
+# Contadores (por proceso)
+# --------------------------------------------------
+
+_stats_lock = threading.Lock()
+_hits = Counter()
+_misses = Counter()
+
+
+def _count(counter, namespace):
+    with _stats_lock:
+        counter[namespace] += 1
+
+
+def stats():
+    """{namespace: {"hits", "misses", "hit_rate"}} desde el arranque (o reset_stats)."""
+    with _stats_lock:
+        namespaces = set(_hits) | set(_misses)
+        result = {}
+        for ns in sorted(namespaces):
+            total = _hits[ns] + _misses[ns]
+            result[ns] = {"hits": _hits[ns], "misses": _misses[ns], "hit_rate": round(_hits[ns] / total, 3)}
+        return result
+
+
+def reset_stats():
+    with _stats_lock:
+        _hits.clear()
+        _misses.clear()
+
+
+# --------------------------------------------------
+# Lectura
+# --------------------------------------------------
+
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+def _local_lock(key):
+    with _local_locks_guard:
+        lock = _local_locks.get(key)
+        if lock is None:
+            lock = _local_locks[key] = threading.Lock()
+        return lock
+
+
+def _release_local_lock(key, lock):
+    with _local_locks_guard:
+        if _local_locks.get(key) is lock and not lock.locked():
+            del _local_locks[key]
+
+
+def get(gym, namespace, name, default=None):
+    value = cache.get(make_key(gym, namespace, name), _MISSING)
+    if value is _MISSING:
+        _count(_misses, namespace)
+        return default
+    _count(_hits, namespace)
+    return value
+
+
+def set_value(gym, namespace, name, value, timeout=DEFAULT_TIMEOUT):
+    cache.set(make_key(gym, namespace, name), value, timeout)
+
+
+def delete(gym, namespace, *names):
+    """Borra entradas sueltas sin invalidar el resto del espacio de nombres."""
+    cache.delete_many([make_key(gym, namespace, name) for name in names])
+
+
+def get_or_set(gym, namespace, name, compute, timeout=DEFAULT_TIMEOUT):
+    """
+    Devuelve el valor cacheado o lo calcula con compute() una sola vez:
+    - dentro del proceso, un lock por clave;
+    - entre procesos, un lock en la propia caché (cache.add); los demás esperan
+      hasta LOCK_TIMEOUT y, si no aparece el valor, calculan ellos.
+    """
+    key = make_key(gym, namespace, name)
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        _count(_hits, namespace)
+        return value
+
+    _count(_misses, namespace)
+    lock = _local_lock(key)
+    try:
+        with lock:
+            value = cache.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+            lock_key = f"{key}:lock"
+            if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+                deadline = time.monotonic() + LOCK_TIMEOUT
+                while time.monotonic() < deadline:
+                    time.sleep(LOCK_POLL_INTERVAL)
+                    value = cache.get(key, _MISSING)
+                    if value is not _MISSING:
+                        return value
+                    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+                        break
+
+            try:
+                value = compute()
+                cache.set(key, value, timeout)
+            finally:
+                cache.delete(lock_key)
+            return value
+    finally:
+        _release_local_lock(key, lock)
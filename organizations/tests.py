@@ -1,3 +1,87 @@
+import threading
+import time
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils.functional import SimpleLazyObject
+
+from clients.models import Client
+from finance.models import PaymentMethod
+from finance.services import active_payment_methods
+from organizations import tenant_cache
+from organizations.models import Gym
+
+
+class TenantManagerTest(TestCase):
+    def test_for_gym_accepts_instance_or_id(self):
+        gym = Gym.objects.create(name="Centro")
+        other = Gym.objects.create(name="Otro")
+        client = Client.objects.create(gym=gym, first_name="Ana")
+        Client.objects.create(gym=other, first_name="Luis")
+
+        self.assertEqual(list(Client.objects.for_gym(gym)), [client])
+        self.assertEqual(list(Client.objects.for_gym(gym.pk)), [client])
+        self.assertEqual(Client.objects.for_gym(None).count(), 0)
+
+    def test_for_gym_resolves_lazy_gym(self):
+        gym = Gym.objects.create(name="Centro")
+        client = Client.objects.create(gym=gym, first_name="Ana")
+
+        self.assertEqual(list(Client.objects.for_gym(SimpleLazyObject(lambda: gym))), [client])
+        with self.assertNumQueries(0):
+            self.assertEqual(list(Client.objects.for_gym(SimpleLazyObject(lambda: None))), [])
+
+
+class TenantCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        tenant_cache.reset_stats()
+        self.gym = Gym.objects.create(name="Centro")
+        self.other_gym = Gym.objects.create(name="Otro")
+
+    def test_signals_invalidate_only_that_gym(self):
+        PaymentMethod.objects.create(gym=self.gym, name="Efectivo", is_cash=True)
+        PaymentMethod.objects.create(gym=self.other_gym, name="Efectivo", is_cash=True)
+        self.assertEqual(len(active_payment_methods(self.gym)), 1)
+        active_payment_methods(self.other_gym)
+        with self.assertNumQueries(0):
+            active_payment_methods(self.gym)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PaymentMethod.objects.create(gym=self.gym, name="Tarjeta")
+        self.assertEqual(len(active_payment_methods(self.gym)), 2)
+        with self.assertNumQueries(0):
+            active_payment_methods(self.other_gym)
+
+        self.assertEqual(tenant_cache.stats()["payments"], {"hits": 2, "misses": 3, "hit_rate": 0.4})
+
+    def test_bump_waits_for_commit(self):
+        version = tenant_cache.namespace_version(self.gym, tenant_cache.PAYMENTS)
+        with self.captureOnCommitCallbacks(execute=True):
+            PaymentMethod.objects.create(gym=self.gym, name="Efectivo", is_cash=True)
+            # Antes del commit otro proceso aún no debe ver una versión nueva
+            self.assertEqual(tenant_cache.namespace_version(self.gym, tenant_cache.PAYMENTS), version)
+        self.assertNotEqual(tenant_cache.namespace_version(self.gym, tenant_cache.PAYMENTS), version)
+
+    def test_single_flight(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return "valor"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                tenant_cache.get_or_set(self.gym.pk, "test", "clave", compute)
+            ))
+            for _ in range(5)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
 
-# Create your tests here.
+        self.assertEqual(results, ["valor"] * 5)
+        self.assertEqual(len(calls), 1)
@@ -0,0 +1,107 @@
+"""
+Alertas de stock bajo y lista de reposición.
+
+Un producto está en alerta cuando controla stock y stock_quantity <=
+low_stock_threshold. El conjunto de productos en alerta de cada gym se guarda en
+LowStockAlert y se mantiene al escribir, no al leer:
+
+- products/stock.py:apply_moves llama a evaluate con el stock anterior y el nuevo
+  de cada producto tocado; solo escribe si alguno cruza su umbral (en la venta
+  normal, ninguno: cero queries extra).
+- Guardar un Product (cambio de umbral, de stock a mano, de track_stock) lo
+  revisa con refresh (products/signals.py).
+- rebuild recalcula todo el conjunto (comando rebuild_stock_alerts), para después
+  de importaciones o updates masivos que no pasan por aquí.
+
+El dashboard lee solo las filas de alerta del gym (reorder_list), nunca el
+catálogo entero.
+
+Uso:
+    alerts.reorder_list(gym)  # [{"supplier": ..., "items": [...]}]
+    python manage.py rebuild_stock_alerts
+"""
+from django.db.models import F
+
+from .models import LowStockAlert, Product
+
+# Se sugiere reponer hasta REORDER_TARGET veces el umbral
+REORDER_TARGET = 2
+NO_SUPPLIER = "Sin proveedor"
+
+
+def is_low(quantity, threshold):
+    return quantity <= threshold
+
+
+def evaluate(gym, changes):
+    """
+    changes: [(product_id, stock antes, stock después, umbral, track_stock)].
+    Da de alta/baja las alertas de los productos que cruzan su umbral.
+    """
+    entered, left = [], []
+    for pk, before, after, threshold, track_stock in changes:
+        if not track_stock:
+            continue
+        was_low, low = is_low(before, threshold), is_low(after, threshold)
+        if low and not was_low:
+            entered.append(pk)
+        elif was_low and not low:
+            left.append(pk)
+
+    gym_id = getattr(gym, "pk", gym)
+    if entered:
+        LowStockAlert.objects.bulk_create(
+            [LowStockAlert(gym_id=gym_id, product_id=pk) for pk in entered], ignore_conflicts=True,
+        )
+    if left:
+        LowStockAlert.objects.filter(product_id__in=left).delete()
+    return entered, left
+
+
+def refresh(product):
+    """Revisa un producto recién guardado (cualquier campo puede haber cambiado)."""
+    if product.track_stock and is_low(product.stock_quantity, product.low_stock_threshold):
+        LowStockAlert.objects.bulk_create(
+            [LowStockAlert(gym_id=product.gym_id, product=product)], ignore_conflicts=True,
+        )
+    else:
+        LowStockAlert.objects.filter(product=product).delete()
+
+
+def rebuild(gym=None):
+    """Recalcula el conjunto entero (de `gym` o de todos). Devuelve (altas, bajas)."""
+    low = Product.objects.filter(track_stock=True, stock_quantity__lte=F('low_stock_threshold'))
+    alerts = LowStockAlert.objects.all()
+    if gym is not None:
+        low = low.filter(gym=gym)
+        alerts = alerts.filter(gym=gym)
+
+    removed, _ = alerts.exclude(product__in=low).delete()
+    existing = set(alerts.values_list('product_id', flat=True))
+    added = LowStockAlert.objects.bulk_create(
+        [LowStockAlert(gym_id=gym_id, product_id=pk)
+         for pk, gym_id in low.values_list('pk', 'gym_id') if pk not in existing],
+        ignore_conflicts=True,
+    )
+    return len(added), removed
+
+
+def reorder_list(gym):
+    """Productos en alerta agrupados por proveedor, con la cantidad sugerida a pedir."""
+    alerts = (
+        LowStockAlert.objects.filter(gym=gym)
+        .select_related('product')
+        .order_by('product__supplier_name', 'product__name')
+    )
+    groups = {}
+    for alert in alerts:
+        product = alert.product
+        groups.setdefault(product.supplier_name or NO_SUPPLIER, []).append({
+            "product": product,
+            "reference": product.supplier_reference,
+            "stock": product.stock_quantity,
+            "threshold": product.low_stock_threshold,
+            "suggested": max(product.low_stock_threshold * REORDER_TARGET - product.stock_quantity, 1),
+        })
+    suppliers = sorted(groups, key=lambda name: (name == NO_SUPPLIER, name.lower()))
+    return [{"supplier": name, "items": groups[name]} for name in suppliers]
@@ -55,6 +55,16 @@ class ProductForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         gym = kwargs.pop('gym', None)
         super().__init__(*args, **kwargs)
+        self.gym = gym
         if gym:
             self.fields['category'].queryset = ProductCategory.objects.filter(gym=gym)
             self.fields['tax_rate'].queryset = TaxRate.objects.filter(gym=gym)
+
+    def clean_sku(self):
+        # gym no está en el formulario: la restricción única (gym, sku) se valida aquí
+        sku = self.cleaned_data.get('sku', '').strip()
+        if sku and self.gym:
+            duplicates = Product.objects.filter(gym=self.gym, sku=sku).exclude(pk=self.instance.pk)
+            if duplicates.exists():
+                raise forms.ValidationError('Ya existe un producto con este SKU / código de barras.')
+        return sku
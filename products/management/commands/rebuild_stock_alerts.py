@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from organizations.models import Gym
+from products.alerts import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recalcula las alertas de stock bajo (tras importaciones o updates masivos del catálogo)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--gym", type=int, help="Solo este gym (id)")
+
+    def handle(self, *args, **options):
+        gym = Gym.objects.get(pk=options["gym"]) if options["gym"] else None
+        added, removed = rebuild(gym)
+        self.stdout.write(self.style.SUCCESS(f"Alertas de stock: {added} nuevas, {removed} resueltas"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from organizations.models import Gym
+from products.stock import take_snapshots
+
+
+class Command(BaseCommand):
+    help = "Guarda una foto del stock de cada producto (programar a diario); ver products/stock.py:stock_at."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--gym", type=int, help="Solo este gym (id)")
+
+    def handle(self, *args, **options):
+        gym = Gym.objects.get(pk=options["gym"]) if options["gym"] else None
+        total = take_snapshots(gym)
+        self.stdout.write(self.style.SUCCESS(f"Fotos de stock guardadas: {total}"))
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def dedupe_skus(apps, schema_editor):
+    """
+    Limpia espacios y, si un gym tiene el mismo SKU en varios productos, lo deja
+    en el más antiguo y marca el resto con un sufijo (~id) para revisarlos.
+    """
+    Product = apps.get_model('products', 'Product')
+    seen = set()
+    for product in Product.objects.exclude(sku='').order_by('gym_id', 'pk').only('pk', 'gym_id', 'sku'):
+        sku = product.sku.strip()
+        if (product.gym_id, sku) in seen:
+            suffix = f"~{product.pk}"
+            sku = sku[:50 - len(suffix)] + suffix
+        seen.add((product.gym_id, sku))
+        if sku != product.sku:
+            Product.objects.filter(pk=product.pk).update(sku=sku)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_skus, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0006_tenant_indexes'),
+        ('organizations', '0004_gym_facebook_gym_instagram_gym_tiktok_gym_youtube'),
+        ('products', '0002_dedupe_product_skus'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(condition=models.Q(('sku', ''), _negated=True), fields=('gym', 'sku'), name='product_gym_sku_uniq'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:41
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_sku_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(verbose_name='Stock')),
+                ('taken_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stockmove',
+            index=models.Index(fields=['product', 'created_at'], name='stockmove_product_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='stocksnapshot',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='products.product'),
+        ),
+        migrations.AddIndex(
+            model_name='stocksnapshot',
+            index=models.Index(fields=['product', 'taken_at'], name='stocksnapshot_product_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0004_gym_facebook_gym_instagram_gym_tiktok_gym_youtube'),
+        ('products', '0004_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LowStockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Desde')),
+                ('gym', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='low_stock_alerts', to='organizations.gym')),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='low_stock_alert', to='products.product')),
+            ],
+        ),
+    ]
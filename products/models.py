@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from organizations.models import Gym
 from finance.models import TaxRate
@@ -50,6 +51,14 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        constraints = [
+            # El TPV resuelve los escaneos por este índice (sales/scan.py)
+            models.UniqueConstraint(
+                fields=['gym', 'sku'], condition=~models.Q(sku=''), name='product_gym_sku_uniq'
+            ),
+        ]
+
     def __str__(self):
         return self.name
     
@@ -78,9 +87,41 @@ class StockMove(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Suma de movimientos desde una foto (products/stock.py:stock_at)
+            models.Index(fields=['product', 'created_at'], name='stockmove_product_created_idx'),
+        ]
+
     def save(self, *args, **kwargs):
-        # Update product stock on save
-        if not self.pk: # Only on creation
-            self.product.stock_quantity += self.quantity_change
-            self.product.save()
-        super().save(*args, **kwargs)
+        if self.pk:
+            return super().save(*args, **kwargs)
+        # Alta: el stock se incrementa en la BD (sin leer-modificar-escribir), se
+        # revisan las alertas y se guarda el movimiento, todo en products/stock.py
+        from .stock import apply_moves
+        apply_moves(self.product.gym_id, [self])
+
+
+class StockSnapshot(models.Model):
+    """Stock de un producto en un instante; stock_at parte de la última foto en vez de todo el histórico."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots')
+    quantity = models.IntegerField(_("Stock"))
+    taken_at = models.DateTimeField(_("Fecha"), default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'taken_at'], name='stocksnapshot_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product} {self.taken_at:%Y-%m-%d %H:%M}: {self.quantity}"
+
+
+class LowStockAlert(models.Model):
+    """Productos del gym con el stock en su umbral o por debajo; lo mantiene products/alerts.py."""
+    gym = models.ForeignKey(Gym, on_delete=models.CASCADE, related_name='low_stock_alerts')
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='low_stock_alert')
+    created_at = models.DateTimeField(_("Desde"), auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.product}: stock bajo"
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import alerts
+
+
+@receiver(post_save, sender="products.Product", dispatch_uid="products:low_stock_alert")
+def refresh_low_stock_alert(sender, instance, **kwargs):
+    # Umbral, stock o track_stock editados a mano; los movimientos pasan por stock.apply_moves
+    alerts.refresh(instance)
@@ -0,0 +1,200 @@
+"""
+Libro de stock: movimientos de varios productos aplicados de una vez.
+
+- apply_moves escribe los StockMove con un bulk_create y actualiza el stock de
+  todos los productos con un solo UPDATE (stock_quantity = stock_quantity +
+  CASE id WHEN ... END): el incremento lo hace la BD, así dos cajas vendiendo el
+  mismo producto no se pisan (antes: leer, sumar en Python y product.save()).
+  El RETURNING del UPDATE da el stock nuevo para las alertas (products/alerts.py).
+  Al confirmar la transacción sube la versión del espacio "stock" de tenant_cache
+  (no la de "catalog").
+- check=True protege contra la sobreventa: el UPDATE solo toca las filas que no
+  quedarían en negativo; si falta alguna se lanza InsufficientStock y se deshace
+  la transacción del llamador.
+- skip_locked=True bloquea antes los productos con SELECT ... FOR UPDATE SKIP
+  LOCKED: si otra transacción tiene alguno, StockBusy al momento en vez de
+  esperar a que termine (el llamador decide si reintenta).
+- Las fotos (StockSnapshot, comando snapshot_stock) permiten calcular el stock en
+  cualquier fecha sumando solo los movimientos desde la última foto anterior.
+
+Uso:
+    moves = stock.sale_moves(lines, user=request.user, notes=f"Venta #{order.id}")
+    stock.apply_moves(gym, moves, check=settings.STOCK_PREVENT_OVERSELL)
+
+    stock.stock_at(gym, timezone.now() - timedelta(days=30))  # {product_id: cantidad}
+"""
+from django.db import router, transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from organizations import tenant_cache
+from . import alerts
+from .models import Product, StockMove, StockSnapshot
+
+SNAPSHOT_BATCH_SIZE = 1000
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortages):
+        # [(producto, disponible, pedido)]
+        self.shortages = shortages
+        detail = ", ".join(f"{name} (quedan {available}, se piden {wanted})" for name, available, wanted in shortages)
+        super().__init__(f"Stock insuficiente: {detail}")
+
+
+class StockBusy(Exception):
+    pass
+
+
+def sale_moves(lines, user=None, notes="", reason='SALE', sign=-1):
+    """StockMove sin guardar, uno por producto, para las líneas de un carrito (sales/pipeline.py:CartLine)."""
+    moves = {}
+    for line in lines:
+        if not isinstance(line.obj, Product) or not line.obj.track_stock:
+            continue
+        if line.obj.pk not in moves:
+            moves[line.obj.pk] = StockMove(
+                product=line.obj, quantity_change=0, reason=reason, notes=notes, created_by=user,
+            )
+        moves[line.obj.pk].quantity_change += sign * line.quantity
+    return list(moves.values())
+
+
+def reverse_moves(moves, reason='RETURN', notes=""):
+    """Movimientos que deshacen `moves` (p. ej. la venta cuyo pago ha fallado)."""
+    return [
+        StockMove(product=move.product, quantity_change=-move.quantity_change, reason=reason,
+                  notes=notes or move.notes, created_by=move.created_by)
+        for move in moves
+    ]
+
+
+def _deltas(moves):
+    deltas = {}
+    for move in moves:
+        deltas[move.product_id] = deltas.get(move.product_id, 0) + move.quantity_change
+    return {pk: change for pk, change in deltas.items() if change}
+
+
+def _update_sql(connection, gym_id, deltas, check):
+    """UPDATE de todos los productos con RETURNING del stock nuevo (para las alertas)."""
+    qn = connection.ops.quote_name
+    change = "CASE " + " ".join(f"WHEN {qn('id')} = %s THEN %s" for _ in deltas) + " END"
+    change_params = [value for pk, delta in deltas.items() for value in (pk, delta)]
+    sql = (
+        f"UPDATE {qn(Product._meta.db_table)} SET {qn('stock_quantity')} = {qn('stock_quantity')} + {change} "
+        f"WHERE {qn('gym_id')} = %s AND {qn('id')} IN ({', '.join(['%s'] * len(deltas))})"
+    )
+    params = [*change_params, gym_id, *deltas]
+    if check:
+        # Solo las filas que no quedan en negativo; la BD evalúa la condición con
+        # el valor de la fila ya bloqueada, no con el que leímos antes
+        sql += f" AND ({change} > 0 OR {qn('stock_quantity')} + {change} >= 0)"
+        params += change_params * 2
+    sql += f" RETURNING {qn('id')}, {qn('stock_quantity')}, {qn('low_stock_threshold')}, {qn('track_stock')}"
+    return sql, params
+
+
+def apply_moves(gym, moves, check=False, skip_locked=False):
+    """
+    Guarda `moves` (StockMove sin guardar, productos de `gym`) y ajusta el stock:
+    1 UPDATE + 1 INSERT sea cual sea el número de productos.
+    """
+    if not moves:
+        return []
+    gym_id = getattr(gym, "pk", gym)
+    deltas = _deltas(moves)
+    using = router.db_for_write(Product)
+
+    # Sin savepoint: un error deja la transacción del llamador para deshacer entera
+    with transaction.atomic(using=using, savepoint=False):
+        if skip_locked:
+            locked = set(
+                Product.objects.using(using).select_for_update(skip_locked=True)
+                .filter(gym_id=gym_id, pk__in=deltas).values_list('pk', flat=True)
+            )
+            if len(locked) < len(deltas):
+                raise StockBusy("Otra venta está actualizando el stock de estos productos")
+
+        rows = []
+        if deltas:
+            connection = transaction.get_connection(using)
+            with connection.cursor() as cursor:
+                cursor.execute(*_update_sql(connection, gym_id, deltas, check))
+                rows = cursor.fetchall()
+            if check and len(rows) < len(deltas):
+                short = Product.objects.using(using).filter(pk__in=[pk for pk, d in deltas.items() if d < 0])
+                raise InsufficientStock([
+                    (name, available, -deltas[pk])
+                    for pk, name, available in short.values_list('pk', 'name', 'stock_quantity').order_by('pk')
+                    if available + deltas[pk] < 0
+                ])
+
+        created = StockMove.objects.using(using).bulk_create(moves)
+        alerts.evaluate(gym_id, [
+            (pk, quantity - deltas[pk], quantity, threshold, track_stock)
+            for pk, quantity, threshold, track_stock in rows
+        ])
+
+    quantities = {pk: quantity for pk, quantity, _, _ in rows}
+    for move in moves:
+        if move.product_id in quantities:
+            move.product.stock_quantity = quantities[move.product_id]
+    # Solo "stock": el índice, el snapshot y la caché de escaneo del catálogo no
+    # dependen del stock y sobreviven a las ventas
+    tenant_cache.bump_on_commit(gym_id, tenant_cache.STOCK, using=using)
+    return created
+
+
+# --------------------------------------------------
+# Fotos y stock en una fecha
+# --------------------------------------------------
+
+def take_snapshots(gym=None, at=None):
+    """Una foto por producto con control de stock (de `gym` o de todos). Devuelve cuántas."""
+    at = at or timezone.now()
+    products = Product.objects.filter(track_stock=True)
+    if gym is not None:
+        products = products.filter(gym=gym)
+    batch = []
+    total = 0
+    for pk, quantity in products.values_list('pk', 'stock_quantity').iterator(chunk_size=SNAPSHOT_BATCH_SIZE):
+        batch.append(StockSnapshot(product_id=pk, quantity=quantity, taken_at=at))
+        if len(batch) >= SNAPSHOT_BATCH_SIZE:
+            total += len(StockSnapshot.objects.bulk_create(batch))
+            batch = []
+    if batch:
+        total += len(StockSnapshot.objects.bulk_create(batch))
+    return total
+
+
+def _moves_total(**filters):
+    moves = (
+        StockMove.objects.filter(product=OuterRef('pk'), **filters)
+        .order_by().values('product').annotate(total=Sum('quantity_change')).values('total')
+    )
+    return Coalesce(Subquery(moves), 0)
+
+
+def stock_at(gym, when, product_ids=None):
+    """
+    {product_id: stock en `when`} en una query: última foto anterior + movimientos
+    desde entonces. Sin foto, se parte del stock actual y se restan los posteriores.
+    """
+    snapshot = StockSnapshot.objects.filter(product=OuterRef('pk'), taken_at__lte=when).order_by('-taken_at')
+    products = Product.objects.filter(gym=gym, track_stock=True)
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    products = products.annotate(
+        snapshot_at=Subquery(snapshot.values('taken_at')[:1]),
+        snapshot_quantity=Subquery(snapshot.values('quantity')[:1]),
+    ).annotate(
+        quantity=Case(
+            When(snapshot_at__isnull=True,
+                 then=F('stock_quantity') - _moves_total(created_at__gt=when)),
+            default=F('snapshot_quantity') + _moves_total(created_at__gt=OuterRef('snapshot_at'), created_at__lte=when),
+            output_field=IntegerField(),
+        )
+    )
+    return dict(products.values_list('pk', 'quantity'))
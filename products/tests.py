@@ -1,3 +1,147 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import User
+from organizations.models import Gym
+from products import alerts, stock
+from products.models import LowStockAlert, Product, StockMove, StockSnapshot
+
+
+class StockLedgerTest(TestCase):
+    def setUp(self):
+        self.gym = Gym.objects.create(name="Centro")
+        self.user = User.objects.create_user(email="staff@example.com", password="password")
+        self.water = Product.objects.create(gym=self.gym, name="Agua", base_price=1, stock_quantity=5)
+        self.bar = Product.objects.create(gym=self.gym, name="Barrita", base_price=2, stock_quantity=1)
+        self.towel = Product.objects.create(gym=self.gym, name="Toalla", base_price=9, track_stock=False)
+
+    def _move(self, product, change, reason='SALE'):
+        return StockMove(product=product, quantity_change=change, reason=reason, created_by=self.user)
+
+    def _stock(self, product):
+        return Product.objects.values_list('stock_quantity', flat=True).get(pk=product.pk)
+
+    def test_whole_cart_in_one_update(self):
+        moves = [self._move(self.water, -2), self._move(self.bar, -1), self._move(self.water, -1)]
+        with self.assertNumQueries(2):
+            stock.apply_moves(self.gym, moves)
+        self.assertEqual(self._stock(self.water), 2)
+        self.assertEqual(self._stock(self.bar), 0)
+        self.assertEqual(StockMove.objects.count(), 3)
+
+    def test_oversell_is_rejected_and_rolled_back(self):
+        moves = [self._move(self.water, -2), self._move(self.bar, -3)]
+        with self.assertRaises(stock.InsufficientStock) as ctx:
+            with transaction.atomic():
+                stock.apply_moves(self.gym, moves, check=True)
+        self.assertEqual(ctx.exception.shortages, [("Barrita", 1, 3)])
+        self.assertEqual(self._stock(self.water), 5)
+        self.assertFalse(StockMove.objects.exists())
+
+    def test_sale_moves_skip_untracked_products(self):
+        from sales.pipeline import price_line
+
+        lines = [price_line(self.water, 2, None), price_line(self.towel, 1, None)]
+        moves = stock.sale_moves(lines, user=self.user)
+        self.assertEqual([(m.product, m.quantity_change) for m in moves], [(self.water, -2)])
+
+        stock.apply_moves(self.gym, moves)
+        stock.apply_moves(self.gym, stock.reverse_moves(moves))
+        self.assertEqual(self._stock(self.water), 5)
+
+    def test_single_move_save_is_atomic(self):
+        stale = Product.objects.get(pk=self.water.pk)
+        StockMove.objects.create(product=self.water, quantity_change=-1, reason='SALE')
+        StockMove.objects.create(product=stale, quantity_change=3, reason='RESTOCK')
+        self.assertEqual(self._stock(self.water), 7)
+
+    def test_stock_at_uses_latest_snapshot(self):
+        now = timezone.now()
+        StockSnapshot.objects.create(product=self.water, quantity=10, taken_at=now - timedelta(days=10))
+        old = self._move(self.water, -4)
+        stock.apply_moves(self.gym, [old])
+        StockMove.objects.filter(pk=old.pk).update(created_at=now - timedelta(days=5))
+        stock.apply_moves(self.gym, [self._move(self.water, -1)])
+
+        self.assertEqual(stock.stock_at(self.gym, now - timedelta(days=7))[self.water.pk], 10)
+        self.assertEqual(stock.stock_at(self.gym, now - timedelta(days=3))[self.water.pk], 6)
+        # Sin foto: stock actual menos los movimientos posteriores
+        self.assertEqual(stock.stock_at(self.gym, now - timedelta(days=3))[self.bar.pk], 1)
+        self.assertNotIn(self.towel.pk, stock.stock_at(self.gym, now))
+
+        self.assertEqual(stock.take_snapshots(self.gym), 2)
+        self.assertEqual(stock.stock_at(self.gym, timezone.now())[self.water.pk], self._stock(self.water))
+
+    @override_settings(STOCK_PREVENT_OVERSELL=True)
+    def test_process_sale_rejects_oversell(self):
+        from django.test import RequestFactory
+        from sales.api import process_sale
+        from sales.models import Order
+
+        request = RequestFactory().post("/", {'items': [{'id': self.bar.id, 'type': 'product', 'qty': 2}]},
+                                        content_type="application/json")
+        request.gym = self.gym
+        request.user = self.user
+        # Sin los decoradores de permisos
+        response = process_sale.__wrapped__.__wrapped__(request)
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self._stock(self.bar), 1)
+
+
+class LowStockAlertTest(TestCase):
+    def setUp(self):
+        self.gym = Gym.objects.create(name="Centro")
+        self.water = Product.objects.create(gym=self.gym, name="Agua", base_price=1, stock_quantity=10,
+                                            low_stock_threshold=5, supplier_name="Bebidas SL",
+                                            supplier_reference="AG-50")
+        self.bar = Product.objects.create(gym=self.gym, name="Barrita", base_price=2, stock_quantity=10,
+                                          low_stock_threshold=5)
+
+    def _sell(self, product, quantity):
+        stock.apply_moves(self.gym, [StockMove(product=product, quantity_change=-quantity, reason='SALE')])
+
+    def test_only_crossings_write(self):
+        # 10 -> 7: sigue por encima del umbral, sin queries de alertas
+        with self.assertNumQueries(2):
+            self._sell(self.water, 3)
+        self.assertFalse(LowStockAlert.objects.exists())
+
+        with self.assertNumQueries(3):
+            self._sell(self.water, 2)
+        self.assertTrue(LowStockAlert.objects.filter(product=self.water).exists())
+
+        # Ya en alerta: nada que escribir
+        with self.assertNumQueries(2):
+            self._sell(self.water, 1)
+
+        stock.apply_moves(self.gym, [StockMove(product=self.water, quantity_change=20, reason='RESTOCK')])
+        self.assertFalse(LowStockAlert.objects.exists())
+
+    def test_product_edits_are_rechecked(self):
+        self.bar.low_stock_threshold = 10
+        self.bar.save()
+        self.assertTrue(LowStockAlert.objects.filter(product=self.bar).exists())
+        self.bar.track_stock = False
+        self.bar.save()
+        self.assertFalse(LowStockAlert.objects.exists())
+
+    def test_reorder_list_grouped_by_supplier(self):
+        self._sell(self.water, 8)
+        self._sell(self.bar, 6)
+        other = Gym.objects.create(name="Otro")
+        Product.objects.create(gym=other, name="Agua", base_price=1, stock_quantity=0)
+
+        reorder = alerts.reorder_list(self.gym)
+        self.assertEqual([group["supplier"] for group in reorder], ["Bebidas SL", alerts.NO_SUPPLIER])
+        item = reorder[0]["items"][0]
+        self.assertEqual((item["reference"], item["stock"], item["suggested"]), ("AG-50", 2, 8))
+
+    def test_rebuild(self):
+        Product.objects.filter(pk=self.bar.pk).update(stock_quantity=1)
+        LowStockAlert.objects.create(gym=self.gym, product=self.water)
+        self.assertEqual(alerts.rebuild(self.gym), (1, 1))
+        self.assertEqual(list(LowStockAlert.objects.values_list("product", flat=True)), [self.bar.pk])
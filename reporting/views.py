@@ -1,34 +1,30 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from accounts.decorators import require_gym_permission
-from organizations.models import Gym
+from config.db_routers import use_replica
+from accounts.services import current_gym
 from clients.models import Client, ClientTag, ClientGroup
-from django.db.models import Q, Sum, Count
+from clients.search import search_clients
+from django.db.models import Sum, Count
 from datetime import timedelta, date
 
 @login_required
 @require_gym_permission("clients.view")
+@use_replica
 def client_explorer(request):
-    gym_id = request.session.get("current_gym_id")
-    if not gym_id:
+    gym = current_gym(request)
+    if not gym:
         return render(request, "backoffice/error.html", {"message": "No hay gimnasio seleccionado"})
     
-    gym = Gym.objects.get(id=gym_id)
-    
     # Base Query
-    clients = Client.objects.filter(gym=gym).prefetch_related('tags', 'memberships', 'visits')
+    clients = Client.objects.for_gym(gym).prefetch_related('tags', 'memberships', 'visits')
 
     # --- Filters ---
     
     # 1. Text Search
     q = request.GET.get('q')
     if q:
-        clients = clients.filter(
-            Q(first_name__icontains=q) | 
-            Q(last_name__icontains=q) | 
-            Q(email__icontains=q) |
-            Q(phone_number__icontains=q)
-        )
+        clients = search_clients(clients, q)
 
     # 2. Status
     status = request.GET.get('status')
@@ -1,25 +1,27 @@
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
 from django.views.decorators.http import require_http_methods, require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.db import transaction
-from django.core.mail import EmailMessage
 from django.contrib.contenttypes.models import ContentType
 from decimal import Decimal
 from datetime import timedelta, date
-from django.template.loader import render_to_string
 from django.conf import settings
+from django.utils import timezone
 from .models import Order, OrderItem, OrderPayment
-from products.models import Product
-from services.models import Service
+from products import stock
 from clients.models import Client
+from clients.search import search_clients as search_clients_by_text
 from finance.models import PaymentMethod
 from accounts.decorators import require_gym_permission
-from memberships.models import MembershipPlan
-import json
+from marketing import outbox
+from . import catalog_index, invoicing, pipeline, refunds, scan
+from . import catalog_snapshot as catalog_snapshot_utils
+from . import offline_sync as offline_sync_utils
+from .idempotency import idempotent, mark_charged
 import json
 import datetime
 from django.shortcuts import get_object_or_404
-from django.db import transaction
+
 
 @require_gym_permission('sales.view_sale')
 def get_client_cards(request, client_id):
@@ -101,6 +103,7 @@ def order_detail_json(request, order_id):
 
 @require_http_methods(["POST"])
 @require_gym_permission('sales.delete_sale')
+@idempotent('sales.order_cancel')
 def order_cancel(request, order_id):
     """
     Cancels an order (sets status to CANCELLED).
@@ -111,51 +114,24 @@ def order_cancel(request, order_id):
     if order.status == 'CANCELLED':
         return JsonResponse({'error': 'Esta venta ya está cancelada'}, status=400)
     
-    # Refund Logic
-    refund_notes = []
-    
-    # Check for refundable payments
-    from finance.stripe_utils import refund_payment
-    from finance.redsys_utils import get_redsys_client
-    
-    for payment in order.payments.all():
-        if payment.transaction_id:
-            # Try to identify provider. 
-            # Heuristic: Stripe IDs usually start with pi_ or ch_. Redsys are usually numeric or short.
-            # But we should probably store provider in OrderPayment? 
-            # Current OrderPayment model doesn't have provider field, just payment_method relation.
-            # Let's check the payment method name or infer from ID.
-            
-            # Stripe
-            if payment.transaction_id.startswith('pi_') or payment.transaction_id.startswith('ch_'):
-                success, msg = refund_payment(payment.transaction_id, amount_eur=float(payment.amount), gym=gym)
-                if success:
-                    refund_notes.append(f"Reembolso Stripe exitoso ({payment.amount}€)")
-                else:
-                    refund_notes.append(f"Error Reembolso Stripe: {msg}")
-            
-            # Redsys (If we have a numeric order ID as transaction_id)
-            elif payment.transaction_id.isdigit(): # Redsys Order IDs are up to 12 digits
-                 redsys = get_redsys_client(gym)
-                 if redsys:
-                     # Redsys Refund requires generating a NEW order ID for the refund transaction
-                     from finance.views_redsys import generate_order_id
-                     refund_order_id = generate_order_id()
-                     success, msg = redsys.refund_request(refund_order_id, float(payment.amount), original_order_id=payment.transaction_id)
-                     if success:
-                         refund_notes.append(f"Reembolso Redsys exitoso ({payment.amount}€)")
-                     else:
-                         refund_notes.append(f"Error Reembolso Redsys: {msg}")
-    
+    # Card refunds run concurrently; slow gateways finish in the background (sales/refunds.py)
+    attempts = refunds.refund_order(order, gym)
+    refund_notes = refunds.notes(attempts)
+
     order.status = 'CANCELLED'
-    note = f"\n[Cancelado por {request.user.get_full_name() or request.user.username} el {datetime.datetime.now().strftime('%d/%m/%Y %H:%M')}]"
+    note = f"\n[Cancelado por {request.user.get_full_name() or request.user.email} el {datetime.datetime.now().strftime('%d/%m/%Y %H:%M')}]"
     if refund_notes:
         note += "\n" + "\n".join(refund_notes)
         
-    order.internal_notes += note
-    order.save()
+    order.save(update_fields=['status', 'updated_at'])
+    # Refunds still running in the background append to the notes too
+    refunds.add_note(order, note)
     
-    return JsonResponse({'success': True, 'message': 'Venta cancelada. ' + ', '.join(refund_notes)})
+    return JsonResponse({
+        'success': True,
+        'message': 'Venta cancelada. ' + ', '.join(refund_notes),
+        'refunds': refunds.summary(attempts),
+    })
 
 @require_http_methods(["POST"])
 @require_gym_permission('sales.change_sale')
@@ -216,20 +192,14 @@ def order_generate_invoice(request, order_id):
         email = data.get('email')
         
         if not order.invoice_number:
-            # Simple sequential generation. 
-            # Ideally this should be more robust (Year-Sequence).
-            # For now: INV-{Year}-{Order_ID}
-            year = datetime.datetime.now().year
-            # Check last invoice number for this gym/year to increment?
-            # Or just use ID based unique
-            order.invoice_number = f"INV-{year}-{order.id:06d}"
-            order.save()
-            
-        # Send Email
+            # Gapless per-gym/year series (sales/invoicing.py)
+            with transaction.atomic():
+                invoicing.assign_invoice_number(order)
+
+        # Queued; the send_outbox worker renders the PDF and sends it
         if email:
-             # Reuse ticket template or specialized invoice template
-             send_invoice_email(order, email)
-             msg = f"Factura {order.invoice_number} generada y enviada a {email}"
+             outbox.enqueue_invoice(order, email)
+             msg = f"Factura {order.invoice_number} generada, se enviará a {email}"
         else:
              msg = f"Factura {order.invoice_number} generada"
 
@@ -254,90 +224,62 @@ def order_send_ticket(request, order_id):
         if not email:
             return JsonResponse({'error': 'Email requerido'}, status=400)
         
-        # Render email template
-        html_content = render_to_string('emails/ticket_receipt.html', {
-            'order': order,
-            'gym': gym,
-            'items': order.items.all(),
-            'payments': order.payments.all()
-        })
-        
-        email_msg = EmailMessage(
-            subject=f'Tu ticket de compra - {gym.name} #{order.id}',
-            body=html_content,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[email]
-        )
-        email_msg.content_subtype = 'html'
-        email_msg.send()
-        
-        return JsonResponse({'success': True, 'message': f'Ticket enviado a {email}'})
+        # Sent by the send_outbox worker (marketing/outbox.py)
+        outbox.enqueue_ticket(order, email)
+
+        return JsonResponse({'success': True, 'message': f'El ticket se enviará a {email}'})
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
-from decimal import Decimal
-
 @require_gym_permission('sales.view_sale')
 def search_products(request):
     query = request.GET.get('q', '').strip()
-    gym = request.gym
-    results = []
-
-    # Search Products
-    products = Product.objects.filter(gym=gym, is_active=True)
-    if query:
-        products = products.filter(name__icontains=query)
-    
-    for p in products[:10]:
-        try:
-            results.append({
-                'type': 'product',
-                'id': p.id,
-                'name': p.name,
-                'price': float(p.final_price),
-                'image': p.image.url if p.image else None,
-                'category': p.category.name if p.category else 'Sin Categoría'
-            })
-        except Exception as e:
-            print(f"Error prod {p.id}: {e}")
-
-    # Search Services
-    services = Service.objects.filter(gym=gym, is_active=True)
-    if query:
-        services = services.filter(name__icontains=query)
+    # Índice en memoria por gym (sales/catalog_index.py), sin queries tras construirse
+    results = catalog_index.search(request.gym, query)
+    return JsonResponse({'results': results})
 
-    for s in services[:10]:
-        try:
-            results.append({
-                'type': 'service',
-                'id': s.id,
-                'name': s.name,
-                'price': float(s.final_price),
-                'image': s.image.url if s.image else None,
-                'category': s.category.name if s.category else 'Sin Categoría'
-            })
-        except Exception:
-            pass
+@require_gym_permission('sales.view_sale')
+def catalog_snapshot(request):
+    """
+    Whole sellable catalog as one JSON document, for local search on the till.
+    Revalidate with If-None-Match: 304 while the gym's catalog version doesn't change.
+    """
+    return _revalidated(request, catalog_snapshot_utils.etag_for(request.gym),
+                        lambda: catalog_snapshot_utils.get_snapshot(request.gym))
 
-    # Search Memberships (Plans)
-    plans = MembershipPlan.objects.filter(gym=gym, is_active=True)
-    if query:
-        plans = plans.filter(name__icontains=query)
-    
-    for plan in plans[:10]:
-        try:
-            results.append({
-                'type': 'membership',
-                'id': plan.id,
-                'name': plan.name,
-                'price': float(plan.final_price),
-                'image': plan.image.url if plan.image else None,
-                'category': 'Cuota / Plan'
-            })
-        except Exception:
-            pass
+@require_gym_permission('sales.view_sale')
+def catalog_stock(request):
+    """
+    Stock levels of the catalog's tracked products, kept apart so a sale doesn't
+    invalidate the whole snapshot. Same If-None-Match revalidation.
+    """
+    return _revalidated(request, catalog_snapshot_utils.stock_etag_for(request.gym),
+                        lambda: catalog_snapshot_utils.get_stock(request.gym))
+
+def _revalidated(request, etag, get_document):
+    if etag in [t.strip() for t in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        document = get_document()
+        etag = document['etag']
+        encoding, body = catalog_snapshot_utils.pick_encoding(document, request.headers.get('Accept-Encoding'))
+        response = HttpResponse(body, content_type='application/json')
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    response['Vary'] = 'Accept-Encoding'
+    return response
 
-    return JsonResponse({'results': results})
+@require_gym_permission('sales.view_sale')
+def scan_code(request):
+    """
+    Resolves a scanned barcode/SKU to a cart line, or a client access code to the client.
+    """
+    result = scan.resolve(request.gym, request.GET.get('code', ''))
+    if result is None:
+        return JsonResponse({'error': 'Código no encontrado'}, status=404)
+    return JsonResponse(result)
 
 @require_gym_permission('sales.view_sale')
 def search_clients(request):
@@ -345,17 +287,20 @@ def search_clients(request):
     client_id = request.GET.get('id')  # Direct ID lookup
     gym = request.gym
     
-    clients = Client.objects.filter(gym=gym)
+    clients = Client.objects.for_gym(gym)
     
     # Direct ID lookup takes priority
     if client_id:
         clients = clients.filter(id=client_id)
     elif query:
-        # Check if query is numeric for ID search
+        # Full-text + trigram on PostgreSQL, ordered by relevance (clients/search.py)
+        matches = list(search_clients_by_text(clients, query)[:10])
+        # Numeric query: exact ID match first
         if query.isdigit():
-             clients = clients.filter(id=query) | clients.filter(dni__icontains=query)
-        else:
-             clients = clients.filter(first_name__icontains=query) | clients.filter(last_name__icontains=query) | clients.filter(dni__icontains=query)
+            exact = clients.filter(id=query).first()
+            if exact:
+                matches = [exact] + [c for c in matches if c.pk != exact.pk]
+        clients = matches
     
     results = []
     for c in clients[:10]:
@@ -370,484 +315,423 @@ def search_clients(request):
     
     return JsonResponse({'results': results})
 
-@transaction.atomic
 @require_gym_permission('sales.add_sale')
 @require_http_methods(["POST"])
+@idempotent('sales.process_sale')
+@transaction.atomic
 def process_sale(request):
     try:
-        data = json.loads(request.body)
-        gym = request.gym
-        user = request.user
-        
-        # 1. Helper: Validate Data
-        client_id = data.get('client_id')
-        items = data.get('items', [])
-        # 'payments' list of { method_id: 1, amount: 50 }
-        payments = data.get('payments', [])
-        # Legacy support for single payment_method_id
-        payment_method_id = data.get('payment_method_id') 
-
-        action = data.get('action') 
-        
-        if not items:
-            return JsonResponse({'error': 'El carrito está vacío'}, status=400)
-
-        # 2. Create Order
-        client = None
-        if client_id:
-            client = Client.objects.filter(gym=gym, pk=client_id).first()
-
-        # Custom Date/Time
-        created_at_val = None
-        if data.get('date') and data.get('time'):
-            try:
-                from datetime import datetime as dt
-                created_at_str = f"{data['date']} {data['time']}"
-                created_at_val = dt.strptime(created_at_str, "%Y-%m-%d %H:%M")
-            except ValueError:
-                pass # Ignore invalid format, use auto_now_add logic (actually need to set explicit if we want to override)
-        
-        # Custom Staff
-        sale_user = user
-        if data.get('staff_id'):
-            from django.contrib.auth import get_user_model
-            User = get_user_model()
-            try:
-                sale_user = User.objects.get(id=data['staff_id'], gym_memberships__gym=gym)
-            except User.DoesNotExist:
-                pass
-
-        order = Order.objects.create(
-            gym=gym,
-            client=client,
-            created_by=sale_user,
-            status='PAID', 
-            total_amount=0 
-        )
-        
-        if created_at_val:
-            order.created_at = created_at_val
-            order.save() # Needed because auto_now_add might have set it to now
-
-
-        total_amount = Decimal(0)
-        total_discount = Decimal(0)
-
-        # 3. Create Items
-        for item in items:
-            obj_id = item['id']
-            obj_type = item['type']
-            qty = int(item['qty'])
-            
-            discount_info = item.get('discount', {})
-            disc_type = discount_info.get('type', 'fixed')
-            disc_val = Decimal(str(discount_info.get('value', 0) or 0))
-
-            if obj_type == 'product':
-                obj = Product.objects.get(pk=obj_id, gym=gym)
-            elif obj_type == 'service':
-                obj = Service.objects.get(pk=obj_id, gym=gym)
-            else:
-                obj = MembershipPlan.objects.get(pk=obj_id, gym=gym)
-            
-            unit_price = obj.final_price 
-            base_total = unit_price * qty
-            
-            item_discount = Decimal(0)
-            if disc_val > 0:
-                if disc_type == 'percent':
-                    if disc_val > 100: disc_val = 100
-                    item_discount = base_total * (disc_val / 100)
-                else:
-                    item_discount = disc_val
-            
-            if item_discount > base_total:
-                item_discount = base_total
-                
-            final_subtotal = base_total - item_discount
-
-            # Calculate Base and Tax (Assuming tax-inclusive prices)
-            # Base = Total / (1 + Rate)
-            item_tax_rate_decimal = Decimal(0)
-            if obj.tax_rate:
-                item_tax_rate_decimal = obj.tax_rate.rate_percent / Decimal(100)
-            
-            # Prevent division by zero or weirdness
-            item_base = final_subtotal / (Decimal(1) + item_tax_rate_decimal)
-            item_tax = final_subtotal - item_base
-
-            newItem = OrderItem.objects.create(
-                order=order,
-                content_type=ct,
-                object_id=obj.id,
-                description=obj.name,
-                quantity=qty,
-                unit_price=unit_price,
-                subtotal=final_subtotal,
-                tax_rate=obj.tax_rate.rate_percent if obj.tax_rate else 0,
-                discount_amount=item_discount
-            )
-            
-            total_amount += final_subtotal
-            total_discount += item_discount
-            
-            # Update order totals (in-memory)
-            order.total_base += item_base
-            order.total_tax += item_tax
-
-        # 4. Create Payments (handle mixed)
-        total_paid = Decimal(0)
-        
-        # Process Payments
-        total_paid = 0
-        payments_valid = True
-        
-        for p in payments:
-            method_id = p.get('method_id')
-            amount = float(p.get('amount', 0))
-            
-            stripe_pm_id = p.get('stripe_payment_method_id') # Legacy/Stripe specific
-            
-            # New params for unified cards
-            provider = p.get('provider') # 'stripe' or 'redsys'
-            payment_token = p.get('payment_token') # The ID (pm_... or DB ID for Redsys)
-            
-            # Normalize inputs
-            if stripe_pm_id and not provider:
-                provider = 'stripe'
-                payment_token = stripe_pm_id
-            
-            # Get Method Name (Cash, Card, etc)
-            # Get Method Name (Cash, Card, etc)
-            try:
-                method = PaymentMethod.objects.get(id=method_id)
-            except:
-                # If using integration, maybe method provided is invalid?
-                # Try to find a generic "Card" method
-                if provider: # stripe or redsys
-                    method = PaymentMethod.objects.filter(name__icontains='tarjeta', gym=gym).first()
-                    if not method:
-                        method = PaymentMethod.objects.filter(name__icontains='stripe', gym=gym).first()
-                    if not method:
-                         # Fallback to ANY active method if we have no choice (better than crash?)
-                         # Or create one?
-                         method = PaymentMethod.objects.filter(gym=gym, is_active=True).exclude(name__icontains='efectivo').first()
-                         if not method:
-                             method = PaymentMethod.objects.filter(gym=gym, is_active=True).first()
-                             
-                if not method:
-                     # Critical failure if we can't find a method
-                     # But don't crash yet, let valid validation handle it or create dummy?
-                     # We must have a method.
-                     raise Exception("No se encontró un método de pago válido en la configuración")
-                
-            transaction_id = None
-            
-            # Integrations
-            if provider == 'stripe' and payment_token:
-                 from finance.stripe_utils import charge_client
-                 success, result = charge_client(client, amount, payment_token)
-                 if success:
-                     transaction_id = result # It's the PaymentIntent ID
-                 else:
-                     payments_valid = False
-                     break
-                     
-            elif provider == 'redsys' and payment_token:
-                 from finance.redsys_utils import get_redsys_client
-                 from finance.models import ClientRedsysToken
-                 
-                 # Retrieve Token
-                 try:
-                     redsys_db_token = ClientRedsysToken.objects.get(id=payment_token, client=client)
-                     redsys_client = get_redsys_client(gym)
-                     
-                     if not redsys_client:
-                          raise Exception("Redsys not configured")
-                          
-                     # Generate unique order id for THIS charge
-                     from finance.views_redsys import generate_order_id
-                     order_id = generate_order_id()
-                     
-                     success, result = redsys_client.charge_request(order_id, amount, redsys_db_token.token, f"Order {order.id}")
-                     
-                     if success:
-                         transaction_id = order_id # Or result.get('Ds_Order')
-                     else:
-                         # fail
-                         raise Exception(result)
-                         
-                 except Exception as e:
-                     print(f"Redsys Charge Error: {e}")
-                     payments_valid = False
-                     break
-            
-            OrderPayment.objects.create(
-                order=order,
-                payment_method=method,
-                amount=amount,
-                transaction_id=transaction_id
-            )
-            total_paid += amount
-            
-        if not payments_valid:
-             order.status = 'CANCELLED' # Or failed
-             order.save()
-             return JsonResponse({'error': 'Error procesando el pago con tarjeta'}, status=400)
-             
-        # Check Total
-        if total_paid >= total_amount:
-            order.status = 'PAID'
-        elif total_paid > 0:
-            order.status = 'PARTIAL'
-            
-        order.total_amount = total_amount
-        order.total_discount = total_discount
-        order.save()
-        
-        return JsonResponse({'success': True, 'order_id': order.id})
+        return _record_sale(request, json.loads(request.body))
+    except stock.InsufficientStock as e:
+        transaction.set_rollback(True)
+        return JsonResponse({'error': str(e)}, status=409)
     except Exception as e:
         print(e)
         return JsonResponse({'error': str(e)}, status=500)
 
-def send_invoice_email(order, email):
+@require_gym_permission('sales.add_sale')
+@require_http_methods(["POST"])
+def offline_sync(request):
     """
-    Generates PDF invoice and sends it via email.
+    Batch sync of sales queued by the till while offline (sales/offline_sync.py).
+    Body: {"sales": [{offline_key, created_at, staff_id, client_id, items, payments}, ...]}
     """
     try:
-        # 1. Render HTML
-        html_content = render_to_string('emails/invoice.html', {
-            'order': order,
-            'gym': order.gym,
-            'items': order.items.all(),
-            'payments': order.payments.all()
-        })
-        
-        # 2. Send Email
-        email_msg = EmailMessage(
-            subject=f'Factura {order.invoice_number} - {order.gym.name}',
-            body=f"Adjuntamos su factura {order.invoice_number}.\n\nGracias por su confianza.",
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[email]
-        )
-        
-        # In a real app we'd attach a PDF. For now, we'll send the HTML as body.
-        # Or attach HTML.
-        # Let's send HTML body for simplicity.
-        email_msg.content_subtype = 'html' 
-        email_msg.body = html_content 
-        email_msg.send()
-        
-        print(f"Invoice {order.invoice_number} sent to {email}")
-    except Exception as e:
-        print(f"Error sending invoice email: {e}")
-
-
-def send_ticket_email(order, email):
-    # Stub for sending email
-    print(f"Sending Ticket #{order.id} to {email}")
-    pass
+        sales = json.loads(request.body).get('sales')
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'JSON no válido'}, status=400)
+    if not isinstance(sales, list) or not all(isinstance(sale, dict) for sale in sales):
+        return JsonResponse({'error': 'Se esperaba una lista de ventas'}, status=400)
+    if len(sales) > offline_sync_utils.MAX_SALES_PER_REQUEST:
+        return JsonResponse({'error': f'Máximo {offline_sync_utils.MAX_SALES_PER_REQUEST} ventas por petición'}, status=400)
+
+    results = offline_sync_utils.sync_sales(request.gym, request.user, sales)
+    return JsonResponse({'results': results})
 
-@csrf_exempt
-@require_POST
-def subscription_charge(request, pk):
+def _record_sale(request, data, charges=None):
     """
-    Attempts to charge a subscription (ClientMembership) using stored payment methods.
+    Creates the order, items and payments.
+    charges: {payment index: transaction_id} for card payments already charged.
     """
-    try:
-        from clients.models import ClientMembership
-        from memberships.models import MembershipPlan
-        
-        membership = get_object_or_404(ClientMembership, pk=pk)
-        client = membership.client
-        gym = client.gym
-        amount = membership.price
-        
-        if amount <= 0:
-             return JsonResponse({'error': 'El importe es 0, no se puede cobrar'}, status=400)
+    gym = request.gym
+    user = request.user
+    
+    # 1. Helper: Validate Data
+    client_id = data.get('client_id')
+    items = data.get('items', [])
+    # 'payments' list of { method_id: 1, amount: 50 }
+    payments = data.get('payments', [])
+    # Legacy support for single payment_method_id
+    payment_method_id = data.get('payment_method_id') 
+
+    action = data.get('action') 
+    
+    if not items:
+        return JsonResponse({'error': 'El carrito está vacío'}, status=400)
 
-        import json
-        
-        # Parse Body if needed (Alpine fetch sends JSON often, but we used key-value before. Let's support both)
-        data = {}
-        if request.body:
-             try:
-                 data = json.loads(request.body)
-             except:
-                 pass
-        
-        explicit_method_id = request.POST.get('method_id') or data.get('method_id')
+    # 2. Create Order
+    client = None
+    if client_id:
+        client = Client.objects.for_gym(gym).filter(pk=client_id).first()
 
-        # 1. Determine Payment Method & Token
-        provider = None
-        token = None
-        method = None
-        
-        # A) Explicit Method Selection (Manual or Specific Auto)
-        if explicit_method_id:
-            method = get_object_or_404(PaymentMethod, pk=explicit_method_id, gym=gym)
-            
-            # Check if it's an auto method or manual
-            # For now, we assume if it has a specific provider_code it might be auto, 
-            # but usually manual methods are just "Cash", "Card (Physical)".
-            # We can check name or provider_code.
-            if method.name.lower() in ['stripe', 'redsys'] or (method.provider_code and method.provider_code in ['stripe', 'redsys']):
-                 # It is an auto method, try to find token for it
-                 pass # Fallthrough to auto logic but using this method
-            else:
-                 # It is a MANUAL method
-                 provider = 'manual'
-        
-        # B) Auto-Detect (only if no manual provider selected)
-        if not provider:
-            # Priority: Stripe > Redsys > Fail
-            if client.stripe_customer_id:
-                provider = 'stripe'
-                if client.stripe_customer_id.startswith('cus_test'): # TEST MODE
-                     token = 'pm_card_test_success'
-                else:
-                     token = client.stripe_customer_id 
-                # Find generic Stripe method if not set
-                if not method:
-                    method = PaymentMethod.objects.filter(gym=gym, name__icontains='Stripe').first()
-                
-            elif client.redsys_tokens.exists():
-                provider = 'redsys'
-                merchant_token = client.redsys_tokens.last()
-                token = merchant_token.id 
-                if not method:
-                    method = PaymentMethod.objects.filter(gym=gym, name__icontains='Tarjeta').first()
-
-        # Validation
-        if provider != 'manual' and not provider:
-             return JsonResponse({'error': 'El cliente no tiene tarjeta vinculada (Stripe/Redsys)', 'error_code': 'NO_CARD'}, status=400)
-             
-        if not method:
-             # Fallback
-             method = PaymentMethod.objects.filter(gym=gym, is_active=True).first()
-
-        # 2. Create Order (Pending)
-        order = Order.objects.create(
-            gym=gym,
-            client=client,
-            status='PENDING',
-            total_amount=amount,
-            total_base=amount / Decimal(1.21), # Approx
-            total_tax=amount - (amount / Decimal(1.21)),
-            created_by=request.user if request.user.is_authenticated else None,
-            internal_notes=f"Renovación: {membership.name}"
-        )
-        
-        # Add Item
-        OrderItem.objects.create(
-            order=order,
-            content_type=ContentType.objects.get_for_model(ClientMembership),
-            object_id=membership.id,
-            description=f"Cuota: {membership.name}",
-            quantity=1,
-            unit_price=amount,
-            subtotal=amount
-        )
-        
-        # 3. Attempt Charge
-        success = False
+    # Custom Date/Time
+    created_at_val = None
+    if data.get('date') and data.get('time'):
+        try:
+            from datetime import datetime as dt
+            created_at_str = f"{data['date']} {data['time']}"
+            created_at_val = timezone.make_aware(dt.strptime(created_at_str, "%Y-%m-%d %H:%M"))
+        except ValueError:
+            pass # Ignore invalid format, use auto_now_add logic (actually need to set explicit if we want to override)
+    
+    # Custom Staff
+    sale_user = user
+    if data.get('staff_id'):
+        from django.contrib.auth import get_user_model
+        User = get_user_model()
+        try:
+            sale_user = User.objects.get(id=data['staff_id'], gym_memberships__gym=gym)
+        except User.DoesNotExist:
+            pass
+
+    # 3. Resolve cart and payment methods (one query per item type + one for methods)
+    lines = pipeline.resolve_cart(gym, items)
+    total_amount = sum((line.subtotal for line in lines), Decimal(0))
+    total_discount = sum((line.discount for line in lines), Decimal(0))
+    total_base = sum((line.base for line in lines), Decimal(0))
+
+    methods = pipeline.PaymentMethodResolver(gym)
+    resolved_payments = []
+    for p in payments:
+        # New params for unified cards
+        provider = p.get('provider') # 'stripe' or 'redsys'
+        payment_token = p.get('payment_token') # The ID (pm_... or DB ID for Redsys)
+
+        # Normalize inputs
+        stripe_pm_id = p.get('stripe_payment_method_id') # Legacy/Stripe specific
+        if stripe_pm_id and not provider:
+            provider = 'stripe'
+            payment_token = stripe_pm_id
+
+        method = methods.resolve(p.get('method_id'), provider)
+        resolved_payments.append((method, pipeline.money(p.get('amount', 0) or 0), provider, payment_token))
+
+    total_paid = sum((amount for _, amount, _, _ in resolved_payments), Decimal(0))
+    status = 'PARTIAL' if 0 < total_paid < total_amount else 'PAID'
+
+    order = Order.objects.create(
+        gym=gym,
+        client=client,
+        created_by=sale_user,
+        status=status,
+        total_amount=total_amount,
+        total_discount=total_discount,
+        total_base=total_base,
+        total_tax=total_amount - total_base,
+    )
+
+    if created_at_val:
+        # auto_now_add ignores the value passed to create()
+        Order.objects.filter(pk=order.pk).update(created_at=created_at_val)
+        order.created_at = created_at_val
+
+    pipeline.write_items(order, lines)
+
+    # Stock: one UPDATE for the whole cart, before any card is charged
+    stock_moves = stock.sale_moves(lines, user=sale_user, notes=f"Venta #{order.id}")
+    stock.apply_moves(gym, stock_moves, check=settings.STOCK_PREVENT_OVERSELL)
+
+    # 4. Create Payments (handle mixed)
+    payments_valid = True
+    payment_rows = []
+
+    for index, (method, amount, provider, payment_token) in enumerate(resolved_payments):
         transaction_id = None
-        error_msg = ""
-        
-        if provider == 'stripe':
+
+        # Integrations
+        if charges and index in charges:
+            # Already charged by the async view (sales/api_async.py)
+            transaction_id = charges[index]
+        elif provider == 'stripe' and payment_token:
              from finance.stripe_utils import charge_client
-             # charge_client expects (client, amount, payment_method_id)
-             # If using Customer ID, we might need a different call or ensure charge_client handles it.
-             # Assuming charge_client handles it for now or we pass a source.
-             # Let's try passing the customer_id as token
-             s_success, s_res = charge_client(client, amount, token) 
-             if s_success:
-                 success = True
-                 transaction_id = s_res
+             success, result = charge_client(client, float(amount), payment_token)
+             if success:
+                 mark_charged(request)
+                 transaction_id = result # It's the PaymentIntent ID
              else:
-                 error_msg = str(s_res)
-                 
-        elif provider == 'redsys':
+                 payments_valid = False
+                 break
+
+        elif provider == 'redsys' and payment_token:
              from finance.redsys_utils import get_redsys_client
              from finance.models import ClientRedsysToken
-             from finance.views_redsys import generate_order_id
-             
+
+             # Retrieve Token
              try:
-                 r_token = ClientRedsysToken.objects.get(id=token)
-                 r_client = get_redsys_client(gym)
-                 order_code = generate_order_id()
-                 r_success, r_res = r_client.charge_request(order_code, amount, r_token.token, f"Ord {order.id}")
-                 
-                 if r_success:
-                     success = True
-                     transaction_id = order_code
+                 redsys_db_token = ClientRedsysToken.objects.get(id=payment_token, client=client)
+                 redsys_client = get_redsys_client(gym)
+
+                 if not redsys_client:
+                      raise Exception("Redsys not configured")
+
+                 # Generate unique order id for THIS charge
+                 from finance.views_redsys import generate_order_id
+                 order_id = generate_order_id()
+
+                 success, result = redsys_client.charge_request(order_id, float(amount), redsys_db_token.token, f"Order {order.id}")
+
+                 if success:
+                     mark_charged(request)
+                     transaction_id = order_id # Or result.get('Ds_Order')
                  else:
-                     error_msg = "Error Redsys"
+                     # fail
+                     raise Exception(result)
+
              except Exception as e:
-                 error_msg = str(e)
+                 print(f"Redsys Charge Error: {e}")
+                 payments_valid = False
+                 break
 
-        elif provider == 'manual':
-             success = True
-             transaction_id = f"MANUAL-{request.user.id}-{date.today()}"
-             # Check if Cash control is needed? 
-             # For now, simple record. If is_cash, maybe we should open shift? 
-             # We assume Shift is open or we just record it.
+        payment_rows.append((method, amount, transaction_id))
+
+    pipeline.write_payments(order, payment_rows)
+
+    if not payments_valid:
+         order.status = 'CANCELLED' # Or failed
+         order.save(update_fields=['status', 'updated_at'])
+         stock.apply_moves(gym, stock.reverse_moves(stock_moves, notes=f"Pago fallido venta #{order.id}"))
+         return JsonResponse({'error': 'Error procesando el pago con tarjeta'}, status=400)
+
+    return JsonResponse({'success': True, 'order_id': order.id})
+
+def _subscription_prepare(request, pk):
+    """
+    Validates the subscription charge and creates the PENDING order.
+    Returns (context, None) or (None, error_response).
+    """
+    from clients.models import ClientMembership
+    
+    membership = get_object_or_404(ClientMembership, pk=pk)
+    client = membership.client
+    gym = client.gym
+    amount = membership.price
+    
+    if amount <= 0:
+         return None, JsonResponse({'error': 'El importe es 0, no se puede cobrar'}, status=400)
+
+    import json
+    
+    # Parse Body if needed (Alpine fetch sends JSON often, but we used key-value before. Let's support both)
+    data = {}
+    if request.body:
+         try:
+             data = json.loads(request.body)
+         except:
              pass
+    
+    explicit_method_id = request.POST.get('method_id') or data.get('method_id')
+
+    # 1. Determine Payment Method & Token
+    provider = None
+    token = None
+    method = None
+    
+    # A) Explicit Method Selection (Manual or Specific Auto)
+    if explicit_method_id:
+        method = get_object_or_404(PaymentMethod, pk=explicit_method_id, gym=gym)
         
-        # 4. Handle Result
-        if success:
-            # Payment Record
-            OrderPayment.objects.create(
-                order=order,
-                payment_method=method,
-                amount=amount,
-                transaction_id=transaction_id
-            )
-            order.status = 'PAID'
-            order.save()
-            
-            # Extend Membership
-            # Look up plan by name to get frequency
-            plan = MembershipPlan.objects.filter(gym=gym, name=membership.name).first()
-            if plan:
-                # Add frequency
-                from dateutil.relativedelta import relativedelta
-                if plan.frequency_unit == 'MONTH':
-                    delta = relativedelta(months=plan.frequency_amount)
-                elif plan.frequency_unit == 'YEAR':
-                    delta = relativedelta(years=plan.frequency_amount)
-                elif plan.frequency_unit == 'WEEK':
-                    delta = relativedelta(weeks=plan.frequency_amount)
-                elif plan.frequency_unit == 'DAY':
-                     delta = timedelta(days=plan.frequency_amount)
-                else:
-                     delta = relativedelta(months=1)
-            else:
-                # Default 1 month
-                from dateutil.relativedelta import relativedelta
-                delta = relativedelta(months=1)
-                
-            # Update end_date
-            if membership.end_date:
-                # If expired long ago, maybe start from today? 
-                # User said "cobros futuros" ... "fecha de vencimiento". 
-                # Ideally we add to the existing end_date to keep the cycle.
-                membership.end_date += delta
+        # Check if it's an auto method or manual
+        # For now, we assume if it has a specific provider_code it might be auto, 
+        # but usually manual methods are just "Cash", "Card (Physical)".
+        # We can check name or provider_code.
+        if method.name.lower() in ['stripe', 'redsys'] or (method.provider_code and method.provider_code in ['stripe', 'redsys']):
+             # It is an auto method, try to find token for it
+             pass # Fallthrough to auto logic but using this method
+        else:
+             # It is a MANUAL method
+             provider = 'manual'
+    
+    # B) Auto-Detect (only if no manual provider selected)
+    if not provider:
+        # Priority: Stripe > Redsys > Fail
+        if client.stripe_customer_id:
+            provider = 'stripe'
+            if client.stripe_customer_id.startswith('cus_test'): # TEST MODE
+                 token = 'pm_card_test_success'
             else:
-                membership.end_date = date.today() + delta
-            
-            membership.save()
+                 token = client.stripe_customer_id 
+            # Find generic Stripe method if not set
+            if not method:
+                method = PaymentMethod.objects.for_gym(gym).filter(name__icontains='Stripe').first()
             
-            return JsonResponse({'success': True, 'message': f'Cobrado Correctamente. Nueva fecha: {membership.end_date}'})
+        elif client.redsys_tokens.exists():
+            provider = 'redsys'
+            merchant_token = client.redsys_tokens.last()
+            token = merchant_token.id 
+            if not method:
+                method = PaymentMethod.objects.for_gym(gym).filter(name__icontains='Tarjeta').first()
+
+    # Validation
+    if provider != 'manual' and not provider:
+         return None, JsonResponse({'error': 'El cliente no tiene tarjeta vinculada (Stripe/Redsys)', 'error_code': 'NO_CARD'}, status=400)
+         
+    if not method:
+         # Fallback
+         method = PaymentMethod.objects.for_gym(gym).filter(is_active=True).first()
+
+    # 2. Create Order (Pending)
+    order = Order.objects.create(
+        gym=gym,
+        client=client,
+        status='PENDING',
+        total_amount=amount,
+        total_base=amount / Decimal(1.21), # Approx
+        total_tax=amount - (amount / Decimal(1.21)),
+        created_by=request.user if request.user.is_authenticated else None,
+        internal_notes=f"Renovación: {membership.name}"
+    )
+    
+    # Add Item
+    OrderItem.objects.create(
+        order=order,
+        content_type=ContentType.objects.get_for_model(ClientMembership),
+        object_id=membership.id,
+        description=f"Cuota: {membership.name}",
+        quantity=1,
+        unit_price=amount,
+        subtotal=amount
+    )
+
+    return {
+        'membership': membership, 'client': client, 'gym': gym, 'amount': amount,
+        'method': method, 'provider': provider, 'token': token, 'order': order,
+    }, None
+
+def _subscription_charge_card(request, ctx):
+    """Charges the card synchronously. Returns (success, transaction_id, error_msg)."""
+    client, gym, amount, token, order = ctx['client'], ctx['gym'], ctx['amount'], ctx['token'], ctx['order']
+    provider = ctx['provider']
+
+    # 3. Attempt Charge
+    success = False
+    transaction_id = None
+    error_msg = ""
+    
+    if provider == 'stripe':
+         from finance.stripe_utils import charge_client
+         # charge_client expects (client, amount, payment_method_id)
+         # If using Customer ID, we might need a different call or ensure charge_client handles it.
+         # Assuming charge_client handles it for now or we pass a source.
+         # Let's try passing the customer_id as token
+         s_success, s_res = charge_client(client, amount, token) 
+         if s_success:
+             mark_charged(request)
+             success = True
+             transaction_id = s_res
+         else:
+             error_msg = str(s_res)
+             
+    elif provider == 'redsys':
+         from finance.redsys_utils import get_redsys_client
+         from finance.models import ClientRedsysToken
+         from finance.views_redsys import generate_order_id
+         
+         try:
+             r_token = ClientRedsysToken.objects.get(id=token)
+             r_client = get_redsys_client(gym)
+             order_code = generate_order_id()
+             r_success, r_res = r_client.charge_request(order_code, amount, r_token.token, f"Ord {order.id}")
+             
+             if r_success:
+                 mark_charged(request)
+                 success = True
+                 transaction_id = order_code
+             else:
+                 error_msg = "Error Redsys"
+         except Exception as e:
+             error_msg = str(e)
+
+    elif provider == 'manual':
+         success = True
+         transaction_id = f"MANUAL-{request.user.id}-{date.today()}"
+         # Check if Cash control is needed? 
+         # For now, simple record. If is_cash, maybe we should open shift? 
+         # We assume Shift is open or we just record it.
+         pass
+
+    return success, transaction_id, error_msg
+
+def _subscription_finish(ctx, success, transaction_id, error_msg):
+    """Records the payment and extends the membership, or cancels the order."""
+    from memberships.models import MembershipPlan
+
+    membership, gym, amount, method, order = ctx['membership'], ctx['gym'], ctx['amount'], ctx['method'], ctx['order']
+
+    # 4. Handle Result
+    if success:
+        # Payment Record
+        OrderPayment.objects.create(
+            order=order,
+            payment_method=method,
+            amount=amount,
+            transaction_id=transaction_id
+        )
+        order.status = 'PAID'
+        order.save()
+        
+        # Extend Membership
+        # Look up plan by name to get frequency
+        plan = MembershipPlan.objects.filter(gym=gym, name=membership.name).first()
+        if plan:
+            # Add frequency
+            from dateutil.relativedelta import relativedelta
+            if plan.frequency_unit == 'MONTH':
+                delta = relativedelta(months=plan.frequency_amount)
+            elif plan.frequency_unit == 'YEAR':
+                delta = relativedelta(years=plan.frequency_amount)
+            elif plan.frequency_unit == 'WEEK':
+                delta = relativedelta(weeks=plan.frequency_amount)
+            elif plan.frequency_unit == 'DAY':
+                 delta = timedelta(days=plan.frequency_amount)
+            else:
+                 delta = relativedelta(months=1)
         else:
-            # Failed
-            order.status = 'CANCELLED' # Or failed
-            order.internal_notes += f" | Fallo cobro: {error_msg}"
-            order.save()
-            return JsonResponse({'error': f'Fallo en el cobro: {error_msg}', 'error_code': 'CHARGE_FAILED'}, status=400)
+            # Default 1 month
+            from dateutil.relativedelta import relativedelta
+            delta = relativedelta(months=1)
             
+        # Update end_date
+        if membership.end_date:
+            # If expired long ago, maybe start from today? 
+            # User said "cobros futuros" ... "fecha de vencimiento". 
+            # Ideally we add to the existing end_date to keep the cycle.
+            membership.end_date += delta
+        else:
+            membership.end_date = date.today() + delta
+        
+        membership.save()
+        
+        return JsonResponse({'success': True, 'message': f'Cobrado Correctamente. Nueva fecha: {membership.end_date}'})
+    else:
+        # Failed
+        order.status = 'CANCELLED' # Or failed
+        order.internal_notes += f" | Fallo cobro: {error_msg}"
+        order.save()
+        return JsonResponse({'error': f'Fallo en el cobro: {error_msg}', 'error_code': 'CHARGE_FAILED'}, status=400)
 
-
+@csrf_exempt
+@require_POST
+@idempotent('sales.subscription_charge')
+def subscription_charge(request, pk):
+    """
+    Attempts to charge a subscription (ClientMembership) using stored payment methods.
+    """
+    try:
+        ctx, error = _subscription_prepare(request, pk)
+        if error:
+            return error
+        success, transaction_id, error_msg = _subscription_charge_card(request, ctx)
+        return _subscription_finish(ctx, success, transaction_id, error_msg)
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -0,0 +1,201 @@
+"""
+Async variants of the POS endpoints that wait on Stripe/Redsys.
+
+Used when running under ASGI (settings.ASYNC_GATEWAY_VIEWS, see config/asgi.py):
+gateway calls go through finance.gateways (httpx) and don't block a worker, and
+the DB work reuses the sync code in sales/api.py through sync_to_async.
+"""
+import asyncio
+import datetime
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.http import Http404, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods, require_POST
+
+from accounts.decorators import require_gym_permission
+from accounts.services import current_gym
+from clients.models import Client
+from finance import gateways
+from products import stock
+from . import refunds
+from .api import _record_sale, _subscription_finish, _subscription_prepare
+from .idempotency import idempotent, mark_charged
+from .models import Order
+
+logger = logging.getLogger(__name__)
+
+
+def _card_payments(payments):
+    """{index: (provider, token, amount)} for the payments that must be charged to a card."""
+    cards = {}
+    for index, p in enumerate(payments):
+        provider = p.get('provider')
+        token = p.get('payment_token')
+        if p.get('stripe_payment_method_id') and not provider:
+            provider, token = 'stripe', p['stripe_payment_method_id']
+        if provider in ('stripe', 'redsys') and token:
+            cards[index] = (provider, token, float(p.get('amount', 0)))
+    return cards
+
+
+@require_gym_permission('sales.view_sale')
+async def get_client_cards(request, client_id):
+    """
+    Returns list of saved cards for a client (Stripe + Redsys)
+    """
+    gym = await sync_to_async(current_gym)(request)
+    client = await Client.objects.for_gym(gym).filter(id=client_id).afirst()
+    if client is None:
+        raise Http404
+
+    cards = []
+
+    # 1. Stripe Cards
+    for card in await gateways.list_payment_methods(client, gym):
+        brand = card['card']['brand'].upper()
+        cards.append({
+            'id': card['id'],
+            'provider': 'stripe',
+            'brand': brand,
+            'last4': card['card']['last4'],
+            'display': f"💳 {brand} **** {card['card']['last4']}"
+        })
+
+    # 2. Redsys Cards
+    async for token in client.redsys_tokens.all():
+        cards.append({
+            'id': token.id,
+            'provider': 'redsys',
+            'brand': token.card_brand or 'CARD',
+            'last4': token.card_number[-4:] if token.card_number else '****',
+            'display': f"💳 {token.card_brand or 'TARJETA'} {token.card_number or '**** ****'}"
+        })
+
+    return JsonResponse(cards, safe=False)
+
+
+@require_http_methods(["POST"])
+@require_gym_permission('sales.delete_sale')
+@idempotent('sales.order_cancel')
+async def order_cancel(request, order_id):
+    """
+    Cancels an order, refunding all its card payments concurrently.
+    """
+    gym = await sync_to_async(current_gym)(request)
+    order = await Order.objects.for_gym(gym).filter(id=order_id).afirst()
+    if order is None:
+        raise Http404
+
+    if order.status == 'CANCELLED':
+        return JsonResponse({'error': 'Esta venta ya está cancelada'}, status=400)
+
+    # Same orchestration as the sync view, with asyncio tasks (sales/refunds.py)
+    attempts = await refunds.arefund_order(order, gym)
+    refund_notes = refunds.notes(attempts)
+
+    user = request.user
+    order.status = 'CANCELLED'
+    note = f"\n[Cancelado por {user.get_full_name() or user.email} el {datetime.datetime.now().strftime('%d/%m/%Y %H:%M')}]"
+    if refund_notes:
+        note += "\n" + "\n".join(refund_notes)
+
+    await order.asave(update_fields=['status', 'updated_at'])
+    # Refunds still running in the background append to the notes too
+    await sync_to_async(refunds.add_note)(order, note)
+
+    return JsonResponse({
+        'success': True,
+        'message': 'Venta cancelada. ' + ', '.join(refund_notes),
+        'refunds': refunds.summary(attempts),
+    })
+
+
+@sync_to_async
+def _record_sale_atomic(request, data, charges=None):
+    try:
+        with transaction.atomic():
+            return _record_sale(request, data, charges)
+    except stock.InsufficientStock as e:
+        return JsonResponse({'error': str(e)}, status=409)
+
+
+@require_gym_permission('sales.add_sale')
+@require_http_methods(["POST"])
+@idempotent('sales.process_sale')
+async def process_sale(request):
+    """
+    Same as api.process_sale, but card payments are charged concurrently before
+    the order is recorded. If any charge (or recording the sale) fails, the
+    successful charges are refunded.
+    """
+    try:
+        data = json.loads(request.body)
+        cards = _card_payments(data.get('payments', []))
+        if not cards or not data.get('items'):
+            return await _record_sale_atomic(request, data)
+
+        gym = await sync_to_async(current_gym)(request)
+        client = None
+        if data.get('client_id'):
+            client = await Client.objects.for_gym(gym).filter(pk=data['client_id']).afirst()
+
+        indexes = list(cards)
+        results = await asyncio.gather(*[
+            gateways.charge(client, gym, provider, token, amount, "Venta TPV")
+            for provider, token, amount in cards.values()
+        ])
+        charges = {index: result for index, (success, result) in zip(indexes, results) if success}
+        if charges:
+            mark_charged(request)
+
+        response = None
+        if len(charges) == len(cards):
+            try:
+                response = await _record_sale_atomic(request, data, charges)
+            except Exception:
+                logger.exception("Error recording sale after charging the card")
+        if response is None or response.status_code != 200:
+            refunded = await asyncio.gather(*[
+                gateways.refund(gym, transaction_id, cards[index][2])
+                for index, transaction_id in charges.items()
+            ])
+            # Everything charged was given back: a retry may charge again
+            mark_charged(request, not all(success for success, _ in refunded))
+            return response or JsonResponse({'error': 'Error procesando el pago con tarjeta'}, status=400)
+        return response
+    except Exception as e:
+        logger.exception("Error processing sale")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_POST
+@idempotent('sales.subscription_charge')
+async def subscription_charge(request, pk):
+    """
+    Attempts to charge a subscription (ClientMembership) using stored payment methods.
+    """
+    try:
+        ctx, error = await sync_to_async(_subscription_prepare)(request, pk)
+        if error:
+            return error
+
+        provider = ctx['provider']
+        if provider == 'manual':
+            success, transaction_id, error_msg = True, f"MANUAL-{request.user.id}-{datetime.date.today()}", ""
+        else:
+            success, result = await gateways.charge(
+                ctx['client'], ctx['gym'], provider, ctx['token'], ctx['amount'], f"Ord {ctx['order'].id}"
+            )
+            transaction_id, error_msg = (result, "") if success else (None, str(result))
+            if success:
+                mark_charged(request)
+
+        return await sync_to_async(_subscription_finish)(ctx, success, transaction_id, error_msg)
+    except Exception as e:
+        logger.exception("Error charging subscription %s", pk)
+        return JsonResponse({'error': str(e)}, status=500)
@@ -0,0 +1,280 @@
+"""
+Índice en memoria del catálogo del TPV (productos, servicios y planes) por gym.
+
+La búsqueda del TPV se lanza en cada pulsación de tecla; en lugar de tres
+`icontains` contra la BD, cada proceso mantiene un índice por gym con los nombres
+normalizados (minúsculas, sin acentos), prefijos de cada palabra, SKU, categoría
+y el precio final ya calculado.
+
+- Se construye la primera vez que se busca en el gym (3 queries).
+- Los cambios hechos en otros procesos se detectan por la versión del espacio
+  "catalog" de organizations.tenant_cache: si no coincide, se reconstruye.
+- sales/signals.py actualiza la entrada al confirmarse el guardado/borrado de un
+  item en este proceso, justo después del bump de la versión. El índice solo
+  adopta la versión nueva si estaba en la inmediatamente anterior; si no, otro
+  proceso ha cambiado algo entre medias y el índice se descarta.
+
+Uso:
+    results = catalog_index.search(gym, "prote")
+"""
+import threading
+import unicodedata
+from dataclasses import dataclass, field
+
+from memberships.models import MembershipPlan
+from organizations import tenant_cache
+from products.models import Product
+from services.models import Service
+
+MAX_PREFIX = 12
+PER_TYPE_LIMIT = 10
+DEFAULT_LIMIT = 30
+
+TYPE_ORDER = ("product", "service", "membership")
+NO_CATEGORY = "Sin Categoría"
+PLAN_CATEGORY = "Cuota / Plan"
+
+# Rango (menor es mejor)
+RANK_SKU = 0
+RANK_EXACT = 1
+RANK_NAME_PREFIX = 2
+RANK_WORD_PREFIX = 3
+RANK_CONTAINS = 4
+
+
+def normalize(text):
+    """Minúsculas y sin acentos: "Proteína Whey" -> "proteina whey"."""
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in text if not unicodedata.combining(c)).lower().strip()
+
+
+def tokenize(text):
+    return [t for t in "".join(c if c.isalnum() else " " for c in normalize(text)).split() if t]
+
+
+@dataclass
+class CatalogEntry:
+    type: str
+    id: int
+    name: str
+    price: float
+    image: str = None
+    category: str = NO_CATEGORY
+    sku: str = ""
+    norm_name: str = field(init=False)
+    tokens: list = field(init=False)
+
+    def __post_init__(self):
+        self.norm_name = normalize(self.name)
+        self.tokens = tokenize(self.name) + tokenize(self.category)
+        self.sku = normalize(self.sku)
+
+    @property
+    def key(self):
+        return (self.type, self.id)
+
+    def as_result(self):
+        return {
+            "type": self.type,
+            "id": self.id,
+            "name": self.name,
+            "price": self.price,
+            "image": self.image,
+            "category": self.category,
+        }
+
+
+def _image_url(obj):
+    try:
+        return obj.image.url if obj.image else None
+    except ValueError:
+        return None
+
+
+def entry_for(obj):
+    """CatalogEntry de un Product/Service/MembershipPlan (con category y tax_rate ya cargados)."""
+    if isinstance(obj, MembershipPlan):
+        return CatalogEntry("membership", obj.id, obj.name, float(obj.final_price), _image_url(obj), PLAN_CATEGORY)
+    category = obj.category.name if obj.category else NO_CATEGORY
+    return CatalogEntry(
+        _type_of(obj), obj.id, obj.name, float(obj.final_price), _image_url(obj), category,
+        sku=getattr(obj, "sku", "") or "",
+    )
+
+
+def load_entries(gym):
+    entries = []
+    for model in (Product, Service):
+        for obj in model.objects.filter(gym=gym, is_active=True).select_related("category", "tax_rate"):
+            entries.append(entry_for(obj))
+    for plan in MembershipPlan.objects.filter(gym=gym, is_active=True).select_related("tax_rate"):
+        entries.append(entry_for(plan))
+    return entries
+
+
+class CatalogIndex:
+    def __init__(self, entries=(), version=None):
+        self.version = version
+        self.entries = {}
+        self.prefixes = {}
+        self.skus = {}
+        self._lock = threading.Lock()
+        for entry in entries:
+            self._add(entry)
+
+    # -- mantenimiento --------------------------------------------------
+
+    def _add(self, entry):
+        self.entries[entry.key] = entry
+        for token in entry.tokens:
+            for i in range(1, min(len(token), MAX_PREFIX) + 1):
+                self.prefixes.setdefault(token[:i], set()).add(entry.key)
+        if entry.sku:
+            self.skus.setdefault(entry.sku, set()).add(entry.key)
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for token in entry.tokens:
+            for i in range(1, min(len(token), MAX_PREFIX) + 1):
+                keys = self.prefixes.get(token[:i])
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self.prefixes[token[:i]]
+        if entry.sku:
+            keys = self.skus.get(entry.sku)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.skus[entry.sku]
+
+    def upsert(self, entry):
+        with self._lock:
+            self._remove(entry.key)
+            self._add(entry)
+
+    def remove(self, entry_type, entry_id):
+        with self._lock:
+            self._remove((entry_type, entry_id))
+
+    # -- búsqueda -------------------------------------------------------
+
+    def _sorted(self, keys):
+        entries = [self.entries[k] for k in keys if k in self.entries]
+        return sorted(entries, key=lambda e: (TYPE_ORDER.index(e.type), e.norm_name, e.id))
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        with self._lock:
+            q = normalize(query)
+            if not q:
+                # Sin texto: los primeros de cada tipo, como antes
+                counts = dict.fromkeys(TYPE_ORDER, 0)
+                results = []
+                for entry in self._sorted(self.entries):
+                    if counts[entry.type] < PER_TYPE_LIMIT:
+                        counts[entry.type] += 1
+                        results.append(entry)
+                return results
+
+            ranked = {}
+            for key in self.skus.get(q, ()):
+                ranked[key] = RANK_SKU
+
+            tokens = tokenize(q)
+            candidates = None
+            for token in tokens:
+                keys = self.prefixes.get(token[:MAX_PREFIX], set())
+                if len(token) > MAX_PREFIX:
+                    keys = {k for k in keys if any(t.startswith(token) for t in self.entries[k].tokens)}
+                candidates = keys if candidates is None else candidates & keys
+                if not candidates:
+                    break
+            for key in candidates or ():
+                name = self.entries[key].norm_name
+                rank = RANK_EXACT if name == q else RANK_NAME_PREFIX if name.startswith(q) else RANK_WORD_PREFIX
+                ranked.setdefault(key, rank)
+
+            # Como el icontains de antes: también dentro de la palabra ("whey" en "protewhey")
+            if len(ranked) < limit:
+                for key, entry in self.entries.items():
+                    if key not in ranked and q in entry.norm_name:
+                        ranked[key] = RANK_CONTAINS
+
+            entries = [self.entries[k] for k in ranked]
+            entries.sort(key=lambda e: (ranked[e.key], len(e.norm_name), TYPE_ORDER.index(e.type), e.norm_name))
+            return entries[:limit]
+
+
+# --------------------------------------------------
+# Registro por gym (por proceso)
+# --------------------------------------------------
+
+_indexes = {}
+_registry_lock = threading.Lock()
+
+
+def _gym_id(gym):
+    return getattr(gym, "pk", gym)
+
+
+def get_index(gym):
+    gym_id = _gym_id(gym)
+    version = tenant_cache.namespace_version(gym_id, tenant_cache.CATALOG)
+    index = _indexes.get(gym_id)
+    if index is not None and index.version == version:
+        return index
+
+    with _registry_lock:
+        index = _indexes.get(gym_id)
+        if index is None or index.version != version:
+            index = _indexes[gym_id] = CatalogIndex(load_entries(gym_id), version)
+        return index
+
+
+def search(gym, query, limit=DEFAULT_LIMIT):
+    return [entry.as_result() for entry in get_index(gym).search(query, limit)]
+
+
+def _type_of(obj):
+    if isinstance(obj, MembershipPlan):
+        return "membership"
+    return "product" if isinstance(obj, Product) else "service"
+
+
+def _apply(gym_id, change):
+    """
+    Aplica `change(index)` al índice del gym si solo le falta el último bump (el de
+    este cambio). Si le falta alguno más, lo descarta: se reconstruye al buscar.
+    """
+    with _registry_lock:
+        index = _indexes.get(gym_id)
+        if index is None:
+            return
+        version = tenant_cache.namespace_version(gym_id, tenant_cache.CATALOG)
+        if index.version + 1 != version:
+            del _indexes[gym_id]
+            return
+        change(index)
+        index.version = version
+
+
+def refresh(obj):
+    """Actualiza (o quita, si ya no está activo) un item en el índice ya construido de su gym."""
+    def change(index):
+        if obj.is_active:
+            index.upsert(entry_for(obj))
+        else:
+            index.remove(_type_of(obj), obj.pk)
+
+    _apply(obj.gym_id, change)
+
+
+def remove(obj):
+    _apply(obj.gym_id, lambda index: index.remove(_type_of(obj), obj.pk))
+
+
+def clear():
+    with _registry_lock:
+        _indexes.clear()
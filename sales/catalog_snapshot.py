@@ -0,0 +1,160 @@
+"""
+Catálogo completo de un gym en un único JSON para que el TPV busque en local.
+
+El documento (productos, servicios y planes activos, con precio final, impuesto,
+categoría e imagen) se genera una vez por versión del espacio "catalog"
+de organizations.tenant_cache y se guarda en caché ya comprimido (gzip y, si
+está instalado el paquete `brotli`, br). La versión es también el ETag: el TPV
+revalida con If-None-Match y recibe un 304 sin que se toque la BD.
+
+El stock cambia en cada venta y va aparte (get_stock, espacio "stock"): así una
+venta no obliga a regenerar el catálogo.
+
+Ojo: QuerySet.update() sobre estos modelos no pasa por los signals; hay que
+llamar a tenant_cache.bump_namespace(gym, CATALOG).
+"""
+import gzip
+import json
+
+from django.utils import timezone
+
+from memberships.models import MembershipPlan
+from organizations import tenant_cache
+from products.models import Product
+from services.models import Service
+from .pipeline import money
+
+SNAPSHOT_CACHE_TIMEOUT = 60 * 60 * 24
+
+try:
+    import brotli
+except ImportError:  # opcional
+    brotli = None
+
+
+def _etag(gym_id, version):
+    return f'"catalog-{gym_id}-{version}"'
+
+
+def etag_for(gym):
+    gym_id = getattr(gym, "pk", gym)
+    return _etag(gym_id, tenant_cache.namespace_version(gym_id, tenant_cache.CATALOG))
+
+
+def _image(obj):
+    try:
+        return obj.image.url if obj.image else None
+    except ValueError:
+        return None
+
+
+def _tax(obj):
+    return float(obj.tax_rate.rate_percent) if obj.tax_rate else 0.0
+
+
+def build_document(gym):
+    products = Product.objects.filter(gym=gym, is_active=True).select_related("category", "tax_rate").order_by("name")
+    services = Service.objects.filter(gym=gym, is_active=True).select_related("category", "tax_rate").order_by("name")
+    plans = MembershipPlan.objects.filter(gym=gym, is_active=True).select_related("tax_rate").order_by("display_order", "name")
+    return {
+        "gym": getattr(gym, "pk", gym),
+        "generated_at": timezone.now().isoformat(),
+        "products": [
+            {
+                "id": p.id,
+                "name": p.name,
+                "sku": p.sku,
+                "category": p.category.name if p.category else None,
+                "price": float(money(p.final_price)),
+                "tax_rate": _tax(p),
+                "image": _image(p),
+                "track_stock": p.track_stock,
+            }
+            for p in products
+        ],
+        "services": [
+            {
+                "id": s.id,
+                "name": s.name,
+                "category": s.category.name if s.category else None,
+                "price": float(money(s.final_price)),
+                "tax_rate": _tax(s),
+                "image": _image(s),
+                "duration": s.duration,
+            }
+            for s in services
+        ],
+        "memberships": [
+            {
+                "id": plan.id,
+                "name": plan.name,
+                "price": float(money(plan.final_price)),
+                "tax_rate": _tax(plan),
+                "image": _image(plan),
+            }
+            for plan in plans
+        ],
+    }
+
+
+def _render(gym, etag):
+    body = json.dumps(build_document(gym), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return {
+        "etag": etag,
+        "identity": body,
+        "gzip": gzip.compress(body, compresslevel=9, mtime=0),
+        "br": brotli.compress(body) if brotli else None,
+    }
+
+
+def get_snapshot(gym):
+    """{"etag", "identity", "gzip", "br"} de la versión actual del catálogo."""
+    gym_id = getattr(gym, "pk", gym)
+    version = tenant_cache.namespace_version(gym_id, tenant_cache.CATALOG)
+    # La versión va también en el nombre: si cambia mientras se genera, la
+    # siguiente petición no reutiliza un documento con un ETag antiguo
+    return tenant_cache.get_or_set(
+        gym_id, tenant_cache.CATALOG, f"snapshot:{version}", lambda: _render(gym_id, _etag(gym_id, version)),
+        timeout=SNAPSHOT_CACHE_TIMEOUT,
+    )
+
+
+def _stock_etag(gym_id, version):
+    return f'"stock-{gym_id}-{version}"'
+
+
+def stock_etag_for(gym):
+    gym_id = getattr(gym, "pk", gym)
+    return _stock_etag(gym_id, tenant_cache.namespace_version(gym_id, tenant_cache.STOCK))
+
+
+def get_stock(gym):
+    """{"etag", "identity"}: {"stock": {product_id: cantidad}} de los productos con control de stock."""
+    gym_id = getattr(gym, "pk", gym)
+    version = tenant_cache.namespace_version(gym_id, tenant_cache.STOCK)
+
+    def render():
+        levels = Product.objects.filter(gym_id=gym_id, is_active=True, track_stock=True).values_list("id", "stock_quantity")
+        body = json.dumps({"gym": gym_id, "stock": {str(pk): quantity for pk, quantity in levels}}, separators=(",", ":"))
+        return {"etag": _stock_etag(gym_id, version), "identity": body.encode("utf-8")}
+
+    return tenant_cache.get_or_set(gym_id, tenant_cache.STOCK, f"levels:{version}", render)
+
+
+def accepted_encodings(header):
+    """Codificaciones aceptadas (sin las de q=0) de un Accept-Encoding."""
+    accepted = set()
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        if name and params not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def pick_encoding(snapshot, accept_encoding):
+    accepted = accepted_encodings(accept_encoding)
+    for encoding in ("br", "gzip"):
+        if snapshot.get(encoding) and (encoding in accepted or "*" in accepted):
+            return encoding, snapshot[encoding]
+    return None, snapshot["identity"]
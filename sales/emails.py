@@ -0,0 +1,50 @@
+"""
+Emails de ventas (ticket y factura). Las vistas solo los encolan
+(marketing/outbox.py); el comando send_outbox los construye con estas funciones
+al enviarlos, así que la plantilla y el PDF no se generan dentro de la petición.
+"""
+import logging
+
+from django.core.mail import EmailMessage
+from django.template.loader import render_to_string
+
+from . import invoice_pdf
+from .pdf import PDFError
+
+logger = logging.getLogger(__name__)
+
+
+def ticket_message(order, to_email, from_email):
+    gym = order.gym
+    html_content = render_to_string('emails/ticket_receipt.html', {
+        'order': order,
+        'gym': gym,
+        'items': order.items.all(),
+        'payments': order.payments.all(),
+    })
+    message = EmailMessage(
+        subject=f'Tu ticket de compra - {gym.name} #{order.id}',
+        body=html_content,
+        from_email=from_email,
+        to=[to_email],
+    )
+    message.content_subtype = 'html'
+    return message
+
+
+def invoice_message(order, to_email, from_email):
+    message = EmailMessage(
+        subject=f'Factura {order.invoice_number} - {order.gym.name}',
+        body=f"Adjuntamos su factura {order.invoice_number}.\n\nGracias por su confianza.",
+        from_email=from_email,
+        to=[to_email],
+    )
+    # El PDF guardado si sigue al día (sales/invoice_pdf.py)
+    try:
+        message.attach(invoice_pdf.filename(order), invoice_pdf.get_pdf(order), 'application/pdf')
+    except PDFError:
+        # Sin motor de PDF: la factura va como cuerpo HTML
+        logger.warning("PDF de la factura %s no disponible", order.invoice_number, exc_info=True)
+        message.content_subtype = 'html'
+        message.body = invoice_pdf.invoice_html(order)
+    return message
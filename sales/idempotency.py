@@ -0,0 +1,258 @@
+"""
+Cabecera Idempotency-Key para los endpoints que cobran o reembolsan tarjetas
+(process_sale, subscription_charge y order_cancel, en api.py y api_async.py).
+
+- La primera petición con una clave reserva la fila (endpoint, gym, usuario,
+  key) de IdempotencyKey (índice único) antes de ejecutar la vista y al terminar
+  guarda la respuesta. La clave la genera el cliente: la misma en otro gym o con
+  otro usuario es otra petición.
+- Un reintento con la misma clave recibe esa respuesta (con la cabecera
+  Idempotent-Replayed: true) sin volver a cobrar.
+- Si la primera sigue en curso (doble clic, reintento por timeout), el duplicado
+  espera hasta WAIT_TIMEOUT a que termine; si no termina, 409 con Retry-After.
+- La misma clave con otro cuerpo, ruta o usuario: 422.
+- Solo se guardan las respuestas definitivas (2xx y 4xx). Si la vista lanza una
+  excepción o responde 5xx o 409 (fallo transitorio, p. ej. stock ocupado) se
+  libera la clave para poder reintentar. Salvo que ya haya cobrado
+  (mark_charged): entonces se guarda el error, y el reintento lo recibe en vez
+  de volver a cobrar.
+- Las peticiones sin gym ni usuario (subscription_charge es csrf_exempt) comparten
+  el mismo ámbito: índices parciales para gym/usuario NULL (ver IdempotencyKey).
+- Pasado KEY_TTL la clave se puede reutilizar, y una reserva en curso más
+  antigua que LOCK_TIMEOUT (proceso caído) la recupera el siguiente intento.
+
+Sin cabecera la vista funciona como siempre.
+
+Uso (dentro de los decoradores de permisos y fuera de transaction.atomic, para
+que la reserva se vea desde otras peticiones antes de cobrar):
+    @require_gym_permission('sales.add_sale')
+    @require_http_methods(["POST"])
+    @idempotent("sales.process_sale")
+    @transaction.atomic
+    def process_sale(request): ...
+"""
+import asyncio
+import hashlib
+import time
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+KEY_TTL = timedelta(hours=24)
+# Más que el timeout de las pasarelas (GATEWAY_TIMEOUT)
+LOCK_TIMEOUT = timedelta(minutes=5)
+WAIT_TIMEOUT = 10  # segundos
+POLL_INTERVAL = 0.2
+
+
+def fingerprint(request, user):
+    digest = hashlib.sha256()
+    digest.update(f"{getattr(user, 'pk', None)}\n{request.method}\n{request.path}\n".encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _invalid_key():
+    return JsonResponse(
+        {'error': f'{HEADER} no válida (máx. {MAX_KEY_LENGTH} caracteres)', 'error_code': 'IDEMPOTENCY_KEY_INVALID'},
+        status=400,
+    )
+
+
+def _conflict():
+    response = JsonResponse(
+        {'error': 'Hay una petición con la misma clave en curso', 'error_code': 'IDEMPOTENCY_KEY_IN_PROGRESS'},
+        status=409,
+    )
+    response["Retry-After"] = "1"
+    return response
+
+
+def _reused():
+    return JsonResponse(
+        {'error': f'{HEADER} ya usada con otra petición', 'error_code': 'IDEMPOTENCY_KEY_REUSED'},
+        status=422,
+    )
+
+
+def _replay(record):
+    response = HttpResponse(
+        bytes(record.response_body or b""),
+        status=record.response_status,
+        content_type=record.response_content_type or None,
+    )
+    response[REPLAYED_HEADER] = "true"
+    return response
+
+
+def scope(request, user):
+    """(gym_id, user_id) de la petición; se resuelve request.gym (síncrono)."""
+    return getattr(getattr(request, "gym", None), "pk", None), getattr(user, "pk", None)
+
+
+def claim(endpoint, key, digest, gym_id=None, user_id=None):
+    """
+    (registro, None): esta petición se queda la clave y ejecuta la vista.
+    (None, respuesta): duplicado ya resuelto (respuesta guardada o 422).
+    (None, None): la petición original sigue en curso.
+    """
+    lookup = {"endpoint": endpoint, "gym_id": gym_id, "user_id": user_id, "key": key}
+    record = IdempotencyKey.objects.filter(**lookup).first()
+    if record is None:
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(**lookup, fingerprint=digest), None
+        except IntegrityError:
+            # Otra petición la acaba de reservar
+            return None, None
+
+    now = timezone.now()
+    expired = record.created_at < now - KEY_TTL
+    abandoned = record.status == IdempotencyKey.IN_PROGRESS and record.created_at < now - LOCK_TIMEOUT
+    if expired or abandoned:
+        # Solo una de las peticiones que lo intenten a la vez consigue el UPDATE
+        taken = IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).update(
+            fingerprint=digest, status=IdempotencyKey.IN_PROGRESS, created_at=now,
+            response_status=None, response_content_type="", response_body=None, completed_at=None,
+        )
+        if not taken:
+            return None, None
+        record.fingerprint, record.status, record.created_at = digest, IdempotencyKey.IN_PROGRESS, now
+        return record, None
+
+    if record.fingerprint != digest:
+        return None, _reused()
+    if record.status == IdempotencyKey.COMPLETED:
+        return None, _replay(record)
+    return None, None
+
+
+def mark_charged(request, charged=True):
+    """
+    La vista ya ha cobrado una tarjeta: un 5xx a partir de aquí se guarda y no se
+    vuelve a cobrar al reintentar. charged=False si ha devuelto lo cobrado.
+    """
+    request._idempotency_charged = charged
+
+
+def _charged(request):
+    return getattr(request, "_idempotency_charged", False)
+
+
+def _charged_error():
+    return JsonResponse(
+        {'error': 'Error tras cobrar la tarjeta: revisar el cobro antes de repetir la venta',
+         'error_code': 'CHARGED_WITH_ERROR'},
+        status=500,
+    )
+
+
+def is_final(response):
+    """Respuestas que se repiten tal cual a los reintentos: 2xx y 4xx salvo 409."""
+    status = response.status_code
+    return 200 <= status < 300 or (400 <= status < 500 and status != 409)
+
+
+def store(record, response, charged=False):
+    if getattr(response, "streaming", False) or not (charged or is_final(response)):
+        release(record)
+        return response
+    IdempotencyKey.objects.filter(pk=record.pk).update(
+        status=IdempotencyKey.COMPLETED,
+        response_status=response.status_code,
+        response_content_type=response.get("Content-Type", ""),
+        response_body=response.content,
+        completed_at=timezone.now(),
+    )
+    return response
+
+
+def release(record):
+    IdempotencyKey.objects.filter(pk=record.pk, status=IdempotencyKey.IN_PROGRESS).delete()
+
+
+def purge_expired():
+    """Borra las claves caducadas (comando purge_idempotency_keys)."""
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=timezone.now() - KEY_TTL).delete()
+    return deleted
+
+
+def idempotent(endpoint):
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _async_wrapped(request, *args, **kwargs):
+                key = request.headers.get(HEADER)
+                if not key:
+                    return await view_func(request, *args, **kwargs)
+                if len(key) > MAX_KEY_LENGTH:
+                    return _invalid_key()
+
+                user = await request.auser() if hasattr(request, "auser") else getattr(request, "user", None)
+                digest = fingerprint(request, user)
+                gym_id, user_id = await sync_to_async(scope)(request, user)
+                deadline = time.monotonic() + WAIT_TIMEOUT
+                while True:
+                    record, response = await sync_to_async(claim)(endpoint, key, digest, gym_id, user_id)
+                    if record is not None:
+                        break
+                    if response is not None:
+                        return response
+                    if time.monotonic() >= deadline:
+                        return _conflict()
+                    await asyncio.sleep(POLL_INTERVAL)
+
+                try:
+                    response = await view_func(request, *args, **kwargs)
+                except BaseException:
+                    if _charged(request):
+                        await sync_to_async(store)(record, _charged_error(), charged=True)
+                    else:
+                        await sync_to_async(release)(record)
+                    raise
+                return await sync_to_async(store)(record, response, charged=_charged(request))
+            return _async_wrapped
+
+        @wraps(view_func)
+        def _wrapped(request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return view_func(request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return _invalid_key()
+
+            user = getattr(request, "user", None)
+            digest = fingerprint(request, user)
+            gym_id, user_id = scope(request, user)
+            deadline = time.monotonic() + WAIT_TIMEOUT
+            while True:
+                record, response = claim(endpoint, key, digest, gym_id, user_id)
+                if record is not None:
+                    break
+                if response is not None:
+                    return response
+                if time.monotonic() >= deadline:
+                    return _conflict()
+                time.sleep(POLL_INTERVAL)
+
+            try:
+                response = view_func(request, *args, **kwargs)
+            except BaseException:
+                if _charged(request):
+                    store(record, _charged_error(), charged=True)
+                else:
+                    release(record)
+                raise
+            return store(record, response, charged=_charged(request))
+        return _wrapped
+    return decorator
@@ -0,0 +1,260 @@
+"""
+Facturas en PDF: plantilla invoices/invoice_pdf.html renderizada con xhtml2pdf (sales/pdf.py).
+
+- La plantilla se compila una vez por proceso y el logo de cada gym se lee una
+  vez (va incrustado en el HTML como data URI).
+- El PDF se guarda en Order.invoice_pdf junto con el hash del HTML del que sale
+  (Order.invoice_pdf_hash): mientras la venta no cambie, no se vuelve a generar.
+- render_batch() genera las facturas de un rango de fechas (cierre de mes) en
+  un pool de procesos, por tandas de BATCH_SIZE ventas, y opcionalmente las va
+  escribiendo en un ZIP. Comando: render_invoices.
+
+Uso:
+    content = invoice_pdf.get_pdf(order)
+    stats = invoice_pdf.render_batch(gym, date(2026, 9, 1), date(2026, 9, 30), zip_file=f)
+"""
+import base64
+import hashlib
+import logging
+import mimetypes
+import multiprocessing
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+from itertools import islice
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Prefetch
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from . import invoicing, pdf
+from .models import Order, OrderPayment
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_NAME = "invoices/invoice_pdf.html"
+BATCH_SIZE = 200
+MAX_LOGO_BYTES = 512 * 1024
+
+_logos = {}
+_logos_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _template():
+    return get_template(TEMPLATE_NAME)
+
+
+def logo_data_uri(gym):
+    """Logo del gym como data URI, leído una vez por proceso (None si no tiene o es muy grande)."""
+    name = gym.logo.name if gym.logo else ""
+    if not name:
+        return None
+    key = (gym.pk, name)  # un logo nuevo se sube con otro nombre
+    with _logos_lock:
+        if key in _logos:
+            return _logos[key]
+
+    try:
+        with gym.logo.storage.open(name, "rb") as f:
+            data = f.read(MAX_LOGO_BYTES + 1)
+    except OSError:
+        data = b""
+    uri = None
+    if data and len(data) <= MAX_LOGO_BYTES:
+        mime = mimetypes.guess_type(name)[0] or "image/png"
+        uri = f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+
+    with _logos_lock:
+        _logos[key] = uri
+    return uri
+
+
+def clear():
+    _template.cache_clear()
+    with _logos_lock:
+        _logos.clear()
+
+
+def invoice_html(order):
+    gym = order.gym
+    return _template().render({
+        "order": order,
+        "gym": gym,
+        "client": order.client,
+        "items": order.items.all(),
+        "payments": order.payments.all(),
+        "logo": logo_data_uri(gym),
+        "brand_color": gym.brand_color or "#0f172a",
+    })
+
+
+def content_hash(html):
+    return hashlib.sha256(f"{pdf.engine()}\n{html}".encode("utf-8")).hexdigest()
+
+
+def filename(order):
+    return get_valid_filename(f"{order.invoice_number or order.pk}".replace("/", "-")) + ".pdf"
+
+
+def _is_current(order, digest):
+    return bool(order.invoice_pdf) and order.invoice_pdf_hash == digest
+
+
+def _read_stored(order):
+    try:
+        with order.invoice_pdf.storage.open(order.invoice_pdf.name, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _store(order, content, digest):
+    """Guarda el fichero (sin tocar la BD). Devuelve el nombre del anterior si hay que borrarlo."""
+    old = order.invoice_pdf.name or None
+    name = f"{filename(order)[:-4]}-{digest[:12]}.pdf"
+    order.invoice_pdf.save(name, ContentFile(content), save=False)
+    order.invoice_pdf_hash = digest
+    return old if old != order.invoice_pdf.name else None
+
+
+def _delete_files(storage, names):
+    for name in names:
+        try:
+            storage.delete(name)
+        except OSError:
+            logger.warning("No se pudo borrar el PDF de factura %s", name, exc_info=True)
+
+
+def get_pdf(order):
+    """PDF de la factura: el guardado si sigue al día; si no, lo genera y lo guarda."""
+    html = invoice_html(order)
+    digest = content_hash(html)
+    if _is_current(order, digest):
+        content = _read_stored(order)
+        if content is not None:
+            return content
+
+    content = pdf.html_to_pdf(html)
+    old = _store(order, content, digest)
+    Order.objects.filter(pk=order.pk).update(invoice_pdf=order.invoice_pdf.name, invoice_pdf_hash=digest)
+    if old:
+        _delete_files(order.invoice_pdf.storage, [old])
+    return content
+
+
+# --------------------------------------------------
+# Lote
+# --------------------------------------------------
+
+def orders_in_range(gym, date_from, date_to):
+    """
+    Ventas del gym creadas entre date_from y date_to (ambos incluidos, hora local).
+    Sin las canceladas que no llegaron a tener factura (p. ej. cobro fallido): la serie
+    no tiene huecos y un número dado no se puede retirar. Las que se cancelaron ya
+    facturadas siguen: su factura está emitida.
+    """
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(date_from, time.min), tz)
+    end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min), tz)
+    return (
+        Order.objects.for_gym(gym)
+        .filter(created_at__gte=start, created_at__lt=end)
+        .exclude(status='CANCELLED', invoice_number__isnull=True)
+    )
+
+
+def _invoices(gym, date_from, date_to):
+    return (
+        orders_in_range(gym, date_from, date_to)
+        .filter(invoice_number__isnull=False)
+        .select_related("gym", "client")
+        .prefetch_related(
+            "items",
+            Prefetch("payments", queryset=OrderPayment.objects.select_related("payment_method")),
+        )
+        .order_by("created_at", "pk")
+    )
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _render_chunk(orders, render_many, archive, stats):
+    contents = {}
+    todo = []  # (order, html, digest)
+    for order in orders:
+        html = invoice_html(order)
+        digest = content_hash(html)
+        if _is_current(order, digest):
+            content = _read_stored(order) if archive is not None else b""
+            if content is not None:
+                contents[order.pk] = content
+                stats["skipped"] += 1
+                continue
+        todo.append((order, html, digest))
+
+    changed, stale = [], []
+    for (order, _html, digest), content in zip(todo, render_many([html for _, html, _ in todo])):
+        old = _store(order, content, digest)
+        if old:
+            stale.append(old)
+        changed.append(order)
+        contents[order.pk] = content
+        stats["rendered"] += 1
+
+    if changed:
+        Order.objects.bulk_update(changed, ["invoice_pdf", "invoice_pdf_hash"])
+        _delete_files(changed[0].invoice_pdf.storage, stale)
+
+    if archive is not None:
+        for order in orders:
+            archive.writestr(filename(order), contents[order.pk])
+
+
+def render_batch(gym, date_from, date_to, zip_file=None, workers=None, assign_numbers=False):
+    """
+    Genera los PDF de las facturas del gym entre date_from y date_to; las que no han
+    cambiado desde la última vez se reutilizan.
+
+    zip_file: fichero abierto en binario donde escribir un ZIP con todas.
+    workers: procesos del pool (None = uno por CPU; 1 = sin pool).
+    assign_numbers: numera antes las ventas del rango que aún no tienen factura.
+    Devuelve {"total", "rendered", "skipped"}.
+    """
+    if assign_numbers:
+        with transaction.atomic():
+            pending = orders_in_range(gym, date_from, date_to).filter(invoice_number__isnull=True)
+            invoicing.assign_invoice_numbers(pending.select_for_update())
+
+    stats = {"rendered": 0, "skipped": 0}
+    archive = zipfile.ZipFile(zip_file, "w", zipfile.ZIP_DEFLATED) if zip_file is not None else None
+    executor = None
+    if workers != 1:
+        # spawn: los procesos solo convierten HTML en PDF, sin Django ni la conexión a la BD
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def render_many(documents):
+        if executor is None:
+            return map(pdf.html_to_pdf, documents)
+        return executor.map(pdf.html_to_pdf, documents, chunksize=8)
+
+    try:
+        for orders in _chunks(_invoices(gym, date_from, date_to).iterator(chunk_size=BATCH_SIZE), BATCH_SIZE):
+            _render_chunk(orders, render_many, archive, stats)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if archive is not None:
+            archive.close()
+
+    stats["total"] = stats["rendered"] + stats["skipped"]
+    return stats
@@ -0,0 +1,106 @@
+"""
+Numeración de facturas: serie correlativa y sin huecos por gym, serie y año.
+
+Cada (gym, serie, año) tiene una fila InvoiceSequence. Reservar números es un
+único `UPDATE ... SET last_number = last_number + n ... RETURNING` que bloquea
+solo esa fila hasta que acaba la transacción de la venta:
+
+- Sin huecos: si la transacción se deshace, el contador vuelve atrás con ella.
+- Sin esperas entre gyms ni entre series (bloqueo de fila, no de tabla).
+- La facturación en lote (cierre de mes) reserva un bloque de n números con un
+  solo UPDATE por gym (assign_invoice_numbers).
+
+Tiene que llamarse dentro de transaction.atomic() y mejor al final, para tener la
+fila bloqueada el menor tiempo posible. El formato sale de la propia fila
+(number_format); las filas nuevas usan settings.INVOICE_NUMBER_FORMAT.
+
+Uso:
+    with transaction.atomic():
+        invoicing.assign_invoice_number(order)
+"""
+from itertools import groupby
+
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+
+from .models import InvoiceSequence, Order
+
+BULK_BATCH_SIZE = 500
+
+
+def _reserve_sql(connection):
+    qn = connection.ops.quote_name
+    return (
+        f"UPDATE {qn(InvoiceSequence._meta.db_table)} SET {qn('last_number')} = {qn('last_number')} + %s "
+        f"WHERE {qn('gym_id')} = %s AND {qn('series')} = %s AND {qn('year')} = %s "
+        f"RETURNING {qn('id')}, {qn('last_number')}, {qn('number_format')}"
+    )
+
+
+def reserve(gym, count=1, series=None, year=None):
+    """
+    Reserva `count` números consecutivos de la serie. Devuelve (secuencia, primer número);
+    el bloque es primer número .. secuencia.last_number.
+    """
+    if count < 1:
+        raise ValueError("count tiene que ser al menos 1")
+    using = router.db_for_write(InvoiceSequence)
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        raise RuntimeError("La numeración de facturas tiene que ir dentro de transaction.atomic()")
+
+    gym_id = getattr(gym, "pk", gym)
+    series = series or settings.INVOICE_DEFAULT_SERIES
+    year = year or timezone.localdate().year
+    params = [count, gym_id, series, year]
+    with connection.cursor() as cursor:
+        cursor.execute(_reserve_sql(connection), params)
+        row = cursor.fetchone()
+        if row is None:
+            # Primera factura de la serie en el año. Si otra transacción crea la fila a
+            # la vez, el INSERT espera a que termine y no hace nada
+            InvoiceSequence.objects.using(using).bulk_create(
+                [InvoiceSequence(gym_id=gym_id, series=series, year=year,
+                                 number_format=settings.INVOICE_NUMBER_FORMAT)],
+                ignore_conflicts=True,
+            )
+            cursor.execute(_reserve_sql(connection), params)
+            row = cursor.fetchone()
+
+    pk, last_number, number_format = row
+    sequence = InvoiceSequence(
+        pk=pk, gym_id=gym_id, series=series, year=year, last_number=last_number, number_format=number_format,
+    )
+    return sequence, last_number - count + 1
+
+
+def assign_invoice_number(order, series=None):
+    """Número de factura de la venta; si no tiene, le asigna el siguiente de la serie."""
+    # Bloquea la venta: dos peticiones a la vez no pueden gastar dos números en ella
+    current = Order.objects.select_for_update().filter(pk=order.pk).values_list("invoice_number", flat=True).get()
+    if current:
+        order.invoice_number = current
+        return current
+
+    sequence, number = reserve(order.gym_id, 1, series)
+    order.invoice_number = sequence.format_number(number)
+    Order.objects.filter(pk=order.pk).update(invoice_number=order.invoice_number)
+    return order.invoice_number
+
+
+def assign_invoice_numbers(orders, series=None, year=None):
+    """
+    Numera en bloque, por fecha, las ventas sin factura: un UPDATE del contador por
+    gym y un bulk_update de las ventas. Para evitar que otra petición las numere a
+    la vez, pasar un queryset con select_for_update().
+    Devuelve las ventas numeradas.
+    """
+    pending = sorted((o for o in orders if not o.invoice_number), key=lambda o: (o.gym_id, o.created_at, o.pk))
+    for gym_id, group in groupby(pending, key=lambda o: o.gym_id):
+        group = list(group)
+        sequence, first = reserve(gym_id, len(group), series, year)
+        for offset, order in enumerate(group):
+            order.invoice_number = sequence.format_number(first + offset)
+    Order.objects.bulk_update(pending, ["invoice_number"], batch_size=BULK_BATCH_SIZE)
+    return pending
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from sales.idempotency import KEY_TTL, purge_expired
+
+
+class Command(BaseCommand):
+    help = f"Borra las claves Idempotency-Key con más de {KEY_TTL} (programar a diario)."
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Claves de idempotencia borradas: {deleted}"))
@@ -0,0 +1,38 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from organizations.models import Gym
+from sales import invoice_pdf
+
+
+class Command(BaseCommand):
+    help = "Genera en lote los PDF de las facturas de un gym entre dos fechas (ej.: cierre de mes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--gym", type=int, required=True, help="ID del gym")
+        parser.add_argument("--from", dest="date_from", type=date.fromisoformat, required=True, help="AAAA-MM-DD")
+        parser.add_argument("--to", dest="date_to", type=date.fromisoformat, required=True, help="AAAA-MM-DD (incluido)")
+        parser.add_argument("--zip", dest="zip_path", help="Escribe además todas las facturas en este ZIP")
+        parser.add_argument("--workers", type=int, default=None, help="Procesos (por defecto, uno por CPU)")
+        parser.add_argument("--assign-numbers", action="store_true",
+                            help="Numera antes las ventas del rango que aún no tienen factura")
+
+    def handle(self, *args, **options):
+        try:
+            gym = Gym.objects.get(pk=options["gym"])
+        except Gym.DoesNotExist:
+            raise CommandError(f"No existe el gym {options['gym']}")
+        if options["date_from"] > options["date_to"]:
+            raise CommandError("--from es posterior a --to")
+
+        kwargs = dict(workers=options["workers"], assign_numbers=options["assign_numbers"])
+        if options["zip_path"]:
+            with open(options["zip_path"], "wb") as zip_file:
+                stats = invoice_pdf.render_batch(gym, options["date_from"], options["date_to"], zip_file=zip_file, **kwargs)
+        else:
+            stats = invoice_pdf.render_batch(gym, options["date_from"], options["date_to"], **kwargs)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Facturas: {stats['total']} (generadas {stats['rendered']}, sin cambios {stats['skipped']})"
+        ))
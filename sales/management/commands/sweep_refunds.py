@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from sales.refunds import STALE_AFTER, sweep_stale
+
+
+class Command(BaseCommand):
+    help = f"Revisa los reembolsos que siguen en curso tras {STALE_AFTER} (programar cada pocos minutos)."
+
+    def handle(self, *args, **options):
+        resolved = sweep_stale()
+        self.stdout.write(self.style.SUCCESS(f"Reembolsos resueltos: {resolved}"))
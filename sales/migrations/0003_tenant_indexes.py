@@ -0,0 +1,30 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0007_tenant_indexes'),
+        ('finance', '0006_tenant_indexes'),
+        ('organizations', '0004_gym_facebook_gym_instagram_gym_tiktok_gym_youtube'),
+        ('sales', '0002_orderpayment_transaction_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['gym', 'created_at'], name='order_gym_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['gym', 'status', 'created_at'], name='order_gym_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['client', 'status'], name='order_client_status_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0009_client_access_code_index'),
+        ('finance', '0006_tenant_indexes'),
+        ('organizations', '0004_gym_facebook_gym_instagram_gym_tiktok_gym_youtube'),
+        ('sales', '0003_tenant_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='offline_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='Clave Offline'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('offline_key__isnull', False)), fields=('gym', 'offline_key'), name='order_gym_offline_key_uniq'),
+        ),
+    ]
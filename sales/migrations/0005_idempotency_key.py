@@ -0,0 +1,34 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:28
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0004_order_offline_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(max_length=100, verbose_name='Endpoint')),
+                ('key', models.CharField(max_length=255, verbose_name='Clave')),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('IN_PROGRESS', 'En curso'), ('COMPLETED', 'Completada')], default='IN_PROGRESS', max_length=20, verbose_name='Estado')),
+                ('response_status', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('response_content_type', models.CharField(blank=True, max_length=100)),
+                ('response_body', models.BinaryField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Fecha Creación')),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Clave de Idempotencia',
+                'verbose_name_plural': 'Claves de Idempotencia',
+                'constraints': [models.UniqueConstraint(fields=('endpoint', 'key'), name='idempotency_endpoint_key_uniq')],
+            },
+        ),
+    ]
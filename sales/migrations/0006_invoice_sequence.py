@@ -0,0 +1,51 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0009_client_access_code_index'),
+        ('finance', '0006_tenant_indexes'),
+        ('organizations', '0004_gym_facebook_gym_instagram_gym_tiktok_gym_youtube'),
+        ('sales', '0005_idempotency_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('series', models.CharField(max_length=10, verbose_name='Serie')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Año')),
+                ('last_number', models.PositiveIntegerField(default=0, verbose_name='Último Número')),
+                ('number_format', models.CharField(help_text='Campos disponibles: {series}, {year} y {number}. Ej.: {series}-{year}-{number:06d}', max_length=50, verbose_name='Formato')),
+            ],
+            options={
+                'verbose_name': 'Serie de Facturación',
+                'verbose_name_plural': 'Series de Facturación',
+            },
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='invoice_number',
+            field=models.CharField(blank=True, max_length=50, null=True, verbose_name='Número de Factura'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('invoice_number__isnull', False)), fields=('gym', 'invoice_number'), name='order_gym_invoice_number_uniq'),
+        ),
+        migrations.AddField(
+            model_name='invoicesequence',
+            name='gym',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invoice_sequences', to='organizations.gym'),
+        ),
+        migrations.AddConstraint(
+            model_name='invoicesequence',
+            constraint=models.UniqueConstraint(fields=('gym', 'series', 'year'), name='invoice_sequence_gym_series_year_uniq'),
+        ),
+    ]
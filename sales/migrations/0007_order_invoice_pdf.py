@@ -0,0 +1,24 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:33
+
+import sales.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0006_invoice_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='invoice_pdf',
+            field=models.FileField(blank=True, editable=False, upload_to=sales.models.invoice_upload_to, verbose_name='Factura PDF'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='invoice_pdf_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0007_order_invoice_pdf'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Refund',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(choices=[('stripe', 'Stripe'), ('redsys', 'Redsys')], max_length=20, verbose_name='Proveedor')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Cantidad')),
+                ('status', models.CharField(choices=[('PENDING', 'En curso'), ('SUCCEEDED', 'Reembolsado'), ('FAILED', 'Fallido')], default='PENDING', max_length=20, verbose_name='Estado')),
+                ('reference', models.CharField(blank=True, max_length=255, verbose_name='Referencia')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha Creación')),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='refunds', to='sales.order')),
+                ('payment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='refunds', to='sales.orderpayment')),
+            ],
+            options={
+                'verbose_name': 'Reembolso',
+                'verbose_name_plural': 'Reembolsos',
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.15 on 2026-10-17 04:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0004_gym_facebook_gym_instagram_gym_tiktok_gym_youtube'),
+        ('sales', '0008_refund'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='idempotencykey',
+            name='idempotency_endpoint_key_uniq',
+        ),
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='gym',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='organizations.gym'),
+        ),
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='idempotencykey',
+            constraint=models.UniqueConstraint(fields=('endpoint', 'gym', 'user', 'key'), name='idempotency_scope_key_uniq'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.15 on 2026-10-17 04:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0004_gym_facebook_gym_instagram_gym_tiktok_gym_youtube'),
+        ('sales', '0009_idempotency_key_scope'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='idempotencykey',
+            constraint=models.UniqueConstraint(condition=models.Q(('gym__isnull', True)), fields=('endpoint', 'user', 'key'), name='idempotency_no_gym_key_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='idempotencykey',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('endpoint', 'gym', 'key'), name='idempotency_no_user_key_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='idempotencykey',
+            constraint=models.UniqueConstraint(condition=models.Q(('gym__isnull', True), ('user__isnull', True)), fields=('endpoint', 'key'), name='idempotency_no_scope_key_uniq'),
+        ),
+    ]
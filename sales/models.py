@@ -1,12 +1,17 @@
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
+from django.utils import timezone
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from organizations.models import Gym
+from organizations.managers import TenantManager
 from finance.models import CashSession, PaymentMethod
 from clients.models import Client
 
+def invoice_upload_to(instance, filename):
+    return f"invoices/{instance.gym_id}/{filename}"
+
 class Order(models.Model):
     STATS_CHOICES = (
         ('PENDING', _('Pendiente')),
@@ -33,18 +38,70 @@ class Order(models.Model):
     total_amount = models.DecimalField(_("Total Venta"), max_digits=10, decimal_places=2, default=0.00)
     
     internal_notes = models.TextField(_("Nota Interna"), blank=True)
-    invoice_number = models.CharField(_("Número de Factura"), max_length=50, blank=True, null=True, unique=True)
+    # Serie correlativa por gym y año (sales/invoicing.py)
+    invoice_number = models.CharField(_("Número de Factura"), max_length=50, blank=True, null=True)
+    # PDF generado y hash del HTML del que sale (sales/invoice_pdf.py)
+    invoice_pdf = models.FileField(_("Factura PDF"), upload_to=invoice_upload_to, blank=True, editable=False)
+    invoice_pdf_hash = models.CharField(max_length=64, blank=True, editable=False)
     
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name='created_orders')
 
+    # Clave generada por el TPV para ventas hechas sin conexión (sales/offline_sync.py)
+    offline_key = models.CharField(_("Clave Offline"), max_length=64, null=True, blank=True, editable=False)
+
+    objects = TenantManager()
+
     class Meta:
         verbose_name = _("Venta / Ticket")
         verbose_name_plural = _("Ventas")
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['gym', 'created_at'], name='order_gym_created_idx'),
+            models.Index(fields=['gym', 'status', 'created_at'], name='order_gym_status_created_idx'),
+            models.Index(fields=['client', 'status'], name='order_client_status_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['gym', 'offline_key'], condition=models.Q(offline_key__isnull=False),
+                name='order_gym_offline_key_uniq',
+            ),
+            models.UniqueConstraint(
+                fields=['gym', 'invoice_number'], condition=models.Q(invoice_number__isnull=False),
+                name='order_gym_invoice_number_uniq',
+            ),
+        ]
 
     def __str__(self):
         return f"Ticket #{self.pk} - {self.total_amount}€"
 
+class InvoiceSequence(models.Model):
+    """
+    Contador de facturas de un gym para una serie y un año (sales/invoicing.py).
+    Los números se reservan con un UPDATE sobre esta fila dentro de la transacción
+    de la venta: si la transacción se deshace, el número no se pierde.
+    """
+    gym = models.ForeignKey(Gym, on_delete=models.CASCADE, related_name='invoice_sequences')
+    series = models.CharField(_("Serie"), max_length=10)
+    year = models.PositiveSmallIntegerField(_("Año"))
+    last_number = models.PositiveIntegerField(_("Último Número"), default=0)
+    number_format = models.CharField(
+        _("Formato"), max_length=50,
+        help_text=_("Campos disponibles: {series}, {year} y {number}. Ej.: {series}-{year}-{number:06d}"),
+    )
+
+    class Meta:
+        verbose_name = _("Serie de Facturación")
+        verbose_name_plural = _("Series de Facturación")
+        constraints = [
+            models.UniqueConstraint(fields=['gym', 'series', 'year'], name='invoice_sequence_gym_series_year_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.series} {self.year} ({self.last_number})"
+
+    def format_number(self, number):
+        return self.number_format.format(series=self.series, year=self.year, number=number)
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     
@@ -75,3 +132,81 @@ class OrderPayment(models.Model):
 
     def __str__(self):
         return f"{self.payment_method.name}: {self.amount}€"
+
+class Refund(models.Model):
+    """Cada intento de reembolso de un pago con tarjeta (sales/refunds.py)."""
+    PENDING = 'PENDING'
+    SUCCEEDED = 'SUCCEEDED'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = (
+        (PENDING, _('En curso')),
+        (SUCCEEDED, _('Reembolsado')),
+        (FAILED, _('Fallido')),
+    )
+    PROVIDER_CHOICES = (
+        ('stripe', 'Stripe'),
+        ('redsys', 'Redsys'),
+    )
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='refunds')
+    payment = models.ForeignKey(OrderPayment, on_delete=models.CASCADE, related_name='refunds')
+    provider = models.CharField(_("Proveedor"), max_length=20, choices=PROVIDER_CHOICES)
+    amount = models.DecimalField(_("Cantidad"), max_digits=10, decimal_places=2)
+    status = models.CharField(_("Estado"), max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    # Id del reembolso en la pasarela, o el error
+    reference = models.CharField(_("Referencia"), max_length=255, blank=True)
+    error = models.TextField(_("Error"), blank=True)
+    created_at = models.DateTimeField(_("Fecha Creación"), auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Reembolso")
+        verbose_name_plural = _("Reembolsos")
+
+    def __str__(self):
+        return f"{self.get_provider_display()} {self.amount}€ ({self.status})"
+
+class IdempotencyKey(models.Model):
+    """
+    Cabecera Idempotency-Key de los endpoints que cobran o reembolsan (sales/idempotency.py).
+    La primera petición reserva (endpoint, gym, usuario, key) y guarda aquí su respuesta.
+    """
+    IN_PROGRESS = 'IN_PROGRESS'
+    COMPLETED = 'COMPLETED'
+    STATUS_CHOICES = (
+        (IN_PROGRESS, _('En curso')),
+        (COMPLETED, _('Completada')),
+    )
+
+    endpoint = models.CharField(_("Endpoint"), max_length=100)
+    # La clave la elige el cliente: solo es única dentro del gym y usuario que la envían
+    gym = models.ForeignKey(Gym, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    key = models.CharField(_("Clave"), max_length=255)
+    # Hash de usuario, método, ruta y cuerpo: la misma clave con otra petición se rechaza
+    fingerprint = models.CharField(max_length=64)
+    status = models.CharField(_("Estado"), max_length=20, choices=STATUS_CHOICES, default=IN_PROGRESS)
+
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_content_type = models.CharField(max_length=100, blank=True)
+    response_body = models.BinaryField(null=True, blank=True)
+
+    created_at = models.DateTimeField(_("Fecha Creación"), default=timezone.now, db_index=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Clave de Idempotencia")
+        verbose_name_plural = _("Claves de Idempotencia")
+        constraints = [
+            models.UniqueConstraint(fields=['endpoint', 'gym', 'user', 'key'], name='idempotency_scope_key_uniq'),
+            # En SQL dos NULL son distintos: sin gym y/o sin usuario, un índice parcial por caso
+            models.UniqueConstraint(fields=['endpoint', 'user', 'key'], condition=models.Q(gym__isnull=True),
+                                    name='idempotency_no_gym_key_uniq'),
+            models.UniqueConstraint(fields=['endpoint', 'gym', 'key'], condition=models.Q(user__isnull=True),
+                                    name='idempotency_no_user_key_uniq'),
+            models.UniqueConstraint(fields=['endpoint', 'key'], condition=models.Q(gym__isnull=True, user__isnull=True),
+                                    name='idempotency_no_scope_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.endpoint} {self.key} ({self.status})"
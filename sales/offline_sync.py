@@ -0,0 +1,255 @@
+"""
+Sincronización de ventas hechas en el TPV sin conexión.
+
+El TPV encola las ventas (con una clave propia `offline_key`, la fecha original y
+el empleado) y las manda todas juntas a api/sale/sync/. Cada lote de BATCH_SIZE
+ventas se valida contra el catálogo actual y se escribe en una transacción con
+bulk_create; el coste en queries es por lote, no por venta.
+
+- Una clave ya sincronizada devuelve "duplicate" con su order_id (reintentos seguros).
+- Si el precio cobrado no coincide con el actual, la venta se rechaza con
+  "stale_price" y el precio actual, para que el TPV la revise.
+- Sin conexión no se puede cobrar con tarjeta integrada (Stripe/Redsys): se rechaza.
+
+Resultado por venta: {"offline_key", "status": "created"|"duplicate"|"rejected",
+"order_id" | "error", "message"}.
+"""
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from clients.models import Client
+from products import stock
+from . import pipeline
+from .models import Order
+
+MAX_SALES_PER_REQUEST = 500
+BATCH_SIZE = 100
+MAX_KEY_LENGTH = 64
+# Margen para relojes de TPV adelantados
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+
+class SaleRejected(Exception):
+    def __init__(self, code, message, **extra):
+        super().__init__(message)
+        self.code = code
+        self.extra = extra
+
+
+def _rejected(key, error):
+    return {"offline_key": key, "status": "rejected", "error": error.code, "message": str(error), **error.extra}
+
+
+def _number(value):
+    """Decimal finito o InvalidOperation ("NaN" e "Infinity" son Decimal válidos)."""
+    number = Decimal(str(value))
+    if not number.is_finite():
+        raise InvalidOperation(value)
+    return number
+
+
+def _check_shape(sale):
+    key = sale.get("offline_key")
+    if not key or not isinstance(key, str) or len(key) > MAX_KEY_LENGTH:
+        raise SaleRejected("invalid_key", f"offline_key obligatorio (máx. {MAX_KEY_LENGTH} caracteres)")
+    items = sale.get("items")
+    if not items or not isinstance(items, list):
+        raise SaleRejected("empty_cart", "El carrito está vacío")
+    for item in items:
+        try:
+            int(item["id"]), int(item["qty"]), _number(item["unit_price"])
+        except (KeyError, TypeError, ValueError, InvalidOperation):
+            raise SaleRejected("invalid_item", "Cada línea necesita id, type, qty y unit_price")
+        if item.get("type") not in pipeline.ITEM_MODELS:
+            raise SaleRejected("invalid_item", f"Tipo de línea no válido: {item.get('type')}")
+        if int(item["qty"]) <= 0:
+            raise SaleRejected("invalid_item", "Cantidad no válida")
+        discount = item.get("discount")
+        if discount:
+            try:
+                _number(discount.get("value", 0) or 0)
+            except (AttributeError, InvalidOperation):
+                raise SaleRejected("invalid_item", "Descuento no válido")
+    payments = sale.get("payments", [])
+    if not isinstance(payments, list):
+        raise SaleRejected("invalid_payment", "payments tiene que ser una lista")
+    for p in payments:
+        try:
+            _number(p.get("amount", 0) or 0)
+        except (AttributeError, InvalidOperation):
+            raise SaleRejected("invalid_payment", "Cada pago necesita un amount numérico")
+    # Se usan como ids en las queries del lote: uno mal formado no debe tumbar las demás ventas
+    for field, code in (("client_id", "invalid_client"), ("staff_id", "invalid_staff")):
+        if sale.get(field):
+            try:
+                int(sale[field])
+            except (TypeError, ValueError):
+                raise SaleRejected(code, f"{field} no válido")
+
+
+def _parse_created_at(value, now):
+    created_at = parse_datetime(value) if isinstance(value, str) else None
+    if created_at is None:
+        raise SaleRejected("invalid_timestamp", "created_at no es una fecha ISO 8601")
+    if timezone.is_naive(created_at):
+        created_at = timezone.make_aware(created_at)
+    if created_at > now + MAX_CLOCK_SKEW:
+        raise SaleRejected("invalid_timestamp", "created_at está en el futuro")
+    return created_at
+
+
+class _BatchContext:
+    """Todo lo que necesita validar un lote, cargado con una query por tipo."""
+
+    def __init__(self, gym, sales):
+        items = [item for sale in sales for item in sale["items"]]
+        self.catalog = pipeline.load_catalog(gym, items)
+        self.methods = pipeline.PaymentMethodResolver(gym)
+
+        client_ids = {int(sale["client_id"]) for sale in sales if sale.get("client_id")}
+        self.clients = Client.objects.for_gym(gym).in_bulk(client_ids) if client_ids else {}
+
+        staff_ids = {int(sale["staff_id"]) for sale in sales if sale.get("staff_id")}
+        User = get_user_model()
+        self.staff = (
+            User.objects.filter(id__in=staff_ids, gym_memberships__gym=gym).distinct().in_bulk()
+            if staff_ids else {}
+        )
+
+
+def _build_order(gym, user, sale, ctx, now):
+    created_at = _parse_created_at(sale.get("created_at"), now)
+
+    lines = []
+    for item in sale["items"]:
+        try:
+            obj = pipeline.catalog_object(ctx.catalog, item)
+        except Exception:
+            raise SaleRejected("unknown_item", f"{item.get('type')} {item['id']} no existe", item=item["id"])
+        charged = pipeline.money(item["unit_price"])
+        current = pipeline.money(obj.final_price)
+        if charged != current:
+            raise SaleRejected(
+                "stale_price", f"El precio de {obj.name} ha cambiado",
+                item=obj.id, type=item.get("type"), charged=float(charged), current=float(current),
+            )
+        lines.append(pipeline.price_line(obj, int(item["qty"]), item.get("discount")))
+
+    payments = []
+    for p in sale.get("payments", []):
+        if p.get("provider") in ("stripe", "redsys") or p.get("stripe_payment_method_id"):
+            raise SaleRejected("card_payment", "Los cobros con tarjeta integrada no se pueden hacer sin conexión")
+        try:
+            method = ctx.methods.resolve(p.get("method_id"))
+        except Exception as e:
+            raise SaleRejected("invalid_payment", str(e))
+        payments.append((method, pipeline.money(p.get("amount", 0) or 0), None))
+
+    created_by = user
+    if sale.get("staff_id"):
+        created_by = ctx.staff.get(int(sale["staff_id"]))
+        if created_by is None:
+            raise SaleRejected("unknown_staff", "El empleado no pertenece a este gimnasio")
+
+    client = None
+    if sale.get("client_id"):
+        client = ctx.clients.get(int(sale["client_id"]))
+        if client is None:
+            raise SaleRejected("unknown_client", "El cliente no existe en este gimnasio")
+
+    total_amount = sum((line.subtotal for line in lines), Decimal(0))
+    total_base = sum((line.base for line in lines), Decimal(0))
+    total_paid = sum((amount for _, amount, _ in payments), Decimal(0))
+    order = Order(
+        gym=gym,
+        client=client,
+        created_by=created_by,
+        status='PARTIAL' if 0 < total_paid < total_amount else 'PAID',
+        total_amount=total_amount,
+        total_discount=sum((line.discount for line in lines), Decimal(0)),
+        total_base=total_base,
+        total_tax=total_amount - total_base,
+        offline_key=sale["offline_key"],
+        internal_notes="[Venta sin conexión]",
+    )
+    return order, created_at, lines, payments
+
+
+def _write_batch(gym, user, sales):
+    now = timezone.now()
+    results = [None] * len(sales)
+
+    valid = []
+    for index, sale in enumerate(sales):
+        try:
+            _check_shape(sale)
+            valid.append(index)
+        except SaleRejected as e:
+            results[index] = _rejected(sale.get("offline_key"), e)
+
+    keys = {sales[i]["offline_key"] for i in valid}
+    existing = dict(Order.objects.for_gym(gym).filter(offline_key__in=keys).values_list("offline_key", "id"))
+    ctx = _BatchContext(gym, [sales[i] for i in valid])
+
+    pending = []  # (index, order, created_at, lines, payments)
+    first_of_key = {}
+    for index in valid:
+        key = sales[index]["offline_key"]
+        if key in existing:
+            results[index] = {"offline_key": key, "status": "duplicate", "order_id": existing[key]}
+            continue
+        if key in first_of_key:
+            continue  # repetida en el mismo lote: se resuelve al final
+        try:
+            pending.append((index, *_build_order(gym, user, sales[index], ctx, now)))
+            first_of_key[key] = index
+        except SaleRejected as e:
+            results[index] = _rejected(key, e)
+
+    if pending:
+        orders = Order.objects.bulk_create([order for _, order, _, _, _ in pending])
+        # auto_now_add pisa created_at en el INSERT; bulk_update no pasa por pre_save
+        for order, (_, _, created_at, _, _) in zip(orders, pending):
+            order.created_at = created_at
+        Order.objects.bulk_update(orders, ["created_at"])
+
+        pipeline.write_items_bulk([(order, lines) for order, (_, _, _, lines, _) in zip(orders, pending)])
+        # La venta ya se hizo en la caja: el stock puede quedar en negativo
+        stock.apply_moves(gym, [
+            move
+            for order, (_, _, _, lines, _) in zip(orders, pending)
+            for move in stock.sale_moves(lines, user=order.created_by, notes=f"Venta sin conexión #{order.id}")
+        ])
+        pipeline.write_payments_bulk([(order, payments) for order, (_, _, _, _, payments) in zip(orders, pending)])
+
+        for order, (index, *_rest) in zip(orders, pending):
+            results[index] = {"offline_key": order.offline_key, "status": "created", "order_id": order.id}
+
+    for index in valid:
+        if results[index] is None:
+            first = results[first_of_key[sales[index]["offline_key"]]]
+            results[index] = {**first, "status": "duplicate"} if first["status"] == "created" else first
+    return results
+
+
+def sync_sales(gym, user, sales):
+    """Valida y crea las ventas en lotes de BATCH_SIZE (una transacción por lote)."""
+    results = []
+    for start in range(0, len(sales), BATCH_SIZE):
+        batch = sales[start:start + BATCH_SIZE]
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    results.extend(_write_batch(gym, user, batch))
+                break
+            except IntegrityError:
+                # Otra sincronización acaba de insertar alguna clave del lote: al
+                # repetirlo salen como "duplicate"
+                if attempt:
+                    raise
+    return results
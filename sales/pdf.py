@@ -0,0 +1,38 @@
+"""
+HTML -> PDF con xhtml2pdf (Python puro, sin dependencias del sistema).
+
+No importa modelos ni settings de Django: la facturación en lote
+(sales/invoice_pdf.py) llama a html_to_pdf desde un pool de procesos.
+"""
+from importlib import metadata
+from io import BytesIO
+
+try:
+    from xhtml2pdf import pisa
+except ImportError:  # opcional
+    pisa = None
+
+
+class PDFError(Exception):
+    pass
+
+
+def engine():
+    """Nombre y versión del motor; forma parte del hash de cada factura."""
+    if pisa is None:
+        return "none"
+    return f"xhtml2pdf-{metadata.version('xhtml2pdf')}"
+
+
+def available():
+    return pisa is not None
+
+
+def html_to_pdf(html):
+    if pisa is None:
+        raise PDFError("Falta el paquete xhtml2pdf para generar PDFs")
+    output = BytesIO()
+    status = pisa.CreatePDF(html, dest=output, encoding="utf-8")
+    if status.err:
+        raise PDFError(f"Error generando el PDF ({status.err} errores)")
+    return output.getvalue()
@@ -0,0 +1,174 @@
+"""
+Carrito → Order para process_sale (sales/api.py).
+
+Resuelve todo el carrito con un in_bulk por tipo de item (con su tax_rate) y los
+métodos de pago con una sola query, calcula los totales en memoria con Decimal
+redondeado a céntimos y escribe items y pagos con bulk_create.
+"""
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.contrib.contenttypes.models import ContentType
+
+from finance.models import PaymentMethod
+from memberships.models import MembershipPlan
+from products.models import Product
+from services.models import Service
+from .models import OrderItem, OrderPayment
+
+CENT = Decimal("0.01")
+
+# Cualquier otro tipo del TPV es una cuota (MembershipPlan)
+ITEM_MODELS = {
+    'product': Product,
+    'service': Service,
+    'membership': MembershipPlan,
+}
+
+
+def money(value):
+    return Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+@dataclass
+class CartLine:
+    obj: object
+    quantity: int
+    unit_price: Decimal
+    discount: Decimal
+    subtotal: Decimal
+    base: Decimal
+    tax_percent: Decimal
+
+    @property
+    def tax(self):
+        return self.subtotal - self.base
+
+    def to_item(self, order):
+        return OrderItem(
+            order=order,
+            content_type=ContentType.objects.get_for_model(self.obj),  # cacheado por proceso
+            object_id=self.obj.id,
+            description=self.obj.name,
+            quantity=self.quantity,
+            unit_price=self.unit_price,
+            subtotal=self.subtotal,
+            tax_rate=self.tax_percent,
+            discount_amount=self.discount,
+        )
+
+
+def item_model(obj_type):
+    return ITEM_MODELS.get(obj_type, MembershipPlan)
+
+
+def price_line(obj, qty, discount_info=None):
+    """Precio de una línea (precios con IVA incluido): descuento, subtotal, base e impuesto."""
+    discount_info = discount_info or {}
+    disc_type = discount_info.get('type', 'fixed')
+    disc_val = Decimal(str(discount_info.get('value', 0) or 0))
+
+    unit_price = money(obj.final_price)
+    base_total = unit_price * qty
+
+    discount = Decimal(0)
+    if disc_val > 0:
+        if disc_type == 'percent':
+            discount = money(base_total * min(disc_val, Decimal(100)) / 100)
+        else:
+            discount = money(disc_val)
+    discount = min(discount, base_total)
+
+    subtotal = base_total - discount
+    tax_percent = obj.tax_rate.rate_percent if obj.tax_rate else Decimal(0)
+    # Base = Total / (1 + Rate)
+    base = money(subtotal / (1 + tax_percent / 100))
+    return CartLine(obj, qty, unit_price, discount, subtotal, base, tax_percent)
+
+
+def load_catalog(gym, items):
+    """{modelo: {id: obj}} con una query (in_bulk) por tipo de item presente en `items`."""
+    ids_by_model = {}
+    for item in items:
+        ids_by_model.setdefault(item_model(item['type']), set()).add(int(item['id']))
+
+    return {
+        model: model.objects.filter(gym=gym).select_related('tax_rate').in_bulk(ids)
+        for model, ids in ids_by_model.items()
+    }
+
+
+def catalog_object(catalog, item):
+    """Lanza <Model>.DoesNotExist si el id no es del gym (como el .get() anterior)."""
+    model = item_model(item['type'])
+    obj = catalog.get(model, {}).get(int(item['id']))
+    if obj is None:
+        raise model.DoesNotExist(f"{model._meta.verbose_name} {item['id']} no existe")
+    return obj
+
+
+def resolve_cart(gym, items, catalog=None):
+    """Líneas del carrito. `catalog` (load_catalog) permite resolver varios carritos con las mismas queries."""
+    if catalog is None:
+        catalog = load_catalog(gym, items)
+    return [
+        price_line(catalog_object(catalog, item), int(item['qty']), item.get('discount'))
+        for item in items
+    ]
+
+
+class PaymentMethodResolver:
+    """Métodos de pago del gym cargados una vez; la misma búsqueda con fallbacks que antes, en memoria."""
+
+    def __init__(self, gym):
+        self.gym = gym
+        self.methods = list(PaymentMethod.objects.for_gym(gym).order_by('pk'))
+        self.by_id = {m.pk: m for m in self.methods}
+
+    def _first(self, predicate):
+        return next((m for m in self.methods if predicate(m)), None)
+
+    def resolve(self, method_id, provider=None):
+        try:
+            method = self.by_id.get(int(method_id))
+        except (TypeError, ValueError):
+            method = None
+        if method:
+            return method
+
+        # If using integration, maybe method provided is invalid?
+        # Try to find a generic "Card" method
+        if provider:  # stripe or redsys
+            method = (
+                self._first(lambda m: 'tarjeta' in m.name.lower())
+                or self._first(lambda m: 'stripe' in m.name.lower())
+                or self._first(lambda m: m.is_active and 'efectivo' not in m.name.lower())
+                or self._first(lambda m: m.is_active)
+            )
+        if not method:
+            raise Exception("No se encontró un método de pago válido en la configuración")
+        return method
+
+
+def write_items(order, lines):
+    return write_items_bulk([(order, lines)])
+
+
+def write_items_bulk(orders_lines):
+    """orders_lines: [(Order, [CartLine])] en un solo INSERT."""
+    return OrderItem.objects.bulk_create([
+        line.to_item(order) for order, lines in orders_lines for line in lines
+    ])
+
+
+def write_payments(order, payments):
+    """payments: [(PaymentMethod, amount, transaction_id)]"""
+    return write_payments_bulk([(order, payments)])
+
+
+def write_payments_bulk(orders_payments):
+    return OrderPayment.objects.bulk_create([
+        OrderPayment(order=order, payment_method=method, amount=amount, transaction_id=transaction_id)
+        for order, payments in orders_payments
+        for method, amount, transaction_id in payments
+    ])
@@ -0,0 +1,320 @@
+"""
+Reembolsos de los pagos con tarjeta de una venta al cancelarla.
+
+Antes order_cancel reembolsaba un pago detrás de otro dentro de la petición, con
+hasta 30 s por pasarela: una venta con varias tarjetas podía dejarla colgada
+minutos. Ahora:
+
+- Cada intento queda en la tabla Refund (proveedor, cantidad, estado, referencia
+  o error), creada antes de llamar a la pasarela.
+- Todos los reembolsos de la venta salen a la vez en un pool de hilos acotado
+  (settings.REFUND_MAX_WORKERS), compartido por el proceso.
+- La petición espera a cada uno como mucho el plazo de su pasarela
+  (settings.REFUND_DEADLINES) y responde con lo que haya: los que no han
+  terminado siguen en segundo plano y guardan su resultado en Refund al acabar,
+  con una línea más en las notas internas de la venta.
+- Si el proceso muere antes, el Refund se queda PENDING: el comando
+  sweep_refunds (programar cada pocos minutos) vuelve a mirar los que llevan
+  más de STALE_AFTER así.
+
+La versión async (arefund_order, para sales/api_async.py) hace lo mismo con
+tareas de asyncio sobre finance.gateways.
+
+Uso:
+    attempts = refunds.refund_order(order, gym)
+    refunds.add_note(order, "\\n" + "\\n".join(refunds.notes(attempts)))
+"""
+import asyncio
+import datetime
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, TextField, Value
+from django.db.models.functions import Concat
+from django.utils import timezone
+
+from finance import gateways
+from finance.money import to_cents
+from .models import Order, Refund
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEADLINE = 10  # segundos, para un proveedor sin entrada en REFUND_DEADLINES
+DEFAULT_MAX_WORKERS = 8
+GATEWAY_TIMEOUT = 30  # timeout HTTP de la llamada; acota lo que dura en segundo plano
+# Un Refund PENDING más antiguo que esto ya no tiene a nadie esperando a la pasarela
+STALE_AFTER = datetime.timedelta(minutes=10)
+
+_executor = None
+_executor_lock = threading.Lock()
+# Tareas async en segundo plano: asyncio solo guarda referencias débiles
+_background_tasks = set()
+
+# Refund en vuelo: DONE si la pasarela respondió a tiempo, LATE si la petición dejó de esperarlo
+_DONE, _LATE = "done", "late"
+_outcomes = {}
+_outcomes_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "REFUND_MAX_WORKERS", DEFAULT_MAX_WORKERS),
+                thread_name_prefix="refund",
+            )
+        return _executor
+
+
+def deadline(provider):
+    return getattr(settings, "REFUND_DEADLINES", {}).get(provider, DEFAULT_DEADLINE)
+
+
+# --------------------------------------------------
+# Llamadas a las pasarelas (síncronas, en los hilos del pool)
+# --------------------------------------------------
+
+def _stripe_refund(gym, transaction_id, amount_eur):
+    from finance.stripe_utils import refund_payment
+    return refund_payment(transaction_id, amount_eur=amount_eur, gym=gym)
+
+
+def _redsys_refund(gym, transaction_id, amount_eur):
+    from finance.redsys_utils import get_redsys_client
+    from finance.views_redsys import generate_order_id
+
+    redsys = get_redsys_client(gym)
+    if not redsys:
+        return False, "Redsys not configured"
+    # Redsys Refund requires generating a NEW order ID for the refund transaction
+    return redsys.refund_request(
+        generate_order_id(), amount_eur, original_order_id=transaction_id, timeout=GATEWAY_TIMEOUT,
+    )
+
+
+REFUNDERS = {
+    "stripe": _stripe_refund,
+    "redsys": _redsys_refund,
+}
+
+
+def _stripe_lookup(gym, transaction_id, amount_eur):
+    """Id de un reembolso de Stripe ya hecho a ese PaymentIntent por ese importe, o None."""
+    from finance.stripe_utils import get_client
+
+    stripe_client = get_client(gym)
+    if not stripe_client:
+        return None
+    found = stripe_client.v1.refunds.list(params={'payment_intent': transaction_id})
+    for refund in found.data:
+        if refund.status in ('pending', 'succeeded') and refund.amount == to_cents(amount_eur):
+            return refund.id
+    return None
+
+
+# Cómo preguntar a la pasarela si un reembolso sin resultado llegó a hacerse.
+# Redsys no tiene consulta en redsys_utils: se reintenta y rechaza devolver más de lo cobrado.
+LOOKUPS = {
+    "stripe": _stripe_lookup,
+}
+
+
+# --------------------------------------------------
+# Tabla de intentos
+# --------------------------------------------------
+
+def start(order):
+    """
+    Un Refund PENDING por cada pago de la venta cobrado por una pasarela. Llamar fuera
+    de transaction.atomic(): los hilos actualizan las filas con su propia conexión.
+    """
+    attempts = []
+    for payment in order.payments.all():
+        provider = gateways.provider_for_transaction(payment.transaction_id)
+        if provider:
+            attempts.append(Refund(order=order, payment=payment, provider=provider, amount=payment.amount))
+    return Refund.objects.bulk_create(attempts)
+
+
+def _apply(refund, success, result):
+    refund.status = Refund.SUCCEEDED if success else Refund.FAILED
+    refund.reference = str(result)[:255] if success else ""
+    refund.error = "" if success else str(result)
+    refund.finished_at = timezone.now()
+
+
+def finish(refund, success, result):
+    """Guarda el resultado en la fila (solo si sigue PENDING) y en `refund`. True si la actualizó."""
+    _apply(refund, success, result)
+    return bool(Refund.objects.filter(pk=refund.pk, status=Refund.PENDING).update(
+        status=refund.status, reference=refund.reference, error=refund.error, finished_at=refund.finished_at,
+    ))
+
+
+def add_note(order, text):
+    """
+    Añade `text` a las notas internas con un UPDATE, sin pisar lo que hayan escrito
+    a la vez los reembolsos en segundo plano.
+    """
+    Order.objects.filter(pk=order.pk).update(
+        internal_notes=Concat(F('internal_notes'), Value(text), output_field=TextField()),
+    )
+
+
+def notes(attempts):
+    """Líneas para las notas internas de la venta."""
+    lines = []
+    for refund in attempts:
+        label = refund.get_provider_display()
+        if refund.status == Refund.SUCCEEDED:
+            lines.append(f"Reembolso {label} exitoso ({refund.amount}€)")
+        elif refund.status == Refund.FAILED:
+            lines.append(f"Error Reembolso {label}: {refund.error}")
+        else:
+            lines.append(f"Reembolso {label} en curso ({refund.amount}€)")
+    return lines
+
+
+def summary(attempts):
+    """Para la respuesta JSON de la cancelación."""
+    return [
+        {
+            'payment_id': refund.payment_id,
+            'provider': refund.provider,
+            'amount': str(refund.amount),
+            'status': refund.status,
+            'error': refund.error,
+        }
+        for refund in attempts
+    ]
+
+
+# --------------------------------------------------
+# Orquestación
+# --------------------------------------------------
+
+def _settle(refund):
+    """La pasarela ha respondido. True si la petición ya no esperaba: toca anotar la venta."""
+    with _outcomes_lock:
+        if _outcomes.pop(refund.pk, None) == _LATE:
+            return True
+        _outcomes[refund.pk] = _DONE
+        return False
+
+
+def _abandon(refund):
+    """Vence el plazo de la petición. False si la pasarela respondió justo antes."""
+    with _outcomes_lock:
+        if _outcomes.pop(refund.pk, None) == _DONE:
+            return False
+        _outcomes[refund.pk] = _LATE
+        return True
+
+
+def _forget(refund):
+    with _outcomes_lock:
+        _outcomes.pop(refund.pk, None)
+
+
+def _finish_late(refund, success, result):
+    """Guarda el resultado y, si la venta ya se anotó como 'en curso', añade cómo acabó."""
+    updated = finish(refund, success, result)
+    if _settle(refund) and updated:
+        add_note(refund.order, "\n" + notes([refund])[0])
+
+
+def _run(gym, refund):
+    """En un hilo del pool: llama a la pasarela y guarda el resultado. Devuelve (success, result)."""
+    try:
+        try:
+            success, result = REFUNDERS[refund.provider](gym, refund.payment.transaction_id, float(refund.amount))
+        except Exception as e:
+            success, result = False, str(e)
+        _finish_late(Refund(pk=refund.pk, order=refund.order, provider=refund.provider, amount=refund.amount),
+                     success, result)
+        return success, result
+    finally:
+        # Conexiones de este hilo; el pool lo reutiliza para otras ventas
+        connections.close_all()
+
+
+def refund_order(order, gym):
+    """
+    Reembolsa a la vez todos los pagos con tarjeta de `order` y devuelve los Refund.
+    Los que no acaban en el plazo de su pasarela quedan PENDING y terminan en segundo plano.
+    """
+    attempts = start(order)
+    started = time.monotonic()
+    futures = [(refund, executor().submit(_run, gym, refund)) for refund in attempts]
+    for refund, future in futures:
+        remaining = deadline(refund.provider) - (time.monotonic() - started)
+        try:
+            success, result = future.result(timeout=max(remaining, 0))
+        except FutureTimeoutError:
+            if _abandon(refund):
+                continue
+            success, result = future.result()
+        _forget(refund)
+        _apply(refund, success, result)
+    return attempts
+
+
+async def _arun(gym, refund):
+    success, result = await gateways.refund(gym, refund.payment.transaction_id, float(refund.amount))
+    await sync_to_async(_finish_late)(refund, success, result)
+
+
+async def arefund_order(order, gym):
+    """refund_order para las vistas async: tareas de asyncio en vez del pool de hilos."""
+    attempts = await sync_to_async(start)(order)
+    started = time.monotonic()
+    tasks = []
+    for refund in attempts:
+        task = asyncio.create_task(_arun(gym, refund))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+        tasks.append(task)
+    for refund, task in zip(attempts, tasks):
+        remaining = deadline(refund.provider) - (time.monotonic() - started)
+        # asyncio.wait no cancela: al vencer el plazo la tarea sigue, solo dejamos de esperarla
+        await asyncio.wait([task], timeout=max(remaining, 0))
+        if task.done():
+            _forget(refund)
+        else:
+            _abandon(refund)
+    return attempts
+
+
+def sweep_stale(older_than=STALE_AFTER):
+    """
+    Resuelve los Refund que siguen PENDING pasado `older_than`: el proceso que los lanzó
+    murió sin guardar la respuesta. Si la pasarela dice que el reembolso ya se hizo se da
+    por bueno; si no, se vuelve a pedir. Devuelve cuántos se resolvieron.
+    """
+    stale = Refund.objects.filter(
+        status=Refund.PENDING, created_at__lt=timezone.now() - older_than,
+    ).select_related('payment', 'order__gym')
+    resolved = 0
+    for refund in stale:
+        gym, transaction_id, amount = refund.order.gym, refund.payment.transaction_id, float(refund.amount)
+        try:
+            lookup = LOOKUPS.get(refund.provider)
+            reference = lookup(gym, transaction_id, amount) if lookup else None
+            if reference:
+                success, result = True, reference
+            else:
+                success, result = REFUNDERS[refund.provider](gym, transaction_id, amount)
+        except Exception:
+            # Sin respuesta de la pasarela: sigue PENDING hasta la próxima pasada
+            logger.exception("Error revisando el reembolso %s", refund.pk)
+            continue
+        if finish(refund, success, result):
+            add_note(refund.order, "\n" + notes([refund])[0])
+            resolved += 1
+    return resolved
@@ -0,0 +1,118 @@
+"""
+Escaneo en el TPV: código de barras / SKU de producto o código de acceso de cliente.
+
+Un lector de códigos lanza ráfagas de búsquedas; cada código se resuelve con una
+sola query por índice ((gym, sku) único en Product, (gym, access_code) en Client)
+y el resultado (también "no encontrado") queda en un diccionario por gym en
+memoria. Cada diccionario va ligado a la versión de su espacio en
+organizations.tenant_cache ("catalog" para productos, "clients" para clientes),
+así que se vacía al guardar un producto o un cliente del gym en cualquier proceso.
+
+Uso:
+    result = scan.resolve(gym, "8412345678901")
+    # {"kind": "product", "item": {...}} | {"kind": "client", "client": {...}} | None
+"""
+import threading
+from collections import OrderedDict
+
+from clients.models import Client
+from organizations import tenant_cache
+from products.models import Product
+from .catalog_index import entry_for
+
+MAX_CODES_PER_GYM = 2048
+MAX_CODE_LENGTH = 50
+
+_MISSING = object()
+
+
+class _CodeCache:
+    """{(gym_id, namespace): (version, OrderedDict code -> resultado)} con LRU por gym."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, gym_id, namespace, version, code):
+        with self._lock:
+            entry = self._data.get((gym_id, namespace))
+            if entry is None or entry[0] != version:
+                return _MISSING
+            codes = entry[1]
+            value = codes.get(code, _MISSING)
+            if value is not _MISSING:
+                codes.move_to_end(code)
+            return value
+
+    def set(self, gym_id, namespace, version, code, value):
+        with self._lock:
+            entry = self._data.get((gym_id, namespace))
+            if entry is None or entry[0] != version:
+                entry = self._data[(gym_id, namespace)] = (version, OrderedDict())
+            codes = entry[1]
+            codes[code] = value
+            codes.move_to_end(code)
+            while len(codes) > self.maxsize:
+                codes.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_cache = _CodeCache(MAX_CODES_PER_GYM)
+
+
+def _cached(gym_id, namespace, code, lookup):
+    version = tenant_cache.namespace_version(gym_id, namespace)
+    value = _cache.get(gym_id, namespace, version, code)
+    if value is _MISSING:
+        value = lookup()
+        _cache.set(gym_id, namespace, version, code, value)
+    return value
+
+
+def _product_line(gym_id, code):
+    product = (
+        Product.objects.filter(gym_id=gym_id, sku=code, is_active=True)
+        .select_related("category", "tax_rate")
+        .first()
+    )
+    if product is None:
+        return None
+    return {**entry_for(product).as_result(), "qty": 1}
+
+
+def _client(gym_id, code):
+    client = Client.objects.for_gym(gym_id).filter(access_code=code).order_by("pk").first()
+    if client is None:
+        return None
+    return {
+        "id": client.id,
+        "text": str(client),
+        "email": client.email,
+        "first_name": client.first_name,
+        "last_name": client.last_name,
+        "status": client.status,
+    }
+
+
+def resolve(gym, code):
+    code = (code or "").strip()
+    if not code or len(code) > MAX_CODE_LENGTH:
+        return None
+    gym_id = getattr(gym, "pk", gym)
+
+    item = _cached(gym_id, tenant_cache.CATALOG, code, lambda: _product_line(gym_id, code))
+    if item is not None:
+        return {"kind": "product", "item": item}
+
+    client = _cached(gym_id, tenant_cache.CLIENTS, code, lambda: _client(gym_id, code))
+    if client is not None:
+        return {"kind": "client", "client": client}
+    return None
+
+
+def clear():
+    _cache.clear()
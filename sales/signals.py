@@ -0,0 +1,24 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from . import catalog_index
+
+# Items del catálogo: se actualiza solo esa entrada del índice del TPV.
+# Categorías e impuestos ya cambian la versión "catalog" (organizations/signals.py)
+# y el índice del gym se reconstruye en la siguiente búsqueda.
+# Al confirmar la transacción, después del bump de organizations/signals.py (la app
+# va antes en INSTALLED_APPS, así que su on_commit se registra primero).
+CATALOG_ITEMS = ("products.Product", "services.Service", "memberships.MembershipPlan")
+
+
+def refresh_catalog_item(sender, instance, using=None, **kwargs):
+    transaction.on_commit(lambda: catalog_index.refresh(instance), using=using)
+
+
+def remove_catalog_item(sender, instance, using=None, **kwargs):
+    transaction.on_commit(lambda: catalog_index.remove(instance), using=using)
+
+
+for _label in CATALOG_ITEMS:
+    post_save.connect(refresh_catalog_item, sender=_label, dispatch_uid=f"catalog_index:save:{_label}")
+    post_delete.connect(remove_catalog_item, sender=_label, dispatch_uid=f"catalog_index:delete:{_label}")
@@ -1,13 +1,19 @@
-from django.test import TestCase, Client as TestClient
+from django.test import TestCase, TransactionTestCase, Client as TestClient, override_settings
 from django.contrib.auth import get_user_model
-from django.urls import reverse
+from django.urls import path, reverse
+from django.utils import timezone
 from organizations.models import Gym
 from clients.models import Client
 from products.models import Product, ProductCategory
-from sales.models import Order, OrderItem, OrderPayment
+from sales.models import InvoiceSequence, Order, OrderItem, OrderPayment
 from finance.models import PaymentMethod
+from config.urls import urlpatterns as project_urlpatterns
+from sales import api_async
 import json
+import threading
+import time
 from decimal import Decimal
+from unittest import mock
 
 User = get_user_model()
 
@@ -130,3 +136,865 @@ class SalesAPITest(TestCase):
         
         order.refresh_from_db()
         self.assertEqual(order.status, 'CANCELLED')
+
+
+class SalePipelineTest(TestCase):
+    def setUp(self):
+        from django.contrib.contenttypes.models import ContentType
+        from django.test import RequestFactory
+        from finance.models import TaxRate
+        from memberships.models import MembershipPlan
+        from services.models import Service
+
+        self.gym = Gym.objects.create(name="Centro")
+        self.user = User.objects.create_user(email="staff@example.com", password="password")
+        iva = TaxRate.objects.create(gym=self.gym, name="IVA 21%", rate_percent=Decimal("21.00"))
+        self.products = [
+            Product.objects.create(gym=self.gym, name=f"Producto {i}", base_price=Decimal("10.00"),
+                                   tax_rate=iva, price_strategy='TAX_EXCLUDED')
+            for i in range(10)
+        ]
+        self.service = Service.objects.create(gym=self.gym, name="Fisio", base_price=Decimal("30.00"), tax_rate=iva)
+        self.plan = MembershipPlan.objects.create(gym=self.gym, name="Mensual", base_price=Decimal("45.00"))
+        self.pm_cash = PaymentMethod.objects.create(gym=self.gym, name="Efectivo", is_active=True)
+        ContentType.objects.get_for_models(Product, Service, MembershipPlan)
+
+        self.request = RequestFactory().post("/")
+        self.request.gym = self.gym
+        self.request.user = self.user
+
+    def test_cart_costs_constant_queries(self):
+        from sales.api import _record_sale
+
+        items = [{'id': p.id, 'type': 'product', 'qty': 1} for p in self.products] * 2
+        items += [{'id': self.service.id, 'type': 'service', 'qty': 1}] * 5
+        items += [{'id': self.plan.id, 'type': 'membership', 'qty': 1}] * 5
+        total = Decimal("12.10") * 20 + Decimal("30.00") * 5 + Decimal("45.00") * 5
+        data = {'items': items, 'payments': [{'method_id': self.pm_cash.id, 'amount': str(total)}]}
+
+        # 3 tipos de item + métodos de pago + order + items + stock (UPDATE + movimientos) + pagos
+        with self.assertNumQueries(9):
+            response = _record_sale(self.request, data)
+
+        order = Order.objects.get(pk=json.loads(response.content)['order_id'])
+        self.assertEqual(order.items.count(), 30)
+        self.assertEqual(order.total_amount, total)
+        self.assertEqual(order.total_base + order.total_tax, total)
+        self.assertEqual(order.status, 'PAID')
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock_quantity, -2)
+        self.assertEqual(self.products[0].stock_moves.get().quantity_change, -2)
+
+    def test_line_rounding(self):
+        from sales.pipeline import price_line
+
+        line = price_line(self.products[0], 3, {'type': 'percent', 'value': 15})
+        self.assertEqual(line.unit_price, Decimal("12.10"))
+        self.assertEqual(line.discount, Decimal("5.45"))
+        self.assertEqual(line.subtotal, Decimal("30.85"))
+        self.assertEqual(line.base, Decimal("25.50"))
+        self.assertEqual(line.tax, Decimal("5.35"))
+
+
+class CatalogIndexTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from sales import catalog_index
+
+        cache.clear()
+        catalog_index.clear()
+        self.gym = Gym.objects.create(name="Centro")
+        self.category = ProductCategory.objects.create(gym=self.gym, name="Suplementos")
+        self.whey = Product.objects.create(gym=self.gym, name="Proteína Whey", base_price=Decimal("30.00"),
+                                           category=self.category, sku="8412345678901")
+        self.bar = Product.objects.create(gym=self.gym, name="Barrita proteica", base_price=Decimal("2.50"))
+
+    def test_ranked_accent_folded_search_without_queries(self):
+        from sales import catalog_index
+
+        catalog_index.search(self.gym, "")  # construye el índice
+        with self.assertNumQueries(0):
+            by_prefix = catalog_index.search(self.gym, "prote")
+            by_category = catalog_index.search(self.gym, "suple")
+            by_sku = catalog_index.search(self.gym, "8412345678901")
+
+        self.assertEqual([r['id'] for r in by_prefix], [self.whey.id, self.bar.id])
+        self.assertEqual(by_prefix[0]['category'], "Suplementos")
+        self.assertEqual([r['id'] for r in by_category], [self.whey.id])
+        self.assertEqual([r['id'] for r in by_sku], [self.whey.id])
+
+    def test_refreshed_on_save(self):
+        from sales import catalog_index
+
+        catalog_index.search(self.gym, "")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bar.name = "Barrita de avena"
+            self.bar.save()
+            self.whey.is_active = False
+            self.whey.save()
+
+        with self.assertNumQueries(0):
+            self.assertEqual([r['name'] for r in catalog_index.search(self.gym, "avena")], ["Barrita de avena"])
+            self.assertEqual(catalog_index.search(self.gym, "whey"), [])
+
+    def test_rebuilt_when_another_process_changed_it(self):
+        from organizations import tenant_cache
+        from sales import catalog_index
+
+        catalog_index.search(self.gym, "")
+        # Cambio de otro proceso: actualiza la BD y sube la versión, sin signals aquí
+        Product.objects.filter(pk=self.whey.pk).update(name="Proteína Isolate")
+        tenant_cache.bump_namespace(self.gym, tenant_cache.CATALOG)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bar.name = "Barrita de avena"
+            self.bar.save()
+
+        self.assertEqual([r['name'] for r in catalog_index.search(self.gym, "isolate")], ["Proteína Isolate"])
+        self.assertEqual([r['name'] for r in catalog_index.search(self.gym, "avena")], ["Barrita de avena"])
+
+
+class ScanCodeTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from sales import scan
+
+        cache.clear()
+        scan.clear()
+        self.gym = Gym.objects.create(name="Centro")
+        self.product = Product.objects.create(gym=self.gym, name="Agua", base_price=Decimal("1.20"), sku="8410000000011")
+        self.member = Client.objects.create(gym=self.gym, first_name="Ana", access_code="7788")
+
+    def test_resolves_products_then_clients_from_cache(self):
+        from sales import scan
+
+        self.assertEqual(scan.resolve(self.gym, " 8410000000011 ")["item"]["id"], self.product.id)
+        self.assertEqual(scan.resolve(self.gym, "7788")["client"]["id"], self.member.id)
+        self.assertIsNone(scan.resolve(self.gym, "0000"))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(scan.resolve(self.gym, "8410000000011")["item"]["qty"], 1)
+            self.assertEqual(scan.resolve(self.gym, "7788")["kind"], "client")
+            self.assertIsNone(scan.resolve(self.gym, "0000"))
+
+    def test_cache_follows_catalog_changes(self):
+        from sales import scan
+
+        scan.resolve(self.gym, "8410000000011")
+        self.product.base_price = Decimal("1.50")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertEqual(scan.resolve(self.gym, "8410000000011")["item"]["price"], 1.5)
+
+    def test_sku_unique_per_gym(self):
+        from django.db import IntegrityError, transaction
+        from products.forms import ProductForm
+
+        other = Gym.objects.create(name="Otro")
+        Product.objects.create(gym=other, name="Agua", base_price=Decimal("1.20"), sku="8410000000011")
+        Product.objects.create(gym=self.gym, name="Sin SKU 1", base_price=Decimal("1.00"))
+        Product.objects.create(gym=self.gym, name="Sin SKU 2", base_price=Decimal("1.00"))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Product.objects.create(gym=self.gym, name="Agua 2", base_price=Decimal("1.20"), sku="8410000000011")
+
+        form = ProductForm({'name': 'Agua 2', 'sku': '8410000000011', 'base_price': '1.20', 'cost_price': '0',
+                            'price_strategy': 'TAX_INCLUDED', 'stock_quantity': 0, 'low_stock_threshold': 5},
+                           gym=self.gym)
+        self.assertIn('sku', form.errors)
+
+
+class CatalogSnapshotTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from django.test import RequestFactory
+
+        cache.clear()
+        self.gym = Gym.objects.create(name="Centro")
+        self.product = Product.objects.create(gym=self.gym, name="Agua", base_price=Decimal("1.20"), stock_quantity=7)
+        self.factory = RequestFactory()
+
+    def _get(self, **headers):
+        from sales.api import catalog_snapshot
+
+        request = self.factory.get("/", headers=headers)
+        request.gym = self.gym
+        # Sin require_gym_permission
+        return catalog_snapshot.__wrapped__(request)
+
+    def test_gzip_etag_and_not_modified(self):
+        import gzip
+
+        response = self._get(accept_encoding="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        document = json.loads(gzip.decompress(response.content))
+        self.assertEqual(document["products"][0]["price"], 1.2)
+
+        etag = response["ETag"]
+        self.assertEqual(self._get(if_none_match=etag).status_code, 304)
+
+        self.product.base_price = Decimal("1.50")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        response = self._get(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(json.loads(response.content)["products"][0]["price"], 1.5)
+
+    def test_stock_apart_from_snapshot(self):
+        from products import stock
+        from products.models import StockMove
+        from sales.api import catalog_stock
+
+        def get_stock(**headers):
+            request = self.factory.get("/", headers=headers)
+            request.gym = self.gym
+            return catalog_stock.__wrapped__(request)
+
+        snapshot_etag = self._get()["ETag"]
+        response = get_stock()
+        self.assertEqual(json.loads(response.content)["stock"], {str(self.product.pk): 7})
+        stock_etag = response["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.apply_moves(self.gym, [StockMove(product=self.product, quantity_change=-1, reason='SALE')])
+
+        # Una venta no invalida el catálogo, solo el stock
+        self.assertEqual(self._get(if_none_match=snapshot_etag).status_code, 304)
+        response = get_stock(if_none_match=stock_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["stock"], {str(self.product.pk): 6})
+
+
+class OfflineSyncTest(TestCase):
+    def setUp(self):
+        from django.contrib.contenttypes.models import ContentType
+        from accounts.models_memberships import GymMembership
+
+        self.gym = Gym.objects.create(name="Centro")
+        self.user = User.objects.create_user(email="caja@example.com", password="password")
+        self.staff = User.objects.create_user(email="monitor@example.com", password="password")
+        GymMembership.objects.create(user=self.staff, gym=self.gym, role=GymMembership.Role.ADMIN)
+        self.product = Product.objects.create(gym=self.gym, name="Agua", base_price=Decimal("1.20"))
+        self.pm_cash = PaymentMethod.objects.create(gym=self.gym, name="Efectivo", is_active=True)
+        ContentType.objects.get_for_model(Product)
+
+    def _sale(self, key, price="1.20", **extra):
+        sale = {
+            'offline_key': key,
+            'created_at': '2026-10-01T09:30:00+02:00',
+            'staff_id': self.staff.id,
+            'items': [{'id': self.product.id, 'type': 'product', 'qty': 2, 'unit_price': price}],
+            'payments': [{'method_id': self.pm_cash.id, 'amount': '2.40'}],
+        }
+        sale.update(extra)
+        return sale
+
+    def test_batch_creates_rejects_and_deduplicates(self):
+        from sales.offline_sync import sync_sales
+
+        sales = [self._sale(f"k{i}") for i in range(50)] + [self._sale("stale", price="1.00"), self._sale("k0")]
+        with self.assertNumQueries(12):  # por lote, no por venta
+            results = sync_sales(self.gym, self.user, sales)
+
+        self.assertEqual([r['status'] for r in results[:50]], ['created'] * 50)
+        self.assertEqual(results[50]['error'], 'stale_price')
+        self.assertEqual(results[50]['current'], 1.2)
+        self.assertEqual(results[51], {**results[0], 'status': 'duplicate'})
+
+        order = Order.objects.get(pk=results[0]['order_id'])
+        self.assertEqual(order.created_by, self.staff)
+        self.assertEqual(order.created_at.isoformat(), '2026-10-01T07:30:00+00:00')
+        self.assertEqual(order.items.get().subtotal, Decimal("2.40"))
+        self.assertEqual(order.payments.get().amount, Decimal("2.40"))
+
+        # Reintento del TPV: todo sale como duplicado y no se crea nada
+        retry = sync_sales(self.gym, self.user, sales[:3])
+        self.assertEqual({r['status'] for r in retry}, {'duplicate'})
+        self.assertEqual(Order.objects.count(), 50)
+
+    def test_rejects_card_payments_and_foreign_staff(self):
+        from sales.offline_sync import sync_sales
+
+        outsider = User.objects.create_user(email="otro@example.com", password="password")
+        results = sync_sales(self.gym, self.user, [
+            self._sale("card", payments=[{'provider': 'stripe', 'payment_token': 'pm_x', 'amount': '2.40'}]),
+            self._sale("staff", staff_id=outsider.id),
+            self._sale("future", created_at='2999-01-01T00:00:00Z'),
+        ])
+        self.assertEqual([r['error'] for r in results], ['card_payment', 'unknown_staff', 'invalid_timestamp'])
+
+    def test_malformed_fields_reject_only_that_sale(self):
+        from sales.offline_sync import sync_sales
+
+        item = {'id': self.product.id, 'type': 'product', 'qty': 2, 'unit_price': '1.20'}
+        results = sync_sales(self.gym, self.user, [
+            self._sale("client", client_id="abc"),
+            self._sale("staff", staff_id="x"),
+            self._sale("discount", items=[{**item, 'discount': {'value': 'abc'}}]),
+            self._sale("type", items=[{**item, 'type': 'voucher'}]),
+            self._sale("amount", payments=[{'method_id': self.pm_cash.id, 'amount': 'abc'}]),
+            self._sale("nan", payments=[{'method_id': self.pm_cash.id, 'amount': 'NaN'}]),
+            self._sale("payment", payments=["x"]),
+            self._sale("payments", payments="x"),
+            self._sale("ok"),
+        ])
+        self.assertEqual([r.get('error') for r in results],
+                         ['invalid_client', 'invalid_staff', 'invalid_item', 'invalid_item',
+                          'invalid_payment', 'invalid_payment', 'invalid_payment', 'invalid_payment', None])
+        self.assertEqual(results[8]['status'], 'created')
+
+
+class IdempotencyKeyTest(TestCase):
+    def setUp(self):
+        from django.test import RequestFactory
+
+        self.gym = Gym.objects.create(name="Centro")
+        self.user = User.objects.create_user(email="caja@example.com", password="password")
+        self.product = Product.objects.create(gym=self.gym, name="Agua", base_price=Decimal("1.20"))
+        self.pm_cash = PaymentMethod.objects.create(gym=self.gym, name="Efectivo", is_active=True)
+        self.factory = RequestFactory()
+        self.calls = 0
+
+    def _request(self, body, key="k-1"):
+        request = self.factory.post("/api/sale/process/", json.dumps(body), content_type="application/json",
+                                    HTTP_IDEMPOTENCY_KEY=key)
+        request.gym = self.gym
+        request.user = self.user
+        return request
+
+    def _view(self):
+        from django.http import JsonResponse
+        from sales.idempotency import idempotent
+
+        @idempotent("test.charge")
+        def view(request):
+            self.calls += 1
+            return JsonResponse({'charge': self.calls})
+        return view
+
+    def test_process_sale_is_replayed(self):
+        from sales.api import process_sale
+
+        # Sin los decoradores de permisos
+        view = process_sale.__wrapped__.__wrapped__
+        body = {
+            'items': [{'id': self.product.id, 'type': 'product', 'qty': 1}],
+            'payments': [{'method_id': self.pm_cash.id, 'amount': '1.20'}],
+        }
+        first = view(self._request(body))
+        retry = view(self._request(body))
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_different_request_with_same_key_is_rejected(self):
+        view = self._view()
+        view(self._request({'amount': 1}))
+        response = view(self._request({'amount': 2}))
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.calls, 1)
+
+    def test_in_flight_duplicate_gets_conflict(self):
+        from unittest import mock
+        from sales import idempotency
+        from sales.models import IdempotencyKey
+
+        request = self._request({'amount': 1})
+        IdempotencyKey.objects.create(endpoint="test.charge", gym=self.gym, user=self.user, key="k-1",
+                                      fingerprint=idempotency.fingerprint(request, self.user))
+        with mock.patch.object(idempotency, "WAIT_TIMEOUT", 0):
+            response = self._view()(request)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.calls, 0)
+
+    def test_abandoned_reservation_is_taken_over(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from sales import idempotency
+        from sales.models import IdempotencyKey
+
+        request = self._request({'amount': 1})
+        IdempotencyKey.objects.create(endpoint="test.charge", gym=self.gym, user=self.user, key="k-1",
+                                      fingerprint=idempotency.fingerprint(request, self.user),
+                                      created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self._view()(request).status_code, 200)
+        self.assertEqual(IdempotencyKey.objects.get().status, IdempotencyKey.COMPLETED)
+
+    def test_failed_view_releases_key(self):
+        from sales.idempotency import idempotent
+        from sales.models import IdempotencyKey
+
+        @idempotent("test.charge")
+        def broken(request):
+            raise RuntimeError("gateway down")
+
+        with self.assertRaises(RuntimeError):
+            broken(self._request({'amount': 1}))
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self._view()(self._request({'amount': 1})).status_code, 200)
+
+    def test_transient_errors_are_not_replayed(self):
+        from django.http import JsonResponse
+        from sales.idempotency import idempotent
+        from sales.models import IdempotencyKey
+
+        statuses = [500, 409, 200]
+
+        @idempotent("test.charge")
+        def flaky(request):
+            self.calls += 1
+            return JsonResponse({'charge': self.calls}, status=statuses[self.calls - 1])
+
+        self.assertEqual(flaky(self._request({'amount': 1})).status_code, 500)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(flaky(self._request({'amount': 1})).status_code, 409)
+        self.assertEqual(flaky(self._request({'amount': 1})).status_code, 200)
+        replay = flaky(self._request({'amount': 1}))
+        self.assertEqual((replay.status_code, replay['Idempotent-Replayed']), (200, 'true'))
+        self.assertEqual(self.calls, 3)
+
+    def test_same_key_in_another_gym_is_another_request(self):
+        other_gym = Gym.objects.create(name="Otro")
+        other_user = User.objects.create_user(email="otra@example.com", password="password")
+        view = self._view()
+        view(self._request({'amount': 1}))
+
+        request = self._request({'amount': 2})
+        request.gym, request.user = other_gym, other_user
+        response = view(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.calls, 2)
+
+    def test_requests_without_scope_share_the_key(self):
+        from django.contrib.auth.models import AnonymousUser
+        from django.db import IntegrityError, transaction
+        from sales.models import IdempotencyKey
+
+        view = self._view()
+        for _ in range(2):
+            request = self._request({'amount': 1})
+            request.gym, request.user = None, AnonymousUser()
+            response = view(request)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.calls, 1)
+
+        # NULL en gym/usuario no se salta el índice único
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            IdempotencyKey.objects.create(endpoint="test.charge", key="k-1", fingerprint="otra")
+
+    def test_error_after_charge_is_kept(self):
+        from django.http import JsonResponse
+        from sales.idempotency import idempotent, mark_charged
+
+        @idempotent("test.charge")
+        def charged_then_failed(request):
+            self.calls += 1
+            mark_charged(request)
+            return JsonResponse({'error': 'fallo al guardar'}, status=500)
+
+        @idempotent("test.raise")
+        def charged_then_raised(request):
+            self.calls += 1
+            mark_charged(request)
+            raise RuntimeError("fallo al guardar")
+
+        charged_then_failed(self._request({'amount': 1}))
+        retry = charged_then_failed(self._request({'amount': 1}))
+        self.assertEqual((retry.status_code, retry['Idempotent-Replayed']), (500, 'true'))
+
+        with self.assertRaises(RuntimeError):
+            charged_then_raised(self._request({'amount': 1}))
+        retry = charged_then_raised(self._request({'amount': 1}))
+        self.assertEqual((retry.status_code, json.loads(retry.content)['error_code']), (500, 'CHARGED_WITH_ERROR'))
+        self.assertEqual(self.calls, 2)
+
+    def test_async_view(self):
+        from asgiref.sync import async_to_sync
+        from django.http import JsonResponse
+        from sales.idempotency import idempotent
+
+        @idempotent("test.async_charge")
+        async def view(request):
+            self.calls += 1
+            return JsonResponse({'charge': self.calls})
+
+        first = async_to_sync(view)(self._request({'amount': 1}))
+        retry = async_to_sync(view)(self._request({'amount': 1}))
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(self.calls, 1)
+
+    def test_without_header_runs_every_time(self):
+        view = self._view()
+        request = self._request({'amount': 1})
+        del request.META['HTTP_IDEMPOTENCY_KEY']
+        view(request)
+        view(request)
+        self.assertEqual(self.calls, 2)
+
+
+class InvoiceNumberingTest(TestCase):
+    def setUp(self):
+        self.gym = Gym.objects.create(name="Centro")
+        self.other_gym = Gym.objects.create(name="Otro Centro")
+        self.user = User.objects.create_user(email="caja@example.com", password="password")
+
+    def _order(self, gym=None):
+        return Order.objects.create(gym=gym or self.gym, created_by=self.user, total_amount=Decimal("10.00"))
+
+    def test_numbers_are_sequential_per_gym(self):
+        from django.db import transaction
+        from sales.invoicing import assign_invoice_number
+
+        with transaction.atomic():
+            first = assign_invoice_number(self._order())
+            second = assign_invoice_number(self._order())
+            other = assign_invoice_number(self._order(self.other_gym))
+
+        year = timezone.localdate().year
+        self.assertEqual(first, f"F-{year}-000001")
+        self.assertEqual(second, f"F-{year}-000002")
+        self.assertEqual(other, f"F-{year}-000001")
+
+    def test_existing_number_is_kept(self):
+        from django.db import transaction
+        from sales.invoicing import assign_invoice_number
+
+        order = self._order()
+        with transaction.atomic():
+            number = assign_invoice_number(order)
+            stale = Order.objects.get(pk=order.pk)
+            stale.invoice_number = None
+            self.assertEqual(assign_invoice_number(stale), number)
+        self.assertEqual(InvoiceSequence.objects.get().last_number, 1)
+
+    def test_rolled_back_number_is_reused(self):
+        from django.db import transaction
+        from sales.invoicing import assign_invoice_number
+
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                assign_invoice_number(self._order())
+                raise RuntimeError("fallo al guardar la venta")
+        with transaction.atomic():
+            number = assign_invoice_number(self._order())
+        self.assertTrue(number.endswith("-000001"))
+
+    def test_block_reservation_for_batch(self):
+        from django.db import transaction
+        from sales.invoicing import assign_invoice_numbers
+
+        orders = [self._order() for _ in range(5)] + [self._order(self.other_gym)]
+        # Por gym, un UPDATE del contador (la primera vez también su INSERT y otro UPDATE);
+        # luego un solo bulk_update de las ventas
+        with transaction.atomic(), self.assertNumQueries(3 + 3 + 1):
+            numbered = assign_invoice_numbers(orders, series="M", year=2026)
+
+        self.assertEqual(len(numbered), 6)
+        self.assertEqual(
+            list(Order.objects.filter(gym=self.gym).order_by("pk").values_list("invoice_number", flat=True)),
+            [f"M-2026-00000{i}" for i in range(1, 6)],
+        )
+        self.assertEqual(InvoiceSequence.objects.get(gym=self.gym, series="M").last_number, 5)
+
+    @override_settings(INVOICE_NUMBER_FORMAT="{year}/{number}")
+    def test_format_is_stored_per_sequence(self):
+        from django.db import transaction
+        from sales.invoicing import assign_invoice_number
+
+        with transaction.atomic():
+            number = assign_invoice_number(self._order())
+        self.assertEqual(number, f"{timezone.localdate().year}/1")
+
+
+class InvoicePdfTest(TestCase):
+    def setUp(self):
+        import tempfile
+        from django.contrib.contenttypes.models import ContentType
+
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.gym = Gym.objects.create(name="Centro", legal_name="Centro Deportivo SL", tax_id="B12345678")
+        self.user = User.objects.create_user(email="caja@example.com", password="password")
+        self.client_obj = Client.objects.create(gym=self.gym, first_name="Ana", last_name="García", dni="12345678Z")
+        product = Product.objects.create(gym=self.gym, name="Agua", base_price=Decimal("1.20"))
+        pm_cash = PaymentMethod.objects.create(gym=self.gym, name="Efectivo", is_active=True)
+        self.order = Order.objects.create(
+            gym=self.gym, client=self.client_obj, created_by=self.user, status='PAID',
+            total_amount=Decimal("2.40"), total_base=Decimal("2.40"), invoice_number="F-2026-000001",
+        )
+        OrderItem.objects.create(order=self.order, content_type=ContentType.objects.get_for_model(Product),
+                                 object_id=product.id, description="Agua", quantity=2,
+                                 unit_price=Decimal("1.20"), subtotal=Decimal("2.40"))
+        OrderPayment.objects.create(order=self.order, payment_method=pm_cash, amount=Decimal("2.40"))
+
+    def test_invoice_html(self):
+        from sales.invoice_pdf import invoice_html
+
+        html = invoice_html(self.order)
+        self.assertIn("F-2026-000001", html)
+        self.assertIn("Centro Deportivo SL", html)
+        self.assertIn("12345678Z", html)
+        self.assertIn("Efectivo", html)
+
+    def test_batch_skips_unchanged_invoices(self):
+        import io
+        import zipfile
+        from sales import invoice_pdf
+
+        digest = invoice_pdf.content_hash(invoice_pdf.invoice_html(self.order))
+        invoice_pdf._store(self.order, b"%PDF-stored", digest)
+        self.order.save(update_fields=["invoice_pdf", "invoice_pdf_hash"])
+
+        today = timezone.localdate()
+        buffer = io.BytesIO()
+        stats = invoice_pdf.render_batch(self.gym, today, today, zip_file=buffer, workers=1)
+
+        self.assertEqual(stats, {"rendered": 0, "skipped": 1, "total": 1})
+        with zipfile.ZipFile(buffer) as archive:
+            self.assertEqual(archive.namelist(), ["F-2026-000001.pdf"])
+            self.assertEqual(archive.read("F-2026-000001.pdf"), b"%PDF-stored")
+
+    def test_changed_order_gets_a_new_hash(self):
+        from sales import invoice_pdf
+
+        before = invoice_pdf.content_hash(invoice_pdf.invoice_html(self.order))
+        self.order.total_amount = Decimal("3.00")
+        self.assertNotEqual(invoice_pdf.content_hash(invoice_pdf.invoice_html(self.order)), before)
+
+    def test_cancelled_orders_get_no_number(self):
+        from sales import invoice_pdf, pdf
+
+        gym = Gym.objects.create(name="Otro Centro")
+        pending = Order.objects.create(gym=gym, created_by=self.user, status='PAID', total_amount=Decimal("5"))
+        failed = Order.objects.create(gym=gym, created_by=self.user, status='CANCELLED', total_amount=Decimal("5"))
+
+        today = timezone.localdate()
+        with mock.patch.object(pdf, "html_to_pdf", return_value=b"%PDF-test"):
+            stats = invoice_pdf.render_batch(gym, today, today, workers=1, assign_numbers=True)
+
+        self.assertEqual(stats, {"rendered": 1, "skipped": 0, "total": 1})
+        pending.refresh_from_db()
+        failed.refresh_from_db()
+        self.assertTrue(pending.invoice_number)
+        self.assertIsNone(failed.invoice_number)
+
+    def test_render_pdf(self):
+        from sales import invoice_pdf, pdf
+
+        if not pdf.available():
+            self.skipTest("xhtml2pdf no instalado")
+        content = invoice_pdf.get_pdf(self.order)
+        self.assertTrue(content.startswith(b"%PDF"))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.invoice_pdf_hash, invoice_pdf.content_hash(invoice_pdf.invoice_html(self.order)))
+
+
+@override_settings(REFUND_DEADLINES={"stripe": 5, "redsys": 0.2})
+class RefundOrchestratorTest(TransactionTestCase):
+    # Los hilos del pool escriben con su propia conexión: sin la transacción de TestCase
+
+    def setUp(self):
+        from sales import refunds
+
+        self.gym = Gym.objects.create(name="Centro")
+        self.user = User.objects.create_user(email="caja@example.com", password="password")
+        card = PaymentMethod.objects.create(gym=self.gym, name="Tarjeta", is_active=True)
+        cash = PaymentMethod.objects.create(gym=self.gym, name="Efectivo", is_active=True)
+        self.order = Order.objects.create(gym=self.gym, created_by=self.user, status='PAID', total_amount=Decimal("35"))
+        OrderPayment.objects.create(order=self.order, payment_method=card, amount=Decimal("10"), transaction_id="pi_1")
+        OrderPayment.objects.create(order=self.order, payment_method=card, amount=Decimal("20"), transaction_id="2401011234")
+        OrderPayment.objects.create(order=self.order, payment_method=cash, amount=Decimal("5"))
+
+        self.redsys_done = threading.Event()
+        self.addCleanup(self.redsys_done.set)
+
+        def slow_redsys(gym, transaction_id, amount_eur):
+            self.redsys_done.wait(5)
+            return False, "Operación denegada"
+
+        patcher = mock.patch.dict(refunds.REFUNDERS, {
+            "stripe": lambda gym, transaction_id, amount_eur: (True, "re_1"),
+            "redsys": slow_redsys,
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _wait_for(self, **filters):
+        from sales.models import Refund
+
+        for _ in range(50):
+            if Refund.objects.filter(**filters).exists():
+                return True
+            time.sleep(0.05)
+        return False
+
+    def _wait_for_note(self, text):
+        for _ in range(50):
+            self.order.refresh_from_db()
+            if text in self.order.internal_notes:
+                return True
+            time.sleep(0.05)
+        return False
+
+    def test_slow_gateway_finishes_in_background(self):
+        from sales import refunds
+        from sales.models import Refund
+
+        started = time.monotonic()
+        attempts = refunds.refund_order(self.order, self.gym)
+        self.assertLess(time.monotonic() - started, 2)
+
+        self.assertEqual([(r.provider, r.status) for r in attempts],
+                         [("stripe", Refund.SUCCEEDED), ("redsys", Refund.PENDING)])
+        self.assertEqual(attempts[0].reference, "re_1")
+        self.assertIn("Reembolso Redsys en curso (20.00€)", refunds.notes(attempts))
+
+        self.redsys_done.set()
+        self.assertTrue(self._wait_for(provider="redsys", status=Refund.FAILED, error="Operación denegada"))
+        self.assertTrue(self._wait_for_note("Error Reembolso Redsys: Operación denegada"))
+
+    def test_sweep_resolves_stale_refunds(self):
+        from datetime import timedelta
+        from django.core.management import call_command
+        from sales import refunds
+        from sales.models import Refund
+
+        stale = refunds.start(self.order)
+        Refund.objects.filter(pk__in=[r.pk for r in stale]).update(created_at=timezone.now() - timedelta(hours=1))
+        recent = refunds.start(self.order)
+        self.redsys_done.set()
+
+        with mock.patch.dict(refunds.LOOKUPS, {"stripe": lambda gym, transaction_id, amount_eur: "re_0"}):
+            call_command("sweep_refunds", stdout=mock.MagicMock())
+
+        self.assertEqual(
+            list(Refund.objects.filter(pk__in=[r.pk for r in stale]).order_by("pk").values_list("status", "reference")),
+            [(Refund.SUCCEEDED, "re_0"), (Refund.FAILED, "")],
+        )
+        self.assertFalse(Refund.objects.filter(pk__in=[r.pk for r in recent]).exclude(status=Refund.PENDING).exists())
+        self.order.refresh_from_db()
+        self.assertIn("Reembolso Stripe exitoso (10.00€)", self.order.internal_notes)
+        self.assertIn("Error Reembolso Redsys: Operación denegada", self.order.internal_notes)
+
+    def test_order_cancel_view(self):
+        from django.test import RequestFactory
+        from sales.api import order_cancel
+
+        request = RequestFactory().post("/")
+        request.gym = self.gym
+        request.user = self.user
+        # Sin los decoradores de método y permisos
+        response = order_cancel.__wrapped__.__wrapped__(request, self.order.id)
+
+        body = json.loads(response.content)
+        self.assertEqual([r["status"] for r in body["refunds"]], ["SUCCEEDED", "PENDING"])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'CANCELLED')
+        self.assertIn("Reembolso Stripe exitoso (10.00€)", self.order.internal_notes)
+
+
+class AsyncGatewayUrls:
+    """URLs de config con las vistas async de sales/api_async.py (como bajo ASGI)."""
+
+    urlpatterns = [
+        path('sales/api/sale/process/', api_async.process_sale),
+        path('sales/api/client/<int:client_id>/cards/', api_async.get_client_cards),
+        path('sales/api/order/<int:order_id>/cancel/', api_async.order_cancel),
+        path('sales/api/subscription/<int:pk>/charge/', api_async.subscription_charge),
+    ] + project_urlpatterns
+
+
+@override_settings(ROOT_URLCONF=AsyncGatewayUrls)
+class AsyncGatewayViewsTest(TestCase):
+    def setUp(self):
+        from accounts.models_memberships import GymMembership
+        from finance import gateways
+
+        self.gym = Gym.objects.create(name="Centro")
+        self.user = User.objects.create_user(email="caja@example.com", password="password")
+        GymMembership.objects.create(user=self.user, gym=self.gym, role=GymMembership.Role.ADMIN)
+        self.card = PaymentMethod.objects.create(gym=self.gym, name="Tarjeta Stripe", is_active=True)
+        self.product = Product.objects.create(gym=self.gym, name="Agua", base_price=Decimal("2.00"), stock_quantity=0)
+        self.customer = Client.objects.create(gym=self.gym, first_name="Ana", stripe_customer_id="cus_1")
+
+        self.async_client.force_login(self.user)
+        session = self.async_client.session
+        session["current_gym_id"] = self.gym.id
+        session.save()
+
+        # Pasarela simulada: ninguna petición sale a Stripe/Redsys
+        self.charge = mock.AsyncMock(return_value=(True, "pi_1"))
+        self.refund = mock.AsyncMock(return_value=(True, "re_1"))
+        for name, stub in (("charge", self.charge), ("refund", self.refund)):
+            patcher = mock.patch.object(gateways, name, stub)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _sale(self):
+        return {
+            'client_id': self.customer.id,
+            'items': [{'id': self.product.id, 'type': 'product', 'qty': 1}],
+            'payments': [{'method_id': self.card.id, 'amount': str(self.product.final_price),
+                          'provider': 'stripe', 'payment_token': 'pm_1'}],
+        }
+
+    async def _post(self, url, data=None):
+        return await self.async_client.post(url, json.dumps(data or {}), content_type="application/json")
+
+    async def test_process_sale_records_the_charge(self):
+        response = await self._post('/sales/api/sale/process/', self._sale())
+
+        self.assertEqual(response.status_code, 200)
+        self.charge.assert_awaited_once()
+        self.refund.assert_not_awaited()
+        payment = await OrderPayment.objects.aget(order_id=response.json()['order_id'])
+        self.assertEqual(payment.transaction_id, "pi_1")
+
+    @override_settings(STOCK_PREVENT_OVERSELL=True)
+    async def test_card_refunded_when_sale_not_recorded(self):
+        response = await self._post('/sales/api/sale/process/', self._sale())
+
+        self.assertEqual(response.status_code, 409)
+        self.refund.assert_awaited_once_with(self.gym, "pi_1", float(self.product.final_price))
+        self.assertFalse(await Order.objects.filter(gym=self.gym).aexists())
+
+    async def test_client_cards(self):
+        from finance import gateways
+
+        card = {'id': 'pm_1', 'card': {'brand': 'visa', 'last4': '4242'}}
+        with mock.patch.object(gateways, "list_payment_methods", mock.AsyncMock(return_value=[card])):
+            response = await self.async_client.get(f'/sales/api/client/{self.customer.id}/cards/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(c['id'], c['provider'], c['last4']) for c in response.json()], [('pm_1', 'stripe', '4242')])
+
+    async def test_order_cancel_refunds_through_gateway(self):
+        order = await Order.objects.acreate(gym=self.gym, created_by=self.user, status='PAID', total_amount=Decimal("10"))
+        await OrderPayment.objects.acreate(order=order, payment_method=self.card, amount=Decimal("10"), transaction_id="pi_9")
+
+        response = await self._post(f'/sales/api/order/{order.id}/cancel/')
+
+        self.assertEqual(response.status_code, 200)
+        self.refund.assert_awaited_once_with(self.gym, "pi_9", 10.0)
+        await order.arefresh_from_db()
+        self.assertEqual(order.status, 'CANCELLED')
+        self.assertIn("Reembolso Stripe exitoso (10.00€)", order.internal_notes)
+
+    async def test_subscription_charge(self):
+        from clients.models import ClientMembership
+
+        membership = await ClientMembership.objects.acreate(
+            client=self.customer, name="Mensual", start_date=timezone.localdate(), price=Decimal("45.00"),
+        )
+
+        response = await self._post(f'/sales/api/subscription/{membership.id}/charge/')
+
+        self.assertEqual(response.status_code, 200)
+        self.charge.assert_awaited_once()
+        payment = await OrderPayment.objects.select_related('order').aget(order__gym=self.gym)
+        self.assertEqual((payment.transaction_id, payment.order.status), ("pi_1", 'PAID'))
@@ -1,20 +1,30 @@
+from django.conf import settings
 from django.urls import path
 from . import views, api
 
+# Endpoints that wait on Stripe/Redsys: async variants when running under ASGI
+gateway_api = api
+if settings.ASYNC_GATEWAY_VIEWS:
+    from . import api_async as gateway_api
+
 urlpatterns = [
     path('pos/', views.pos_home, name='pos_home'),
     
     # API
     path('api/products/search/', api.search_products, name='api_pos_products_search'),
     path('api/clients/search/', api.search_clients, name='api_pos_clients_search'),
-    path('api/sale/process/', api.process_sale, name='api_pos_process_sale'),
-    path('api/client/<int:client_id>/cards/', api.get_client_cards, name='api_pos_client_cards'),
+    path('api/scan/', api.scan_code, name='api_pos_scan'),
+    path('api/catalog/', api.catalog_snapshot, name='api_pos_catalog'),
+    path('api/catalog/stock/', api.catalog_stock, name='api_pos_catalog_stock'),
+    path('api/sale/process/', gateway_api.process_sale, name='api_pos_process_sale'),
+    path('api/sale/sync/', api.offline_sync, name='api_pos_offline_sync'),
+    path('api/client/<int:client_id>/cards/', gateway_api.get_client_cards, name='api_pos_client_cards'),
     
     # Order Management API
     path('api/order/<int:order_id>/', api.order_detail_json, name='api_order_detail'),
-    path('api/order/<int:order_id>/cancel/', api.order_cancel, name='api_order_cancel'),
+    path('api/order/<int:order_id>/cancel/', gateway_api.order_cancel, name='api_order_cancel'),
     path('api/order/<int:order_id>/update/', api.order_update, name='api_order_update'),
     path('api/order/<int:order_id>/send-ticket/', api.order_send_ticket, name='api_order_send_ticket'),
     path('api/order/<int:order_id>/invoice/', api.order_generate_invoice, name='api_order_generate_invoice'),
-    path('api/subscription/<int:pk>/charge/', api.subscription_charge, name='api_subscription_charge'),
+    path('api/subscription/<int:pk>/charge/', gateway_api.subscription_charge, name='api_subscription_charge'),
 ]
@@ -2,13 +2,13 @@ from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from accounts.decorators import require_gym_permission
 
-from finance.models import PaymentMethod
+from finance.services import active_payment_methods
 
 @login_required
 @require_gym_permission('sales.view_sale') # Assuming a permission exists or we use a basic one
 def pos_home(request):
     gym = request.gym
-    payment_methods = PaymentMethod.objects.filter(gym=gym, is_active=True)
+    payment_methods = active_payment_methods(gym)
     from django.contrib.auth import get_user_model
     User = get_user_model()
     # Get staff (anyone with membership in this gym)
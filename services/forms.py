@@ -48,4 +48,4 @@ class ServiceForm(forms.ModelForm):
         if gym:
             self.fields['category'].queryset = ServiceCategory.objects.filter(gym=gym)
             self.fields['default_room'].queryset = Room.objects.filter(gym=gym)
-            self.fields['tax_rate'].queryset = TaxRate.objects.filter(gym=gym) 
+            self.fields['tax_rate'].queryset = TaxRate.objects.for_gym(gym) 
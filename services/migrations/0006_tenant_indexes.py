@@ -0,0 +1,22 @@
+# Generated by Django 5.1.15 on 2026-10-17 03:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0005_tenant_indexes'),
+        ('clients', '0007_tenant_indexes'),
+        ('organizations', '0004_gym_facebook_gym_instagram_gym_tiktok_gym_youtube'),
+        ('sales', '0003_tenant_indexes'),
+        ('services', '0005_service_color'),
+        ('staff', '0005_alter_workshift_method'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='serviceappointment',
+            index=models.Index(fields=['gym', 'start_datetime'], name='appointment_gym_start_idx'),
+        ),
+    ]
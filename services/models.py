@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from organizations.models import Gym
+from organizations.managers import TenantManager
 from finance.models import TaxRate
 from activities.models import Room
 
@@ -42,6 +43,8 @@ class Service(models.Model):
     is_active = models.BooleanField(_("Activo (Visible en POS)"), default=True, help_text=_("Si se desactiva, no aparecerá en el punto de venta."))
     is_visible_online = models.BooleanField(_("Venta Online (App/Web)"), default=False, help_text=_("Si se activa, los clientes podrán comprarlo desde la App/Web."))
 
+    objects = TenantManager()
+
     def __str__(self):
         return self.name
         
@@ -86,8 +89,13 @@ class ServiceAppointment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TenantManager()
+
     class Meta:
         ordering = ['start_datetime']
+        indexes = [
+            models.Index(fields=['gym', 'start_datetime'], name='appointment_gym_start_idx'),
+        ]
 
     def __str__(self):
         return f"{self.service.name} - {self.client} ({self.start_datetime.strftime('%d/%m %H:%M')})"
@@ -11,7 +11,7 @@ from .forms import ServiceForm, ServiceCategoryForm
 @require_gym_permission('services.view_service')
 def service_list(request):
     gym = request.gym
-    services = Service.objects.filter(gym=gym).select_related('category')
+    services = Service.objects.for_gym(gym).select_related('category')
     return render(request, 'backoffice/services/list.html', {'services': services})
 
 @login_required